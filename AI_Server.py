@@ -1,125 +1,172 @@
 import os
 import re
 import json
+import time
+import uuid
+import asyncio
+import logging
 import uvicorn
 from fastapi import FastAPI, Request
+from fastapi.responses import Response, StreamingResponse
 from vllm import LLM, SamplingParams
+from BatchScheduler import BatchScheduler, DeadlineExceeded
+from ResponseParser import extract_json, StreamingDecisionParser
+from PromptTemplate import build_prompt
+from Metrics import REGISTRY, CONTENT_TYPE, span, snapshot_samples
+from AsyncLogging import setup_logging
+
+setup_logging()
+logger = logging.getLogger(__name__)
 
 # --- 环境配置 ---
 os.environ["VLLM_USE_V1"] = "0"
 
 app = FastAPI()
 
-# --- 静态 Prompt 部分 (全局只定义一次，放在最前面以最大化缓存命中) ---
-# 🔑 优化：完全静态的规则放最前面，所有 NPC 共享这部分缓存
-STATIC_PROMPT_PREFIX = (
-    "<｜begin of sentence｜>"
-    "### 任务\n请分析现状并给出下一步动作，必须以 JSON 格式输出。\n"
-    "结果样例：{\"thought\": \"需要补水\", \"text\": \"我得找点水喝\", \"actions\": [{ \"type\": \"use\", \"item_name\": \"水壶\" }]}\n"
-    "# Output Format\n"
-    "**注意：你必须仅输出一个合法的 JSON 对象。** 严禁在 JSON 前后添加任何文字说明、解释、换行或 Markdown 代码块标记（如 ```json ）。\n"
-    "\n"
-    "## JSON Structure\n"
-    "{\n"
-    "  \"thought\": \"string (你的内心活动和决策逻辑)\",\n"
-    "  \"text\": \"string (你对玩家说的话)\",\n"
-    "  \"experience\": \"string (你的经验总结)\",\n"
-    "  \"actions\": [\n"
-    "    { \"type\": \"move\", \"pos\": [number, number] },\n"
-    "    { \"type\": \"use\", \"item_name\": \"string\" },\n"
-    "    { \"type\": \"attack\", \"sum\": number },\n"
-    "    { \"type\": \"interact\" }\n"
-    "  ]\n"
-    "}\n"
-    "\n"
-    "# Action Rules\n"
-    "- **main**: 请注意饱食度或含水量低于0的时候会减少生命值，饱食度和含水量高于50的时候会回复生命值，生命值0的时候不允许有任何操作和语言、思考。\n"
-    "- **experience**: 你的经验总结，请根据你之前的记录进行总结。\n"
-    "- **actions**: 必须是数组且不能为空,必须符合上面的json结构。\n"
-    "- **move**: `pos` 必须在地图范围内且属于可行区域（禁止进入目标清单中的不可移动区域），移动后的位置可以会有1-3个单位的误差。\n"
-    "- **use**: `item_name` 必须是你当前背包里已有的物品，use种子的时候需要到可种植土地区域上面才可种植。use不能给别他人使用。\n"
-    "- **attack**: `sum` 必须是整数，代表攻击次数。\n"
-    "- **interact**: 只有当你位于可交互物体附近时才能执行。\n"
-    "- **Constraints**: 禁止出现未定义的字段，严禁返回 null。\n"
-)
+# --- 微批调度配置 ---
+BATCH_WINDOW_MS = float(os.environ.get("BATCH_WINDOW_MS", 10))   # 收集并发请求的时间窗口
+MAX_BATCH_SIZE = int(os.environ.get("MAX_BATCH_SIZE", 16))       # 单批最大请求数，凑满立即发车
+# offline: LLM + 微批调度 (流式接口只能整段返回)；async: AsyncLLMEngine，支持逐 token 流式与提前停止
+ENGINE_MODE = os.environ.get("ENGINE_MODE", "offline")
 
 # --- 1. 模型初始化 ---
-print("正在加载 DeepSeek-R1-14B-AWQ 模型...")
-llm = LLM(
+ENGINE_ARGS = dict(
     model="/home/yuiyi/models/DeepSeek-R1-14B-AWQ",
     trust_remote_code=True,
-    # enable_prefix_caching=True,  # 👈 核心优化：开启前缀缓存
+    # 👈 核心优化：开启前缀缓存 (配合 gateway 的 stable 报告布局，相邻两帧共享更长的前缀)
+    enable_prefix_caching=os.environ.get("ENABLE_PREFIX_CACHING", "0") == "1",
     max_model_len=4096,
     gpu_memory_utilization=0.85,
     enforce_eager=True,
     kv_cache_dtype="fp8"
 )
 
-# --- 2. 增强型 JSON 提取函数 ---
-def extract_json(text: str):
-    """
-    专门适配 DeepSeek-R1 的提取逻辑：
-    1. 先剔除 <think> 标签内容，避免干扰。
-    2. 使用贪婪匹配 r"({[\s\S]*})" 抓取最外层 JSON，确保 actions 数组内的嵌套花括号不被截断。
-    """
-    # 移除思维链内容
-    clean_text = re.sub(r'<think>[\s\S]*?</think>', '', text).strip()
-    
-    # 贪婪匹配：找到第一个 { 和最后一个 } 之间的所有内容
-    match = re.search(r"(\{[\s\S]*\})", clean_text)
-    
-    if match:
-        json_str = match.group(1)
-        # 移除可能误加的 Markdown 标识
-        json_str = json_str.replace('```json', '').replace('```', '').strip()
+logger.info("正在加载 DeepSeek-R1-14B-AWQ 模型...")
+if ENGINE_MODE == "async":
+    from vllm import AsyncEngineArgs, AsyncLLMEngine
+    engine = AsyncLLMEngine.from_engine_args(AsyncEngineArgs(**ENGINE_ARGS))
+    scheduler = None
+else:
+    llm = LLM(**ENGINE_ARGS)
+    scheduler = BatchScheduler(llm, batch_window_ms=BATCH_WINDOW_MS, max_batch_size=MAX_BATCH_SIZE)
+
+# --- 指标 ---
+prompt_tokens_total = REGISTRY.counter("ai_prompt_tokens_total", "Prompt tokens processed")
+output_tokens_total = REGISTRY.counter("ai_output_tokens_total", "Output tokens generated")
+generation_seconds = REGISTRY.histogram("ai_generation_duration_seconds", "Model generation time per request", ("endpoint",))
+tokens_per_second = REGISTRY.histogram(
+    "ai_output_tokens_per_second", "Output tokens per second per request", ("endpoint",),
+    buckets=(1, 5, 10, 20, 30, 50, 75, 100, 150, 200, 300, 500)
+)
+requests_total = REGISTRY.counter("ai_requests_total", "Generation requests by endpoint and status", ("endpoint", "status"))
+
+def record_generation(endpoint: str, output, elapsed: float):
+    """记录一次生成的 prompt / 输出 token 数与吞吐 (output 为 vLLM 的 RequestOutput)"""
+    generation_seconds.observe(elapsed, endpoint=endpoint)
+    if output is None:
+        return
+    prompt_tokens_total.inc(len(output.prompt_token_ids or ()))
+    generated = len(output.outputs[0].token_ids)
+    output_tokens_total.inc(generated)
+    if elapsed > 0:
+        tokens_per_second.observe(generated / elapsed, endpoint=endpoint)
+
+# --- 2. 推理封装 ---
+def request_deadline(body: dict):
+    """gateway 以 deadline_ms (剩余毫秒数) 下发截止时间，收到请求时换算为本机 time.monotonic() 时刻"""
+    deadline_ms = body.get("deadline_ms")
+    if not isinstance(deadline_ms, (int, float)):
+        return None
+    return time.monotonic() + deadline_ms / 1000
+
+def build_sampling_params(body: dict) -> SamplingParams:
+    return SamplingParams(
+        temperature=body.get("temperature", 0.1),
+        max_tokens=body.get("max_tokens", 2048),
+        presence_penalty=0.3,
+        stop=["<｜end of sentence｜>", "###"]
+    )
+
+async def complete(prompt: str, sampling_params: SamplingParams, endpoint: str = "generate",
+                   deadline: float = None) -> str:
+    """整段生成；超过 deadline 的请求抛出 DeadlineExceeded (排队中的直接丢弃，生成中的中止)"""
+    start = time.perf_counter()
+    if deadline is not None and time.monotonic() >= deadline:
+        raise DeadlineExceeded("请求到达时已超过截止时间")
+    if scheduler is not None:
+        # 交给微批调度器与其他 NPC 的请求合并成一次批量 generate
+        final = await scheduler.submit(prompt, sampling_params, deadline=deadline)
+    else:
+        request_id = uuid.uuid4().hex
+
+        async def run():
+            final = None
+            async for output in engine.generate(prompt, sampling_params, request_id):
+                final = output
+            return final
+
         try:
-            return json.loads(json_str)
-        except json.JSONDecodeError:
-            # 尝试修复末尾多余逗号的常见错误
-            try:
-                json_str = re.sub(r',\s*([\]}])', r'\1', json_str) 
-                return json.loads(json_str)
-            except:
-                return None
-    return None
+            remaining = deadline - time.monotonic() if deadline is not None else None
+            final = await asyncio.wait_for(run(), remaining)
+        except asyncio.TimeoutError:
+            # 调用方已经放弃，释放引擎中排队或生成中的该请求
+            await engine.abort(request_id)
+            raise DeadlineExceeded("生成未能在截止时间内完成")
+    record_generation(endpoint, final, time.perf_counter() - start)
+    return final.outputs[0].text
+
+async def stream_completion(prompt: str, sampling_params: SamplingParams, deadline: float = None):
+    """流式生成，逐段产出新增文本；调用方提前退出或超过截止时间时中止该请求，释放 GPU"""
+    if scheduler is not None:
+        yield await complete(prompt, sampling_params, endpoint="generate_stream", deadline=deadline)
+        return
+    request_id = uuid.uuid4().hex
+    emitted = 0
+    last = None
+    start = time.perf_counter()
+    try:
+        async for output in engine.generate(prompt, sampling_params, request_id):
+            if deadline is not None and time.monotonic() >= deadline:
+                raise DeadlineExceeded("生成未能在截止时间内完成")
+            last = output
+            text = output.outputs[0].text
+            yield text[emitted:]
+            emitted = len(text)
+    finally:
+        # 提前停止时按已生成的 token 计数
+        record_generation("generate_stream", last, time.perf_counter() - start)
+        await engine.abort(request_id)
 
 # --- 3. 路由定义 ---
+@app.on_event("startup")
+async def start_scheduler():
+    if scheduler is not None:
+        scheduler.start()
+
+@app.on_event("shutdown")
+async def stop_scheduler():
+    if scheduler is not None:
+        await scheduler.stop()
+
 @app.post("/generate")
 async def generate(request: Request):
     try:
         body = await request.json()
         scene_report = body.get("scene_report", "")
-        system_prompt = body.get("system_prompt", "你是一个资深游戏玩家。")
 
         if not scene_report:
+            requests_total.inc(endpoint="generate", status="error")
             return {"status": "error", "message": "缺少环境报告"}
 
-        # 🔑 优化后的 prompt 组装顺序：
-        # 1. 先放完全静态的规则 (所有 NPC 共享这部分缓存)
-        # 2. 再放每个 NPC 的个性设定 (system_prompt)
-        # 3. 最后放当前环境报告
-        full_prompt = (
-            f"{STATIC_PROMPT_PREFIX}"
-            f"### 角色设定\n{system_prompt}\n"
-            f"### 环境报告\n{scene_report}\n"
-            f"你的决策："
-        )
-        # print('full_prompt',full_prompt)
-        sampling_params = SamplingParams(
-            temperature=body.get("temperature", 0.1),
-            max_tokens=body.get("max_tokens", 2048),
-            presence_penalty=0.3,
-            stop=["<｜end of sentence｜>", "###"]
-        )
-
-        # 运行推理
-        outputs = llm.generate([full_prompt], sampling_params)
-        raw_output = outputs[0].outputs[0].text
+        raw_output = await complete(build_prompt(body), build_sampling_params(body),
+                                    deadline=request_deadline(body))
 
         # 解析 JSON
-        action_json = extract_json(raw_output)
+        with span("extract_json"):
+            action_json = extract_json(raw_output)
         
         if action_json:
+            requests_total.inc(endpoint="generate", status="success")
             # 提取思维链（可选，用于调试）
             think_match = re.search(r'<think>([\s\S]*?)</think>', raw_output)
             thinking_process = think_match.group(1).strip() if think_match else "无显式思考过程"
@@ -130,14 +177,108 @@ async def generate(request: Request):
                 "thinking_raw": thinking_process
             }
         else:
+            requests_total.inc(endpoint="generate", status="warning")
             return {
                 "status": "warning",
                 "message": "未能解析出符合结构的 JSON",
                 "raw_output": raw_output
             }
 
+    except DeadlineExceeded as e:
+        # gateway 已经放弃该请求，不再返回 5xx 以免计入熔断
+        requests_total.inc(endpoint="generate", status="expired")
+        return {"status": "expired", "message": str(e)}
     except Exception as e:
+        requests_total.inc(endpoint="generate", status="error")
+        logger.error(f" [Error] 生成失败: {e}")
         return {"status": "error", "message": str(e)}
 
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.post("/generate_stream")
+async def generate_stream(request: Request):
+    """
+    流式决策 (SSE)：
+    - event: action    actions 数组中每个元素一闭合就立即推送
+    - event: decision  最外层决策对象闭合后推送完整结果，并停止生成
+    - event: error     未能解析出决策，或超过截止时间 (status 为 expired)
+    """
+    body = await request.json()
+    if not body.get("scene_report"):
+        return {"status": "error", "message": "缺少环境报告"}
+    deadline = request_deadline(body)
+
+    async def events():
+        parser = StreamingDecisionParser()
+        raw_parts = []
+        stream = stream_completion(build_prompt(body), build_sampling_params(body), deadline)
+        try:
+            async for delta in stream:
+                raw_parts.append(delta)
+                with span("stream_parse"):
+                    events_out = parser.feed(delta)
+                for kind, payload in events_out:
+                    if kind == "action":
+                        yield sse_event("action", {"index": len(parser.actions) - 1, "action": payload})
+                # 决策对象已闭合，后续 token 不再需要
+                if parser.done:
+                    break
+        except DeadlineExceeded as e:
+            requests_total.inc(endpoint="generate_stream", status="expired")
+            yield sse_event("error", {"status": "expired", "message": str(e)})
+            return
+        except Exception as e:
+            requests_total.inc(endpoint="generate_stream", status="error")
+            yield sse_event("error", {"status": "error", "message": str(e)})
+            return
+        finally:
+            await stream.aclose()
+
+        if parser.decision is not None:
+            requests_total.inc(endpoint="generate_stream", status="success")
+            yield sse_event("decision", {
+                "status": "success",
+                "response": parser.decision,
+                "thinking_raw": parser.thinking or "无显式思考过程"
+            })
+        else:
+            requests_total.inc(endpoint="generate_stream", status="warning")
+            yield sse_event("error", {
+                "status": "warning",
+                "message": "未能解析出符合结构的 JSON",
+                "raw_output": "".join(raw_parts)
+            })
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+@app.get("/health")
+async def health():
+    """供 gateway 的健康检查使用：模型加载完成、服务可接收请求即返回 200"""
+    status = {"status": "ok", "engine_mode": ENGINE_MODE}
+    if scheduler is not None:
+        status["queue_depth"] = scheduler.queue_depth
+    return status
+
+@app.get("/stats")
+async def get_stats():
+    """批大小与排队等待统计"""
+    return scheduler.stats.snapshot() if scheduler is not None else {"engine_mode": ENGINE_MODE}
+
+def collect_scheduler_metrics() -> list:
+    """抓取时导出微批调度器的批大小与排队统计"""
+    if scheduler is None:
+        return []
+    samples = snapshot_samples("ai_batch", scheduler.stats.snapshot())
+    samples.append(("ai_batch_queue_depth", {}, float(scheduler.queue_depth)))
+    return samples
+
+REGISTRY.add_collector(collect_scheduler_metrics)
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus 文本格式的指标：生成耗时、token 计数与吞吐、批处理统计"""
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
+
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    uvicorn.run(app, host="0.0.0.0", port=8000, log_config=None)
\ No newline at end of file
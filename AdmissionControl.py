@@ -0,0 +1,127 @@
+import time
+
+# 决策请求的准入控制：由最近的 AI 请求延迟与当前在途数估计一个新请求的完成时间，
+# 与该请求剩余的截止时间比较，决定完整请求、降级请求 (更小的 max_tokens) 还是直接放弃 (load shedding)。
+# 放弃的请求不再占用后端，由调用方复用最近一次决策或返回兜底结果。
+
+ADMISSION_DECISIONS = ("full", "degraded", "shed")
+
+
+class _Ewma:
+    """指数加权移动平均，首个样本直接作为初值"""
+    __slots__ = ("alpha", "value", "samples")
+
+    def __init__(self, alpha: float):
+        self.alpha = alpha
+        self.value = None
+        self.samples = 0
+
+    def update(self, sample: float):
+        self.value = sample if self.value is None else self.value + self.alpha * (sample - self.value)
+        self.samples += 1
+
+
+class AdmissionController:
+    """
+    自适应准入控制：
+    1. 每种请求 (full / degraded) 各自维护延迟的 EWMA，以及这些请求发出时的在途数 (含自身) 的 EWMA。
+    2. 新请求的预计完成时间 = 延迟 × max(1, (当前在途数 + 1) / 观测时的在途数)：
+       在途请求多于延迟被观测时的水平，说明后端队列在变长，按比例放大。
+    3. 剩余时间 (扣除 safety_margin) 足够完整请求时放行；只够降级请求时降级；都不够时放弃。
+       降级请求还没有样本时按完整请求延迟 × degraded_ratio 估计。
+    4. 样本少于 min_samples 时不做判断，全部放行。
+    5. 估计超出预算、且 probe_interval 内没有新的完整请求样本时，仍放行一个完整请求作为探测，
+       避免后端恢复后因为没有新样本而一直降级或放弃 (类似熔断器的 half_open)。
+    超时与后端判定过期的请求同样计入延迟 (耗时是真实延迟的下界)，后端变慢时估计随之上升。
+    """
+    def __init__(self, alpha: float = 0.2, min_samples: int = 5, safety_margin: float = 0.05,
+                 degraded_ratio: float = 0.5, probe_interval: float = 1.0):
+        self.min_samples = min_samples
+        self.safety_margin = safety_margin
+        self.degraded_ratio = degraded_ratio
+        self.probe_interval = probe_interval
+        self._last_full_sample = 0.0
+        self._latency = {"full": _Ewma(alpha), "degraded": _Ewma(alpha)}
+        self._concurrency = {"full": _Ewma(alpha), "degraded": _Ewma(alpha)}
+        self.in_flight = 0
+        # 指标
+        self.decisions = {decision: 0 for decision in ADMISSION_DECISIONS}
+        self.expired_on_arrival = 0
+        self.completed = 0
+        self.missed_deadline = 0
+        self.probes = 0
+
+    def estimate(self, mode: str = "full"):
+        """预计完成时间 (秒)；样本不足时返回 None"""
+        latency, concurrency = self._latency[mode], self._concurrency[mode]
+        if latency.samples < self.min_samples:
+            if mode == "degraded" and self._latency["full"].samples >= self.min_samples:
+                return self.estimate("full") * self.degraded_ratio
+            return None
+        return latency.value * max(1.0, (self.in_flight + 1) / max(concurrency.value, 1.0))
+
+    def decide(self, remaining: float) -> str:
+        """remaining: 距截止时间的剩余秒数 (None 表示没有截止时间)"""
+        if remaining is None:
+            decision = "full"
+        elif remaining <= 0:
+            self.expired_on_arrival += 1
+            decision = "shed"
+        else:
+            budget = remaining - self.safety_margin
+            full, degraded = self.estimate("full"), self.estimate("degraded")
+            if full is None or full <= budget or self._probe():
+                decision = "full"
+            elif degraded is None or degraded <= budget:
+                decision = "degraded"
+            else:
+                decision = "shed"
+        self.decisions[decision] += 1
+        return decision
+
+    def _probe(self) -> bool:
+        now = time.monotonic()
+        if now - self._last_full_sample < self.probe_interval:
+            return False
+        # 探测请求发出后到下一个样本前不再放行新的探测
+        self._last_full_sample = now
+        self.probes += 1
+        return True
+
+    def begin(self, mode: str = "full") -> tuple:
+        """请求发出前调用，返回交给 end() 的令牌"""
+        self.in_flight += 1
+        return mode, self.in_flight, time.perf_counter()
+
+    def end(self, token: tuple, met_deadline: bool = True):
+        mode, concurrency, started = token
+        self.in_flight -= 1
+        self._latency[mode].update(time.perf_counter() - started)
+        self._concurrency[mode].update(concurrency)
+        if mode == "full":
+            self._last_full_sample = time.monotonic()
+        self.completed += 1
+        if not met_deadline:
+            self.missed_deadline += 1
+
+    def abandon(self, token: tuple):
+        """请求被调用方取消：只减少在途数，耗时不计入延迟估计"""
+        self.in_flight -= 1
+
+    def snapshot(self) -> dict:
+        full, degraded = self.estimate("full"), self.estimate("degraded")
+        total = sum(self.decisions.values())
+        return {
+            "in_flight": self.in_flight,
+            "admitted": self.decisions["full"],
+            "degraded": self.decisions["degraded"],
+            "shed": self.decisions["shed"],
+            "expired_on_arrival": self.expired_on_arrival,
+            "shed_rate": round(self.decisions["shed"] / total, 4) if total else 0,
+            "completed": self.completed,
+            "missed_deadline": self.missed_deadline,
+            "probes": self.probes,
+            "latency_ewma_ms": round(self._latency["full"].value * 1000, 1) if self._latency["full"].value else 0,
+            "estimate_ms": round(full * 1000, 1) if full is not None else None,
+            "degraded_estimate_ms": round(degraded * 1000, 1) if degraded is not None else None,
+        }
@@ -0,0 +1,30 @@
+import atexit
+import logging
+import logging.handlers
+import queue
+
+_listener = None
+
+
+def setup_logging(level: int = logging.INFO, fmt: str = "%(asctime)s %(levelname)s%(message)s"):
+    """
+    非阻塞日志：事件循环中的 logger 调用只把记录放进内存队列 (QueueHandler)，
+    由后台线程 (QueueListener) 负责格式化并写入 stdout，慢终端或管道不会拖住请求处理。
+    重复调用是安全的；进程退出时自动把队列中剩余的日志写完。
+    """
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    log_queue = queue.SimpleQueue()
+    output = logging.StreamHandler()
+    output.setFormatter(logging.Formatter(fmt))
+
+    root = logging.getLogger()
+    root.handlers[:] = [logging.handlers.QueueHandler(log_queue)]
+    root.setLevel(level)
+
+    _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+    return _listener
@@ -0,0 +1,421 @@
+import asyncio
+import logging
+import random
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+
+class NoBackendAvailable(RuntimeError):
+    """所有后端都不健康或处于熔断状态"""
+
+
+class BackendError(RuntimeError):
+    """后端返回 5xx 等应计入熔断的失败"""
+
+
+class DeadlineExceeded(asyncio.TimeoutError):
+    """请求的截止时间已到 (调用方给出的时间预算耗尽，不计入后端熔断)"""
+
+
+# 超时时后端已耗时超过 timeout 的该比例 (延迟样本足够时为其 p95) 即视为后端过慢，计入熔断；
+# 截止时间通常与 timeout 相同，只差请求到达前的几毫秒，不能仅凭截止时间已到就免除后端的责任
+OVERDUE_RATIO = 0.9
+
+
+class CircuitBreaker:
+    """
+    单个后端的熔断器：
+    closed 正常放行；连续失败 failure_threshold 次后 open，reset_timeout 内拒绝请求；
+    之后进入 half_open，只放行一个探测请求，成功则恢复 closed，失败则重新 open。
+    """
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 10.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.opens = 0
+        self._probing = False
+
+    def available(self) -> bool:
+        """是否可以接收请求 (不改变状态，用于挑选后端)"""
+        if self.state == "closed":
+            return True
+        if self.state == "open":
+            return time.monotonic() - self.opened_at >= self.reset_timeout
+        return not self._probing
+
+    def acquire(self):
+        """请求即将发往该后端：open 超时后转为 half_open 并占用唯一的探测名额"""
+        if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = "half_open"
+        if self.state == "half_open":
+            self._probing = True
+
+    def release(self):
+        """请求被取消、未得出结论：归还探测名额"""
+        self._probing = False
+
+    def record_success(self):
+        self.state = "closed"
+        self.failures = 0
+        self._probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._probing = False
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            if self.state != "open":
+                self.opens += 1
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+
+class Backend:
+    def __init__(self, url: str, breaker: CircuitBreaker, latency_window: int = 200):
+        self.url = url.rstrip("/")
+        self.breaker = breaker
+        self.healthy = True
+        self.outstanding = 0
+        self.latencies = deque(maxlen=latency_window)
+        self.requests = 0
+        self.failures = 0
+        self.health_failures = 0
+
+    def available(self) -> bool:
+        return self.healthy and self.breaker.available()
+
+    def p95(self):
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+    def snapshot(self) -> dict:
+        p95 = self.p95()
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "breaker": self.breaker.state,
+            "breaker_opens": self.breaker.opens,
+            "outstanding": self.outstanding,
+            "requests": self.requests,
+            "failures": self.failures,
+            "health_failures": self.health_failures,
+            "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+        }
+
+
+class BackendPool:
+    """
+    多个 AI_Server 副本的共享客户端：
+    1. 全局一个带连接池的 keep-alive ClientSession，不再每条 Godot 连接各建一个。
+    2. 按最少在途请求 (least outstanding) 选择后端，并列时随机打散。
+    3. 后台定期 GET /health；失败的后端暂时摘除，恢复后自动加回。
+    4. 每个后端一个熔断器，连续失败后熔断；失败的请求换一个后端重试 retries 次。
+    5. hedge=True 时，首个请求超过该后端的 p95 延迟仍未返回，就向另一个后端发出对冲请求，取先成功的一个。
+    6. 给出 deadline (time.monotonic() 时刻) 时，每次尝试的超时不超过剩余时间，重试与对冲共享同一截止时间；
+       剩余时间以 deadline_ms 随请求体下发，AI_Server 据此丢弃排队中已过期的请求。
+    """
+    def __init__(self, urls: list, timeout: float = 10.0, stream_read_timeout: float = 10.0,
+                 max_connections: int = 100, health_path: str = "/health", health_interval: float = 5.0,
+                 health_timeout: float = 2.0, failure_threshold: int = 5, reset_timeout: float = 10.0,
+                 retries: int = 1, hedge: bool = False, hedge_min_samples: int = 20,
+                 hedge_min_delay: float = 0.05, latency_window: int = 200):
+        if not urls:
+            raise ValueError("至少需要一个 AI 后端地址")
+        self.backends = [Backend(url, CircuitBreaker(failure_threshold, reset_timeout), latency_window)
+                         for url in urls]
+        self.timeout = timeout
+        self.stream_read_timeout = stream_read_timeout
+        self.max_connections = max_connections
+        self.health_path = health_path
+        self.health_interval = health_interval
+        self.health_timeout = health_timeout
+        self.retries = retries
+        self.hedge = hedge
+        self.hedge_min_samples = hedge_min_samples
+        self.hedge_min_delay = hedge_min_delay
+
+        self._session = None
+        self._health_task = None
+
+        # 指标
+        self.requests = 0
+        self.retried = 0
+        self.unavailable = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.deadline_exceeded = 0
+
+    async def start(self):
+        if self._session is None:
+            connector = aiohttp.TCPConnector(limit=self.max_connections, keepalive_timeout=30)
+            self._session = aiohttp.ClientSession(connector=connector)
+        if self._health_task is None and self.health_interval:
+            self._health_task = asyncio.create_task(self._health_loop())
+
+    async def close(self):
+        if self._health_task is not None:
+            self._health_task.cancel()
+            try:
+                await self._health_task
+            except asyncio.CancelledError:
+                pass
+            self._health_task = None
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    # --- 健康检查 ---
+    async def check_health(self, backend: Backend) -> bool:
+        try:
+            async with self._session.get(backend.url + self.health_path, timeout=self.health_timeout) as resp:
+                healthy = resp.status == 200
+        except Exception:
+            healthy = False
+        if backend.healthy and not healthy:
+            logger.warning(f" [AI] 后端 {backend.url} 健康检查失败，暂时摘除")
+        elif not backend.healthy and healthy:
+            logger.info(f" [AI] 后端 {backend.url} 已恢复")
+        if not healthy:
+            backend.health_failures += 1
+        backend.healthy = healthy
+        return healthy
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.gather(*(self.check_health(backend) for backend in self.backends))
+            await asyncio.sleep(self.health_interval)
+
+    # --- 路由 ---
+    def _pick(self, exclude=()) -> Backend:
+        candidates = [b for b in self.backends if b not in exclude and b.available()]
+        if not candidates:
+            return None
+        least = min(b.outstanding for b in candidates)
+        return random.choice([b for b in candidates if b.outstanding == least])
+
+    def _hedge_delay(self, backend: Backend):
+        if not self.hedge or len(backend.latencies) < self.hedge_min_samples:
+            return None
+        return max(self.hedge_min_delay, backend.p95())
+
+    def _budget(self, payload: dict, deadline) -> tuple:
+        """本次尝试的 (超时, 请求体)；截止时间已到时抛出 DeadlineExceeded"""
+        if deadline is None:
+            return self.timeout, payload
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise DeadlineExceeded("请求已超过截止时间")
+        return min(self.timeout, remaining), dict(payload, deadline_ms=int(remaining * 1000))
+
+    @staticmethod
+    def _expired(deadline) -> bool:
+        return deadline is not None and time.monotonic() >= deadline
+
+    def _cut_by_deadline(self, backend: Backend, started: float, deadline) -> bool:
+        """
+        超时是否只是被调用方的截止时间截断：截止时间确实已到，且后端耗时还没有超过自身的 p95
+        (样本不足 hedge_min_samples 时为 timeout × OVERDUE_RATIO)。否则是后端过慢，计入熔断。
+        """
+        if not self._expired(deadline):
+            return False
+        limit = self.timeout * OVERDUE_RATIO
+        if len(backend.latencies) >= self.hedge_min_samples:
+            limit = min(limit, backend.p95())
+        return time.perf_counter() - started < limit
+
+    async def _attempt(self, backend: Backend, path: str, payload: dict, deadline=None):
+        timeout, payload = self._budget(payload, deadline)
+        backend.breaker.acquire()
+        backend.outstanding += 1
+        backend.requests += 1
+        start = time.perf_counter()
+        try:
+            async with self._session.post(backend.url + path, json=payload, timeout=timeout) as resp:
+                if resp.status >= 500:
+                    raise BackendError(f"{backend.url} 响应状态码 {resp.status}")
+                if resp.status != 200:
+                    # 4xx 是请求本身的问题，不计入后端熔断
+                    backend.breaker.record_success()
+                    logger.warning(f" [AI] 后端响应异常, 状态码: {resp.status}")
+                    return None
+                result = await resp.json()
+        except asyncio.CancelledError:
+            # 对冲失败的一方或调用方取消，不算后端故障；释放可能占用的探测名额
+            backend.breaker.release()
+            raise
+        except asyncio.TimeoutError:
+            if self._cut_by_deadline(backend, start, deadline):
+                backend.breaker.release()
+                raise DeadlineExceeded("请求已超过截止时间")
+            backend.failures += 1
+            backend.breaker.record_failure()
+            raise
+        except Exception:
+            backend.failures += 1
+            backend.breaker.record_failure()
+            raise
+        finally:
+            backend.outstanding -= 1
+        backend.latencies.append(time.perf_counter() - start)
+        backend.breaker.record_success()
+        return result
+
+    async def _hedged(self, primary: Backend, path: str, payload: dict, tried: set, deadline=None):
+        first = asyncio.ensure_future(self._attempt(primary, path, payload, deadline))
+        tasks = {first}
+        try:
+            delay = self._hedge_delay(primary)
+            if delay is not None:
+                done, _ = await asyncio.wait(tasks, timeout=delay)
+                secondary = None if done else self._pick(tried)
+                if secondary is not None:
+                    tried.add(secondary)
+                    self.hedges += 1
+                    tasks.add(asyncio.ensure_future(self._attempt(secondary, path, payload, deadline)))
+
+            error = None
+            pending = tasks
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not first:
+                            self.hedge_wins += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    async def post_json(self, path: str, payload: dict, deadline: float = None):
+        """
+        发送请求并返回 JSON 结果；失败 (含后端过慢导致的超时) 时换后端重试，全部失败则抛出最后一个异常
+        deadline: time.monotonic() 时刻，到期后不再重试；请求只是被截止时间截断时抛出 DeadlineExceeded
+        """
+        self.requests += 1
+        tried = set()
+        error = None
+        for attempt in range(self.retries + 1):
+            backend = self._pick(tried)
+            if backend is None:
+                break
+            tried.add(backend)
+            if attempt:
+                self.retried += 1
+            try:
+                return await self._hedged(backend, path, payload, tried, deadline)
+            except DeadlineExceeded:
+                self.deadline_exceeded += 1
+                raise
+            except (aiohttp.ClientError, asyncio.TimeoutError, BackendError) as e:
+                error = e
+                logger.warning(f" [AI] 后端 {backend.url} 请求失败: {e!r}")
+                if self._expired(deadline):
+                    break
+        if error is not None:
+            raise error
+        self.unavailable += 1
+        raise NoBackendAvailable("没有可用的 AI 后端")
+
+    @asynccontextmanager
+    async def stream(self, path: str, payload: dict, deadline: float = None):
+        """
+        流式请求 (SSE)：只在建立连接阶段换后端重试，响应开始后不再重试或对冲，避免动作被重复下发。
+        给出 deadline 时整个流 (含读取) 在截止时间处中断。
+        用法：async with pool.stream(path, payload) as resp: ...
+        """
+        self.requests += 1
+        tried = set()
+        resp = backend = None
+        error = None
+        for attempt in range(self.retries + 1):
+            backend = self._pick(tried)
+            if backend is None:
+                break
+            tried.add(backend)
+            if attempt:
+                self.retried += 1
+            try:
+                _, body = self._budget(payload, deadline)
+            except DeadlineExceeded:
+                self.deadline_exceeded += 1
+                raise
+            # 流的总时长只受截止时间限制 (self.timeout 仅约束建立连接)
+            total = deadline - time.monotonic() if deadline is not None else None
+            timeout = aiohttp.ClientTimeout(total=total, sock_connect=self.timeout,
+                                            sock_read=self.stream_read_timeout)
+            backend.breaker.acquire()
+            backend.outstanding += 1
+            backend.requests += 1
+            started = time.perf_counter()
+            try:
+                resp = await self._session.post(backend.url + path, json=body, timeout=timeout)
+                if resp.status >= 500:
+                    resp.release()
+                    raise BackendError(f"{backend.url} 响应状态码 {resp.status}")
+                break
+            except (aiohttp.ClientError, asyncio.TimeoutError, BackendError) as e:
+                resp, error = None, e
+                backend.outstanding -= 1
+                if isinstance(e, asyncio.TimeoutError) and self._cut_by_deadline(backend, started, deadline):
+                    backend.breaker.release()
+                    self.deadline_exceeded += 1
+                    raise DeadlineExceeded("请求已超过截止时间")
+                backend.failures += 1
+                backend.breaker.record_failure()
+                logger.warning(f" [AI] 后端 {backend.url} 请求失败: {e!r}")
+                if self._expired(deadline):
+                    break
+            except BaseException:
+                backend.outstanding -= 1
+                backend.breaker.release()
+                raise
+        if resp is None:
+            if error is not None:
+                raise error
+            self.unavailable += 1
+            raise NoBackendAvailable("没有可用的 AI 后端")
+
+        try:
+            yield resp
+        except asyncio.TimeoutError:
+            if self._cut_by_deadline(backend, started, deadline):
+                backend.breaker.release()
+                self.deadline_exceeded += 1
+                raise DeadlineExceeded("请求已超过截止时间")
+            backend.failures += 1
+            backend.breaker.record_failure()
+            raise
+        except aiohttp.ClientError:
+            backend.failures += 1
+            backend.breaker.record_failure()
+            raise
+        except BaseException:
+            backend.breaker.release()
+            raise
+        else:
+            backend.breaker.record_success()
+        finally:
+            resp.release()
+            backend.outstanding -= 1
+
+    def snapshot(self) -> dict:
+        return {
+            "requests": self.requests,
+            "retried": self.retried,
+            "unavailable": self.unavailable,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "deadline_exceeded": self.deadline_exceeded,
+            "backends": [backend.snapshot() for backend in self.backends],
+        }
@@ -0,0 +1,169 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+
+class DeadlineExceeded(asyncio.TimeoutError):
+    """请求在排队期间已超过调用方给出的截止时间，未交给引擎"""
+
+
+class BatchStats:
+    """批处理统计：批大小分布与排队等待时间"""
+    def __init__(self):
+        self.batches = 0
+        self.requests = 0
+        self.max_batch_size = 0
+        self.batch_size_hist = {}
+        self.total_queue_wait = 0.0
+        self.max_queue_wait = 0.0
+        self.total_engine_time = 0.0
+        self.expired = 0
+
+    def record(self, batch_size: int, queue_waits: list, engine_time: float):
+        self.batches += 1
+        self.requests += batch_size
+        self.max_batch_size = max(self.max_batch_size, batch_size)
+        self.batch_size_hist[batch_size] = self.batch_size_hist.get(batch_size, 0) + 1
+        self.total_queue_wait += sum(queue_waits)
+        self.max_queue_wait = max(self.max_queue_wait, max(queue_waits))
+        self.total_engine_time += engine_time
+
+    def snapshot(self) -> dict:
+        return {
+            "batches": self.batches,
+            "requests": self.requests,
+            "avg_batch_size": round(self.requests / self.batches, 2) if self.batches else 0,
+            "max_batch_size": self.max_batch_size,
+            "batch_size_hist": dict(sorted(self.batch_size_hist.items())),
+            "avg_queue_wait_ms": round(self.total_queue_wait / self.requests * 1000, 2) if self.requests else 0,
+            "max_queue_wait_ms": round(self.max_queue_wait * 1000, 2),
+            "avg_engine_time_ms": round(self.total_engine_time / self.batches * 1000, 2) if self.batches else 0,
+            "expired": self.expired,
+        }
+
+
+class BatchScheduler:
+    """
+    微批调度器：
+    1. 在 batch_window_ms 时间窗口内收集并发请求，或凑满 max_batch_size 立即发车。
+    2. 合并为一次 engine.generate(prompts, sampling_params_list) 调用，在线程中执行，不阻塞事件循环。
+    3. 按顺序把每条输出路由回各自的调用方。
+    4. 发车前丢弃已超过截止时间的请求 (以 DeadlineExceeded 结束)，不再为调用方已放弃的请求占用 GPU。
+    5. stop() 时仍在排队或正在收集/推理的请求以 RuntimeError("scheduler stopped") 结束，调用方不会永久等待。
+    """
+    def __init__(self, engine, batch_window_ms: float = 10.0, max_batch_size: int = 16):
+        self.engine = engine
+        self.batch_window = batch_window_ms / 1000
+        self.max_batch_size = max_batch_size
+        self.stats = BatchStats()
+        self._queue = None
+        self._worker = None
+        self._batch = []  # 已从队列取出、尚未返回结果的请求 (收集中或推理中)
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def start(self):
+        if self._worker is None:
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+            pending, self._batch = self._batch, []
+            while not self._queue.empty():
+                pending.append(self._queue.get_nowait())
+            for _, _, future, _, _ in pending:
+                if not future.done():
+                    future.set_exception(RuntimeError("scheduler stopped"))
+
+    async def submit(self, prompt: str, sampling_params, deadline: float = None):
+        """
+        提交单条请求，等待批处理完成后返回该条的 RequestOutput
+        deadline: time.monotonic() 时刻，发车时已过期的请求抛出 DeadlineExceeded
+        """
+        if self._worker is None:
+            self.start()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((prompt, sampling_params, future, time.perf_counter(), deadline))
+        return await future
+
+    async def _collect(self) -> list:
+        """阻塞等待第一条请求，然后在时间窗口内继续收集"""
+        self._batch = batch = [await self._queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.batch_window
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            # 调用方已取消或已过截止时间的请求不再占用推理资源
+            now = time.monotonic()
+            live = []
+            for item in batch:
+                future, deadline = item[2], item[4]
+                if future.done():
+                    continue
+                if deadline is not None and now >= deadline:
+                    self.stats.expired += 1
+                    future.set_exception(DeadlineExceeded("请求在排队期间已超过截止时间"))
+                    continue
+                live.append(item)
+            self._batch = batch = live
+            if batch:
+                await self._dispatch(batch)
+            self._batch = []
+
+    async def _dispatch(self, batch: list):
+        prompts = [item[0] for item in batch]
+        params = [item[1] for item in batch]
+        start = time.perf_counter()
+        queue_waits = [start - item[3] for item in batch]
+        try:
+            outputs = await asyncio.to_thread(self.engine.generate, prompts, params)
+        except Exception as e:
+            for _, _, future, _, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        self.stats.record(len(batch), queue_waits, time.perf_counter() - start)
+
+        for (_, _, future, _, _), output in zip(batch, outputs):
+            if not future.done():
+                future.set_result(output)
+
+
+class StubEngine:
+    """模拟 vLLM LLM.generate 的测试引擎，每批固定耗时 + 每条增量耗时"""
+    def __init__(self, batch_latency: float = 0.05, per_item_latency: float = 0.0, text: str = None):
+        self.batch_latency = batch_latency
+        self.per_item_latency = per_item_latency
+        self.text = text
+        self.calls = []
+
+    def generate(self, prompts, sampling_params=None):
+        self.calls.append(len(prompts))
+        time.sleep(self.batch_latency + self.per_item_latency * len(prompts))
+        return [
+            SimpleNamespace(
+                prompt=prompt,
+                outputs=[SimpleNamespace(text=self.text if self.text is not None else prompt)]
+            )
+            for prompt in prompts
+        ]
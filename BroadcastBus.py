@@ -0,0 +1,284 @@
+import abc
+import asyncio
+import json
+import logging
+import os
+import uuid
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+# 跨 worker 广播总线：gateway 以多进程运行时，任一 worker 产生的决策都要推送到连接在其他 worker 上的 Web 客户端。
+# 每个 worker 把决策发布到总线，同时订阅总线上其他 worker 的决策并交给本进程的 ConnectionManager。
+# 发布方已在本地直接投递，因此忽略总线回显的本 worker 消息。
+#
+#   local://                进程内 (单 worker，默认)
+#   unix:///tmp/gw.sock     本机 Unix socket 中继 (由 BusHub 提供，用于本地多 worker 与测试)
+#   redis://host:6379/0     Redis (或兼容协议的服务) 的 pub/sub，用于生产部署，需要安装 redis 包
+
+DEFAULT_CHANNEL = "gateway:decisions"
+
+
+class BroadcastBus(abc.ABC):
+    """总线接口：start 注册接收回调，publish 发布已序列化的消息"""
+    def __init__(self):
+        self.worker_id = uuid.uuid4().hex[:12]
+        self.published = 0
+        self.received = 0
+        self.dropped = 0
+        self._on_message = None
+
+    async def start(self, on_message):
+        """on_message(message: str, npc_id) 在收到其他 worker 的消息时调用"""
+        self._on_message = on_message
+
+    @abc.abstractmethod
+    async def publish(self, message: str, npc_id=None):
+        """发布消息；由各后端实现"""
+
+    async def close(self):
+        pass
+
+    def _encode(self, message: str, npc_id) -> bytes:
+        return json.dumps({"origin": self.worker_id, "npc_id": npc_id, "message": message},
+                          ensure_ascii=False).encode("utf-8")
+
+    def _deliver(self, data: bytes):
+        try:
+            envelope = json.loads(data)
+        except (ValueError, UnicodeDecodeError):
+            self.dropped += 1
+            return
+        if envelope.get("origin") == self.worker_id:
+            return
+        self.received += 1
+        if self._on_message is not None:
+            self._on_message(envelope["message"], envelope.get("npc_id"))
+
+    def snapshot(self) -> dict:
+        return {
+            "backend": type(self).__name__,
+            "worker_id": self.worker_id,
+            "published": self.published,
+            "received": self.received,
+            "dropped": self.dropped,
+        }
+
+
+class LocalBus(BroadcastBus):
+    """单进程：没有其他 worker，发布即完成"""
+    async def publish(self, message: str, npc_id=None):
+        self.published += 1
+
+
+class UnixSocketBus(BroadcastBus):
+    """
+    连接 BusHub 的 Unix socket，按行收发消息。
+    断线时后台重连，期间发布的消息计入 dropped；发送缓冲超过 max_buffer 字节 (中继消费过慢) 时同样丢弃，
+    不阻塞决策流程。
+    """
+    def __init__(self, path: str, max_buffer: int = 4 * 1024 * 1024, reconnect_delay: float = 0.5):
+        super().__init__()
+        self.path = path
+        self.max_buffer = max_buffer
+        self.reconnect_delay = reconnect_delay
+        self._writer = None
+        self._task = None
+        self._connected = asyncio.Event()
+        self.reconnects = 0
+
+    async def start(self, on_message):
+        await super().start(on_message)
+        self._task = asyncio.create_task(self._run())
+        try:
+            await asyncio.wait_for(self._connected.wait(), 5.0)
+        except asyncio.TimeoutError:
+            logger.warning(f" [Bus] 无法连接广播中继 {self.path}，后台重试中")
+
+    async def _run(self):
+        while True:
+            try:
+                reader, writer = await asyncio.open_unix_connection(self.path, limit=16 * 1024 * 1024)
+            except OSError:
+                await asyncio.sleep(self.reconnect_delay)
+                continue
+            self._writer = writer
+            self._connected.set()
+            try:
+                while True:
+                    line = await reader.readline()
+                    if not line:
+                        break
+                    self._deliver(line)
+            except (OSError, asyncio.IncompleteReadError, ValueError) as e:
+                logger.warning(f" [Bus] 广播中继连接中断: {e!r}")
+            finally:
+                self._connected.clear()
+                self._writer = None
+                writer.close()
+            self.reconnects += 1
+            await asyncio.sleep(self.reconnect_delay)
+
+    async def publish(self, message: str, npc_id=None):
+        writer = self._writer
+        if writer is None or writer.transport.get_write_buffer_size() > self.max_buffer:
+            self.dropped += 1
+            return
+        writer.write(self._encode(message, npc_id) + b"\n")
+        self.published += 1
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def snapshot(self) -> dict:
+        return {**super().snapshot(), "connected": self._connected.is_set(), "reconnects": self.reconnects}
+
+
+class RedisBus(BroadcastBus):
+    """Redis pub/sub：所有 worker 发布并订阅同一个频道 (依赖 redis>=4.2 的 redis.asyncio)"""
+    def __init__(self, url: str, channel: str = DEFAULT_CHANNEL):
+        super().__init__()
+        try:
+            import redis.asyncio as aioredis
+        except ImportError as e:
+            raise RuntimeError("RedisBus 需要安装 redis 包: pip install redis") from e
+        self.url = url
+        self.channel = channel
+        self._redis = aioredis.from_url(url)
+        self._pubsub = None
+        self._task = None
+
+    async def start(self, on_message):
+        await super().start(on_message)
+        self._pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+        await self._pubsub.subscribe(self.channel)
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            try:
+                async for item in self._pubsub.listen():
+                    if item.get("type") == "message":
+                        self._deliver(item["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f" [Bus] Redis 订阅中断: {e!r}")
+                await asyncio.sleep(0.5)
+
+    async def publish(self, message: str, npc_id=None):
+        try:
+            await self._redis.publish(self.channel, self._encode(message, npc_id))
+            self.published += 1
+        except Exception as e:
+            self.dropped += 1
+            logger.warning(f" [Bus] Redis 发布失败: {e!r}")
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        if self._pubsub is not None:
+            await _aclose(self._pubsub)
+        await _aclose(self._redis)
+
+
+async def _aclose(client):
+    # redis>=5 使用 aclose()，更早的版本为 close()
+    close = getattr(client, "aclose", None) or client.close
+    await close()
+
+
+class BusHub:
+    """
+    Unix socket 中继：把每个连接发来的一行消息转发给其他所有连接。
+    gateway 以多 worker 启动时由主进程运行；也可单独启动：python BroadcastBus.py /tmp/gw.sock
+    某个 worker 消费过慢 (发送缓冲超过 max_buffer) 时丢弃发给它的消息，不影响其他 worker。
+    """
+    def __init__(self, path: str, max_buffer: int = 16 * 1024 * 1024):
+        self.path = path
+        self.max_buffer = max_buffer
+        self._server = None
+        self._writers = set()
+        self._handlers = set()
+        self.relayed = 0
+        self.dropped = 0
+
+    async def start(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self._server = await asyncio.start_unix_server(self._handle, self.path, limit=16 * 1024 * 1024)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._writers.add(writer)
+        self._handlers.add(asyncio.current_task())
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                for other in list(self._writers):
+                    if other is writer:
+                        continue
+                    if other.transport.is_closing() or other.transport.get_write_buffer_size() > self.max_buffer:
+                        self.dropped += 1
+                        continue
+                    other.write(line)
+                    self.relayed += 1
+        except (OSError, ValueError):
+            pass
+        finally:
+            self._writers.discard(writer)
+            self._handlers.discard(asyncio.current_task())
+            writer.close()
+
+    async def serve_forever(self):
+        await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        # 3.11 的 wait_closed 不等待连接处理协程：关闭连接让 readline 读到 EOF，再等待它们退出
+        # (直接 cancel 会被 StreamReaderProtocol 当作未处理异常打印)
+        for writer in list(self._writers):
+            writer.close()
+        await asyncio.gather(*self._handlers, return_exceptions=True)
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+def create_bus(url: str = None, channel: str = DEFAULT_CHANNEL) -> BroadcastBus:
+    """按 URL 创建总线：local:// / unix:///path / redis://..."""
+    if not url or url.startswith("local:"):
+        return LocalBus()
+    parsed = urlparse(url)
+    if parsed.scheme == "unix":
+        return UnixSocketBus(parsed.path)
+    if parsed.scheme in ("redis", "rediss"):
+        return RedisBus(url, channel)
+    raise ValueError(f"不支持的广播总线: {url}")
+
+
+def run_hub(path: str):
+    """在当前进程中运行中继直到被终止 (供 multiprocessing 启动)"""
+    try:
+        asyncio.run(BusHub(path).serve_forever())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    import sys
+    run_hub(sys.argv[1] if len(sys.argv) > 1 else "/tmp/gateway_bus.sock")
@@ -0,0 +1,155 @@
+import hashlib
+import json
+import math
+import time
+from collections import OrderedDict
+
+# 参与量化的字段：数值型状态按 stat_bucket 分桶，坐标按 pos_bucket 分桶
+STAT_FIELDS = {"hp", "satiety", "hydration", "sanity"}
+# 数值型状态 <= 0 是终止状态 (死亡、饿死、渴死等)，单独作为一个取值，不与 1~stat_bucket-1 落在同一个桶里
+DEPLETED = "depleted"
+POS_FIELDS = {"current_pos", "center", "position"}
+TIME_FIELDS = {"time_left_sec"}
+# 与决策无关、每帧都会变化的字段，不参与指纹
+IGNORED_FIELDS = {"timestamp", "request_id", "_tmp_dist"}
+
+
+class DecisionCache:
+    """
+    场景指纹决策缓存：
+    1. 对 player_status 与实体状态做规范化 + 分桶量化，计算指纹；数值型状态 <= 0 的终止状态单独取值。
+    2. 相近场景命中同一指纹，直接复用最近一次的 ai_content，省去一次 LLM 调用。
+    3. LRU + TTL 淘汰，条目数与内存上限，支持按 NPC 失效，记录命中/未命中。
+    分桶越粗命中率越高，但决策越可能滞后于真实状态，通过 stat_bucket / pos_bucket / time_bucket 调节。
+    """
+    def __init__(self, stat_bucket: float = 10.0, pos_bucket: float = 16.0, time_bucket: float = 10.0,
+                 ttl: float = 30.0, max_entries: int = 1024, max_bytes: int = 8 * 1024 * 1024):
+        self.stat_bucket = stat_bucket
+        self.pos_bucket = pos_bucket
+        self.time_bucket = time_bucket
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+
+        self._entries = OrderedDict()  # (npc_id, fingerprint) -> (expires_at, size, ai_content)
+        self._npc_keys = {}            # npc_id -> set of keys，用于按 NPC 失效
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    # --- 指纹 ---
+    def _bucket(self, value, size):
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or size <= 0:
+            return value
+        return math.floor(value / size)
+
+    def _canonical(self, obj, key=None):
+        if isinstance(obj, dict):
+            # Godot 端的坐标可能是 {"x": .., "y": ..}
+            if key in POS_FIELDS:
+                return {k: self._bucket(v, self.pos_bucket) for k, v in sorted(obj.items())}
+            return {k: self._canonical(v, k) for k, v in obj.items() if k not in IGNORED_FIELDS}
+        if isinstance(obj, list):
+            if key in POS_FIELDS:
+                return [self._bucket(v, self.pos_bucket) for v in obj]
+            items = [self._canonical(v) for v in obj]
+            if key == "entities":
+                items.sort(key=lambda e: str(e.get("id", e.get("name", ""))) if isinstance(e, dict) else "")
+            return items
+        if key in STAT_FIELDS:
+            if isinstance(obj, (int, float)) and not isinstance(obj, bool) and obj <= 0:
+                return DEPLETED
+            return self._bucket(obj, self.stat_bucket)
+        if key in TIME_FIELDS:
+            return self._bucket(obj, self.time_bucket)
+        return obj
+
+    @staticmethod
+    def _dumps(obj) -> str:
+        return json.dumps(obj, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+
+    def entities_key(self, entities: list) -> str:
+        """实体部分的规范化 JSON；批量帧中所有 NPC 共享同一批实体，只需计算一次"""
+        return self._dumps(self._canonical(entities, "entities"))
+
+    def fingerprint(self, raw_data: dict, entities_key: str = None) -> str:
+        """对决策相关的世界状态计算规范化指纹；entities_key 为 entities_key() 预先算好的实体部分"""
+        if entities_key is None:
+            entities_key = self.entities_key(raw_data.get("entities", []))
+        canonical = "\n".join((
+            self._dumps(self._canonical(raw_data.get("player_status", {}))),
+            entities_key,
+            self._dumps(self._canonical(raw_data.get("orther_players_status", []))),
+        ))
+        return hashlib.sha1(canonical.encode("utf-8")).hexdigest()
+
+    # --- 读写 ---
+    def get(self, npc_id: str, fingerprint: str):
+        key = (npc_id, fingerprint)
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        if entry[0] < time.monotonic():
+            self._remove(key)
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[2]
+
+    def put(self, npc_id: str, fingerprint: str, ai_content):
+        key = (npc_id, fingerprint)
+        size = len(json.dumps(ai_content, ensure_ascii=False).encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (time.monotonic() + self.ttl, size, ai_content)
+        self._npc_keys.setdefault(npc_id, set()).add(key)
+        self.total_bytes += size
+        while len(self._entries) > self.max_entries or self.total_bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def latest(self, npc_id: str):
+        """该 NPC 最近写入且未过期的决策 (不论场景指纹，不计入命中统计)，没有时返回 None"""
+        now = time.monotonic()
+        newest = None
+        for key in self._npc_keys.get(npc_id, ()):
+            expires_at, _, ai_content = self._entries[key]
+            if expires_at >= now and (newest is None or expires_at > newest[0]):
+                newest = (expires_at, ai_content)
+        return newest[1] if newest is not None else None
+
+    def invalidate(self, npc_id: str) -> int:
+        """清除某个 NPC 的全部缓存决策，返回清除数量"""
+        keys = self._npc_keys.pop(npc_id, set())
+        for key in keys:
+            _, size, _ = self._entries.pop(key)
+            self.total_bytes -= size
+        return len(keys)
+
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self.total_bytes -= size
+        npc_keys = self._npc_keys.get(key[0])
+        if npc_keys is not None:
+            npc_keys.discard(key)
+            if not npc_keys:
+                del self._npc_keys[key[0]]
+
+    def snapshot(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.total_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
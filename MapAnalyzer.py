@@ -1,105 +1,499 @@
 import math
+from SpatialIndex import SpatialIndex
+from TokenBudget import estimate_tokens
 
-class MapAnalyzer:
-    @staticmethod
-    def get_scene_summary(data: dict) -> str:
-        """将原始 JSON 转换为 Markdown 结构的深度环境报告"""
-        player = data.get("player_status", {})
-        p_pos = player.get("current_pos", [0, 0])
-        
-        # 1. 角色基本状态 (Markdown 标题 + 列表)
-        report = "## 1. 角色详细状态报告\n"
-        report += f"- **基本信息**: {player.get('player_name', '未知')} (ID: {player.get('player_id', '0')})\n"
-        report += f"- **性格特质**: {player.get('personality', '普通')}\n"
-        report += f"- **当前坐标**: `{p_pos}`\n"
-        report += f"- **生存状态**: {'正在睡觉' if player.get('is_sleep', False) else '清醒'}\n"
-        report += "### 核心指标\n"
-        report += f"- **生命值 (HP)**: {player.get('hp', 0)}\n"
-        report += f"- **饱食度**: {player.get('satiety', 0)} | **含水量**: {player.get('hydration', 0)}\n"
-        report += f"- **理智值 (Sanity)**: {player.get('sanity', 0)}\n"
-        report += "### 战斗属性\n"
-        report += f"- **攻击力**: {player.get('attack_power', 0)} | **防御力**: {player.get('defense', 0)}\n"
-
-        report += "### 历史记录\n"
-        report += f"- **记录**: {player.get('chat_history', [])}\n"
-        report += f"- **经验**: {player.get('experiences', [])}\n"
-        # 2. 导航边界
-        nav_data = data.get("map_metadata", {}).get("nav_polygons", [])
-        if nav_data and len(nav_data[0]) > 0:
-            points = nav_data[0]
+_MISSING = object()
+NOTE_RESERVE_TOKENS = 40  # 为"已省略"摘要行预留的 token
+# legacy: 原有布局 (坐标、核心指标在最前)；stable: 按稳定程度排序 (角色设定 > 世界边界 > 静态目标 > 历史 > 动态状态)，
+# 使相邻两帧的 prompt 共享尽可能长的前缀，提高推理端前缀 KV 缓存的复用率
+LAYOUTS = ("legacy", "stable")
+
+def _typed_key(values: tuple) -> tuple:
+    """
+    渲染缓存键：值之外再带上各值的类型。100 == 100.0、True == 1 且哈希相同，
+    只按值做键会把 float 的渲染结果复用给 int (反之亦然)，输出不再与全量渲染逐字节一致
+    """
+    return values + tuple(map(type, values))
+
+class SceneRenderer:
+    """
+    增量式场景报告渲染器：
+    1. 世界边界等静态部分按地图版本缓存，不再每帧遍历 nav_polygons。
+    2. 每个实体的表格行按其渲染字段缓存，只有实体本身变化时才重新格式化；
+       距离列每帧单独拼接，因此 NPC 移动不会使整行失效。
+    3. 用列表收集片段后一次性 join，避免反复的字符串 +=。
+    4. 可选 max_entities / radius：借助空间索引只列出最近的 K 个或半径内的实体，控制 prompt 长度。
+       传入 nav (NavGrid) 时距离列改为绕开障碍的路径距离并按其排序 (实体仍按直线距离筛选)，不可达的排在最后。
+    5. layout="stable" 时按"越稳定越靠前"的顺序输出，实体拆成静态行 (名称/坐标/描述/移动限制) 与动态行 (距离/状态)。
+    6. 批量帧中多个 NPC 共享同一批实体：select_many 一次算出所有 NPC 的实体选择，
+       逐个渲染时通过 selection 传入，输出与单独渲染一致。
+    legacy 布局且不做截断时，输出与逐帧全量渲染逐字节一致。
+    """
+    def __init__(self, max_cached_rows: int = 20000, max_cached_maps: int = 16, index_cell_size: float = 64.0):
+        self.max_cached_rows = max_cached_rows
+        self.max_cached_maps = max_cached_maps
+        self.index_cell_size = index_cell_size
+        self._index_key = None
+        self._index = None
+        self._row_cache = {}     # 行签名 -> (距离前的片段, 距离后的片段)
+        self._bounds_cache = {}  # 地图版本 -> 世界边界行
+        self.row_hits = 0
+        self.row_misses = 0
+
+    # --- 静态部分 ---
+    def _map_key(self, map_metadata: dict, points: list):
+        version = map_metadata.get("version")
+        if version is not None:
+            return ("version", version)
+        return _typed_key(tuple(v for p in points for v in p)) + (len(points),)
+
+    def _world_bounds(self, map_metadata: dict) -> str:
+        nav_data = map_metadata.get("nav_polygons", [])
+        if not (nav_data and len(nav_data[0]) > 0):
+            return ""
+        points = nav_data[0]
+        key = self._map_key(map_metadata, points)
+        line = self._bounds_cache.get(key)
+        if line is None:
             xs, ys = [p[0] for p in points], [p[1] for p in points]
-            report += f"- **世界边界**: X: `[{min(xs)} ~ {max(xs)}]`, Y: `[{min(ys)} ~ {max(ys)}]`\n"
+            line = f"- **世界边界**: X: `[{min(xs)} ~ {max(xs)}]`, Y: `[{min(ys)} ~ {max(ys)}]`\n"
+            if len(self._bounds_cache) >= self.max_cached_maps:
+                self._bounds_cache.pop(next(iter(self._bounds_cache)))
+            self._bounds_cache[key] = line
+        return line
 
-        # 3. 背包处理
+    # --- 实体行 ---
+    def _row_signature(self, e: dict) -> tuple:
+        """实体行的缓存键：由所有参与该行渲染的字段及其类型组成 (见 _typed_key)"""
+        get = e.get
+        center, rect = e["center"], get("rect") or ()
+        return _typed_key((
+            e["name"], get("describe"), get("hp", _MISSING), get("is_crop"), get("stage_name"),
+            get("time_left_sec"), get("can_water"), get("can_harvest"), get("can_attack"),
+            get("can_interact"), get("has_physics_layer"), type(center), *center, type(rect), *rect,
+        ))
+
+    def _render_row(self, e: dict) -> tuple:
+        t_center = f"`{e['center']}`"
+
+        # 状态与描述合并
+        status_tags = []
+        if e.get("is_crop"):
+            status_tags.append(f"[{e.get('stage_name', '生长中')}]")
+            if e.get("time_left_sec", 0) > 0:
+                status_tags.append(f"剩{e['time_left_sec']}s")
+        if e.get("can_water"): status_tags.append("🚿需浇水")
+        if e.get("can_harvest"): status_tags.append("🌾可收割")
+
+        hp_info = f" (HP:{e['hp']})" if "hp" in e else ""
+        full_desc = f"{' '.join(status_tags)} {e['describe']}{hp_info}"
+
+        return (f"| {e['name']} | {t_center} | ",
+                f" | {full_desc} | {self._limit_desc(e)} | {self._status_info(e)} |\n")
+
+    @staticmethod
+    def _status_info(e: dict) -> str:
+        return f"{'可攻击' if e['can_attack'] else '不可攻击'}|{'可交互' if e['can_interact'] else '不可交互'}"
+
+    @staticmethod
+    def _limit_desc(e: dict) -> str:
+        """移动限制逻辑"""
+        t_rect = e.get("rect", [])
+        if len(t_rect) == 4 and e.get("has_physics_layer"):
+            x1, y1, w, h = t_rect
+            return f"禁止进入:({x1},{y1}) to ({x1+w},{y1+h})"
+        elif len(t_rect) == 4:
+            x1, y1, w, h = t_rect
+            return f"区域范围:({x1},{y1}) to ({x1+w},{y1+h})"
+        return "-"
+
+    def _entity_row(self, e: dict) -> tuple:
+        signature = self._row_signature(e)
+        pieces = self._row_cache.get(signature)
+        if pieces is None:
+            self.row_misses += 1
+            pieces = self._render_row(e)
+            if len(self._row_cache) >= self.max_cached_rows:
+                self._row_cache.pop(next(iter(self._row_cache)))
+            self._row_cache[signature] = pieces
+        else:
+            self.row_hits += 1
+        return pieces
+
+    def _spatial_index(self, entities: list) -> SpatialIndex:
+        """实体位置不变时复用上一次构建的空间索引"""
+        key = tuple((*e["center"], *(e.get("rect") or ())) for e in entities)
+        if key != self._index_key:
+            self._index = SpatialIndex(entities, cell_size=self.index_cell_size)
+            self._index_key = key
+        return self._index
+
+    # --- 报告分段 ---
+    def _vitals(self, player: dict, p_pos) -> str:
+        """1. 角色基本状态 (Markdown 标题 + 列表)"""
+        return (
+            "## 1. 角色详细状态报告\n"
+            f"- **基本信息**: {player.get('player_name', '未知')} (ID: {player.get('player_id', '0')})\n"
+            f"- **性格特质**: {player.get('personality', '普通')}\n"
+            f"- **当前坐标**: `{p_pos}`\n"
+            f"- **生存状态**: {'正在睡觉' if player.get('is_sleep', False) else '清醒'}\n"
+            "### 核心指标\n"
+            f"- **生命值 (HP)**: {player.get('hp', 0)}\n"
+            f"- **饱食度**: {player.get('satiety', 0)} | **含水量**: {player.get('hydration', 0)}\n"
+            f"- **理智值 (Sanity)**: {player.get('sanity', 0)}\n"
+            "### 战斗属性\n"
+            f"- **攻击力**: {player.get('attack_power', 0)} | **防御力**: {player.get('defense', 0)}\n"
+        )
+
+    def _inventory(self, player: dict) -> str:
         inventory = player.get("inventory", [])
         items = [i for i in inventory if i is not None]
         if items:
             item_desc = " | ".join([f"`{i['name']}`x{i['amount']}({i['describe']})" for i in items])
-            report += f"- **当前背包**: {item_desc}\n"
+            return f"- **当前背包**: {item_desc}\n"
+        return "- **当前背包**: (空)\n"
+
+    def _other_players(self, data: dict) -> str:
+        other_players = data.get("orther_players_status", [])
+        if not other_players:
+            return "> 当前感知范围内没有其他玩家。\n"
+        parts = ["| 角色名称 | 当前位置 | 状态备注 |\n", "| :--- | :--- | :--- |\n"]
+        for p in other_players:
+            p_name = p.get("npc_name", "未知实体")
+            p_pos_info = p.get("position", "未知位置")
+            # 将字典或数组格式的坐标转为可读字符串
+            if isinstance(p_pos_info, dict):
+                pos_str = f"({p_pos_info.get('x', 0)}, {p_pos_info.get('y', 0)})"
+            else:
+                pos_str = str(p_pos_info)
+            parts.append(f"| {p_name} | `{pos_str}` | 在场 |\n")
+        return "".join(parts)
+
+    def _surroundings(self, data: dict, player: dict) -> str:
+        """世界边界、背包、其他玩家，以及目标清单的表头"""
+        parts = []
+        out = parts.append
+        # 2. 导航边界 (按地图版本缓存)
+        out(self._world_bounds(data.get("map_metadata", {})))
+
+        # 3. 背包处理
+        out(self._inventory(player))
+
+        # 2. 其他玩家/NPC 状态
+        out("\n## 2. 周围实体/玩家状态\n")
+        out(self._other_players(data))
+
+        # 4. 环境实体分析
+        out("\n## 3. 周围目标清单\n")
+        out("| 目标名称 | 坐标(Center) | 距离 | 状态/描述 | 移动限制 | 状态 | \n")
+        out("| :--- | :--- | :--- | :--- | :--- | :--- |\n")
+        return "".join(parts)
+
+    def _select_entities(self, entities: list, p_pos, max_entities=None, radius=None, index=None,
+                         nav=None, selection=None) -> tuple:
+        """返回 (按距离升序的实体下标, 下标 -> 距离)；selection 为 select_many 预先算好的结果"""
+        if selection is not None:
+            order, dists = selection
+        elif max_entities is None and radius is None:
+            px, py = p_pos[0], p_pos[1]
+            dists = [round(math.sqrt((e["center"][0] - px)**2 + (e["center"][1] - py)**2), 1) for e in entities]
+            # 稳定排序，与按距离原地排序的顺序一致；不修改调用方的实体列表
+            order = sorted(range(len(entities)), key=dists.__getitem__)
         else:
-            report += "- **当前背包**: (空)\n"
+            # 只列出最相关的实体：k 近邻 / 半径查询
+            if index is None:
+                index = self._spatial_index(entities)
+            if max_entities is not None:
+                hits = index.nearest(p_pos, max_entities, radius=radius)
+            else:
+                hits = index.within_radius(p_pos, radius)
+            order = [i for i, _ in hits]
+            dists = {i: round(dist, 1) for i, dist in hits}
+        if nav is not None:
+            return self._path_order(entities, order, p_pos, nav)
+        return order, dists
 
-        # 2. 其他玩家/NPC 状态 (新加部分)
-        report += "\n## 2. 周围实体/玩家状态\n"
-        other_players = data.get("orther_players_status", []) # 获取你在 Godot 中塞进去的列表
+    def select_many(self, entities: list, positions: list, max_entities=None, radius=None) -> list:
+        """
+        多个 NPC 共享同一批实体时 (批量帧)，一次计算所有 NPC 的实体选择：
+        空间索引只构建一次，距离由 SpatialIndex.distance_matrix / query_many 批量计算。
+        返回与 positions 对应的 [(实体下标, 下标 -> 距离)]，可作为 render / render_budgeted 的 selection
+        """
+        if not positions:
+            return []
+        index = self._spatial_index(entities)
+        if max_entities is None and radius is None:
+            selections = []
+            for row in index.distance_matrix(positions):
+                dists = [round(d, 1) for d in row]
+                selections.append((sorted(range(len(dists)), key=dists.__getitem__), dists))
+            return selections
+        return [([i for i, _ in hits], {i: round(dist, 1) for i, dist in hits})
+                for hits in index.query_many(positions, max_entities, radius)]
 
-        if not other_players:
-            report += "> 当前感知范围内没有其他玩家。\n"
+    @staticmethod
+    def _path_order(entities: list, order: list, p_pos, nav) -> tuple:
+        """把已选实体的距离替换为路径距离并重新排序"""
+        paths = nav.path_distances(p_pos, [(entities[i]["center"], entities[i].get("rect")) for i in order])
+        dists = {i: ("不可达" if d is None else round(d, 1)) for i, d in zip(order, paths)}
+        ranked = sorted(zip(order, paths), key=lambda item: (item[1] is None, item[1] or 0.0))
+        return [i for i, _ in ranked], dists
+
+    def _entity_rows(self, entities: list, p_pos, max_entities=None, radius=None, index=None, nav=None,
+                     selection=None) -> list:
+        """按距离升序渲染实体行"""
+        order, dists = self._select_entities(entities, p_pos, max_entities, radius, index, nav, selection)
+        rows = []
+        for i in order:
+            head, tail = self._entity_row(entities[i])
+            rows.append(f"{head}{dists[i]}{tail}")
+        return rows
+
+    # --- 前缀稳定布局 ---
+    def _persona(self, player: dict) -> str:
+        """角色设定：身份、性格与战斗属性，整局几乎不变"""
+        return (
+            "## 1. 角色设定\n"
+            f"- **基本信息**: {player.get('player_name', '未知')} (ID: {player.get('player_id', '0')})\n"
+            f"- **性格特质**: {player.get('personality', '普通')}\n"
+            f"- **攻击力**: {player.get('attack_power', 0)} | **防御力**: {player.get('defense', 0)}\n"
+        )
+
+    def _world_section(self, data: dict) -> str:
+        """世界边界与静态目标表的表头，仅随地图变化"""
+        return (
+            "\n## 2. 世界与地图目标\n"
+            f"{self._world_bounds(data.get('map_metadata', {}))}"
+            "| 目标名称 | 坐标(Center) | 描述 | 移动限制 | 状态 |\n"
+            "| :--- | :--- | :--- | :--- | :--- |\n"
+        )
+
+    def _static_row(self, e: dict) -> str:
+        """静态目标行：只包含不随帧变化的字段，按签名缓存"""
+        get = e.get
+        center, rect = e["center"], get("rect") or ()
+        signature = _typed_key(("static", e["name"], get("describe"), get("can_attack"), get("can_interact"),
+                                get("has_physics_layer"), type(center), *center, type(rect), *rect))
+        row = self._row_cache.get(signature)
+        if row is None:
+            self.row_misses += 1
+            row = (f"| {e['name']} | `{e['center']}` | {e['describe']} | "
+                   f"{self._limit_desc(e)} | {self._status_info(e)} |\n")
+            if len(self._row_cache) >= self.max_cached_rows:
+                self._row_cache.pop(next(iter(self._row_cache)))
+            self._row_cache[signature] = row
         else:
-            # 使用 Markdown 表格可以让 AI 更清晰地对比位置
-            report += "| 角色名称 | 当前位置 | 状态备注 |\n"
-            report += "| :--- | :--- | :--- |\n"
-            
-            for p in other_players:
-                p_name = p.get("npc_name", "未知实体")
-                p_pos_info = p.get("position", "未知位置")
-                # 将字典或数组格式的坐标转为可读字符串
-                if isinstance(p_pos_info, dict):
-                    pos_str = f"({p_pos_info.get('x', 0)}, {p_pos_info.get('y', 0)})"
-                else:
-                    pos_str = str(p_pos_info)
-                    
-                report += f"| {p_name} | `{pos_str}` | 在场 |\n"
-
-        # 4. 环境实体分析 (使用表格结构，模型对表格的坐标对比能力极强)
-        report += "\n## 3. 周围目标清单\n"
-        report += "| 目标名称 | 坐标(Center) | 距离 | 状态/描述 | 移动限制 | 状态 | \n"
-        report += "| :--- | :--- | :--- | :--- | :--- | :--- |\n"
-        
+            self.row_hits += 1
+        return row
+
+    @staticmethod
+    def _dynamic_row(e: dict, dist) -> str:
+        """动态目标行：距离与作物阶段、血量等会变化的状态"""
+        status_tags = []
+        if e.get("is_crop"):
+            status_tags.append(f"[{e.get('stage_name', '生长中')}]")
+            if e.get("time_left_sec", 0) > 0:
+                status_tags.append(f"剩{e['time_left_sec']}s")
+        if e.get("can_water"): status_tags.append("🚿需浇水")
+        if e.get("can_harvest"): status_tags.append("🌾可收割")
+        if "hp" in e:
+            status_tags.append(f"HP:{e['hp']}")
+        return f"| {e['name']} | {dist} | {' '.join(status_tags) or '-'} |\n"
+
+    def _stable_entity_rows(self, entities: list, p_pos, max_entities=None, radius=None, index=None,
+                            nav=None, selection=None) -> list:
+        """按距离升序返回 (实体下标, 静态行, 动态行)"""
+        order, dists = self._select_entities(entities, p_pos, max_entities, radius, index, nav, selection)
+        return [(i, self._static_row(entities[i]), self._dynamic_row(entities[i], dists[i])) for i in order]
+
+    def _state(self, data: dict, player: dict, p_pos) -> str:
+        """每帧变化的部分：坐标、核心指标、背包、其他玩家，以及动态目标表的表头"""
+        parts = [
+            "\n## 4. 当前状态\n",
+            f"- **当前坐标**: `{p_pos}`\n",
+            f"- **生存状态**: {'正在睡觉' if player.get('is_sleep', False) else '清醒'}\n",
+            f"- **生命值 (HP)**: {player.get('hp', 0)}\n",
+            f"- **饱食度**: {player.get('satiety', 0)} | **含水量**: {player.get('hydration', 0)}\n",
+            f"- **理智值 (Sanity)**: {player.get('sanity', 0)}\n",
+        ]
+        parts.append(self._inventory(player))
+        parts.append("### 周围实体/玩家\n")
+        parts.append(self._other_players(data))
+        parts.append("### 目标动态 (按距离排序)\n")
+        parts.append("| 目标名称 | 距离 | 状态 |\n")
+        parts.append("| :--- | :--- | :--- |\n")
+        return "".join(parts)
+
+    def _stable_report(self, persona: str, world: str, entity_rows: list, history_lines: list,
+                       state: str, total: int) -> str:
+        # 静态行按实体在输入中的顺序排列，与 NPC 位置无关；动态行按距离排列
+        static_rows = [row for _, row, _ in sorted(entity_rows, key=lambda r: r[0])]
+        return "".join((
+            persona,
+            world,
+            *static_rows,
+            "\n## 3. 历史记录\n",
+            *history_lines,
+            state,
+            *(row for _, _, row in entity_rows),
+            self._omitted_note(total, len(entity_rows)),
+        ))
+
+    def _omitted_note(self, total: int, listed: int) -> str:
+        if listed < total:
+            return f"> 另有 {total - listed} 个较远目标未列出。\n"
+        return ""
+
+    # --- 完整报告 ---
+    @staticmethod
+    def _check_layout(layout: str):
+        if layout not in LAYOUTS:
+            raise ValueError(f"未知的报告布局: {layout}，可选 {LAYOUTS}")
+
+    def render(self, data: dict, max_entities: int = None, radius: float = None,
+               index: SpatialIndex = None, layout: str = "legacy", nav=None, memories: list = None,
+               selection: tuple = None) -> str:
+        """
+        将原始 JSON 转换为 Markdown 结构的深度环境报告
+        max_entities: 只列出最近的 K 个实体；radius: 只列出该半径内的实体；
+        index: 调用方已为同一批实体构建好的空间索引 (可选)；layout: 报告布局，见 LAYOUTS；
+        nav: 该地图的 NavGrid (可选)，距离列使用路径距离；
+        memories: 检索到的相关记忆 (可选，按相关度降序)，非空时代替 experiences 列表 (没有命中时保留 experiences)；
+        selection: select_many 为该 NPC 算好的实体选择 (可选)，给出时不再计算距离
+        """
+        self._check_layout(layout)
+        player = data.get("player_status", {})
+        p_pos = player.get("current_pos", [0, 0])
         entities = data.get("entities", [])
-        for e in entities:
-            dist = math.sqrt((e["center"][0] - p_pos[0])**2 + (e["center"][1] - p_pos[1])**2)
-            e["_tmp_dist"] = round(dist, 1)
-        
-        entities.sort(key=lambda x: x["_tmp_dist"])
-
-        for e in entities:
-            dist = e["_tmp_dist"]
-            t_center = f"`{e['center']}`"
-            
-            # 状态与描述合并
-            status_tags = []
-            if e.get("is_crop"):
-                status_tags.append(f"[{e.get('stage_name', '生长中')}]")
-                if e.get("time_left_sec", 0) > 0:
-                    status_tags.append(f"剩{e['time_left_sec']}s")
-            if e.get("can_water"): status_tags.append("🚿需浇水")
-            if e.get("can_harvest"): status_tags.append("🌾可收割")
-            
-            hp_info = f" (HP:{e['hp']})" if "hp" in e else ""
-            full_desc = f"{' '.join(status_tags)} {e['describe']}{hp_info}"
-            statusInfo = f"{'可攻击' if e['can_attack'] else '不可攻击'}|{'可交互' if e['can_interact'] else '不可交互'}"
-
-            # 移动限制逻辑
-            limit_desc = "-"
-            t_rect = e.get("rect", [])
-            if len(t_rect) == 4 and e.get("has_physics_layer"):
-                x1, y1, w, h = t_rect
-                limit_desc = f"禁止进入:({x1},{y1}) to ({x1+w},{y1+h})"
-            elif len(t_rect) == 4:
-                x1, y1, w, h = t_rect
-                limit_desc = f"区域范围:({x1},{y1}) to ({x1+w},{y1+h})"
-
-            report += f"| {e['name']} | {t_center} | {dist} | {full_desc} | {limit_desc} | {statusInfo} |\n"
-
-        return report
\ No newline at end of file
+        history_lines = (
+            f"- **记录**: {player.get('chat_history', [])}\n",
+            f"- **经验**: {player.get('experiences', [])}\n" if not memories else
+            f"- **相关记忆**: {list(memories)}\n",
+        )
+        if layout == "stable":
+            return self._stable_report(
+                self._persona(player), self._world_section(data),
+                self._stable_entity_rows(entities, p_pos, max_entities, radius, index, nav, selection),
+                history_lines, self._state(data, player, p_pos), len(entities),
+            )
+
+        rows = self._entity_rows(entities, p_pos, max_entities, radius, index, nav, selection)
+        return "".join((
+            self._vitals(player, p_pos),
+            "### 历史记录\n",
+            *history_lines,
+            self._surroundings(data, player),
+            *rows,
+            self._omitted_note(len(entities), len(rows)),
+        ))
+
+    def render_budgeted(self, data: dict, token_budget: int, tokenizer=None, recent_history: int = 5,
+                        max_entities: int = None, radius: float = None, index: SpatialIndex = None,
+                        layout: str = "legacy", nav=None, memories: list = None, selection: tuple = None) -> tuple:
+        """
+        在 token 预算内生成报告，返回 (报告, 最终 token 数)。
+        按优先级分配预算：核心状态 > 最近的实体 > 近期历史 > 较早历史，
+        低优先级内容被丢弃并以一行摘要代替。tokenizer 为 text -> token 数的函数，缺省使用离线估算。
+        memories 非空时代替 experiences，与记录一起参与历史预算分配，相关度低的先被丢弃。
+        """
+        self._check_layout(layout)
+        count = tokenizer or estimate_tokens
+        player = data.get("player_status", {})
+        p_pos = player.get("current_pos", [0, 0])
+        entities = data.get("entities", [])
+
+        # 优先级 0：核心状态与环境概要，始终保留
+        if layout == "stable":
+            fixed = (self._persona(player), self._world_section(data), self._state(data, player, p_pos))
+            fixed_cost = sum(count(part) for part in fixed) + count("\n## 3. 历史记录\n")
+            candidates = self._stable_entity_rows(entities, p_pos, max_entities, radius, index, nav, selection)
+            row_cost = lambda row: count(row[1]) + count(row[2])
+        else:
+            fixed = (self._vitals(player, p_pos), self._surroundings(data, player))
+            fixed_cost = sum(count(part) for part in fixed) + count("### 历史记录\n")
+            candidates = self._entity_rows(entities, p_pos, max_entities, radius, index, nav, selection)
+            row_cost = count
+        remaining = token_budget - fixed_cost - NOTE_RESERVE_TOKENS
+
+        # 优先级 1：由近到远加入实体，放不下即停止
+        rows = []
+        for row in candidates:
+            cost = row_cost(row)
+            if cost > remaining:
+                break
+            rows.append(row)
+            remaining -= cost
+
+        # 优先级 2/3：近期历史，其次较早历史；各列表按保留优先级排列 (记录与经验从新到旧，相关记忆按相关度降序)
+        histories = {"chat_history": list(player.get("chat_history") or [])[::-1]}
+        if not memories:
+            histories["experiences"] = list(player.get("experiences") or [])[::-1]
+        else:
+            histories["memories"] = list(memories)
+        kept = {key: [] for key in histories}
+        truncated = set()  # 已放不下的历史不再加入优先级更低的条目，保证保留的是连续的最新记录
+        for tier in ("recent", "older"):
+            for key, items in histories.items():
+                tier_items = items[:recent_history] if tier == "recent" else items[recent_history:]
+                for item in tier_items:
+                    if key in truncated:
+                        break
+                    cost = count(repr(item)) + 1
+                    if cost > remaining:
+                        truncated.add(key)
+                        break
+                    kept[key].append(item)
+                    remaining -= cost
+
+        history_lines = []
+        for key, label in (("chat_history", "记录"), ("experiences", "经验"), ("memories", "相关记忆")):
+            if key not in histories:
+                continue
+            chronological = key != "memories"
+            items = kept[key][::-1] if chronological else kept[key]
+            dropped = len(histories[key]) - len(items)
+            suffix = f" (另有 {dropped} 条{'更早的' if chronological else ''}{label}已省略)" if dropped else ""
+            history_lines.append(f"- **{label}**: {items}{suffix}\n")
+
+        if layout == "stable":
+            persona, world, state = fixed
+            report = self._stable_report(persona, world, rows, history_lines, state, len(entities))
+        else:
+            vitals, surroundings = fixed
+            report = "".join((
+                vitals,
+                "### 历史记录\n",
+                *history_lines,
+                surroundings,
+                *rows,
+                self._omitted_note(len(entities), len(rows)),
+            ))
+        return report, count(report)
+
+
+_default_renderer = SceneRenderer()
+
+
+class MapAnalyzer:
+    @staticmethod
+    def get_scene_summary(data: dict, max_entities: int = None, radius: float = None, layout: str = "legacy",
+                          nav=None, memories: list = None, selection: tuple = None) -> str:
+        """将原始 JSON 转换为 Markdown 结构的深度环境报告，可只保留最近的 max_entities 个 / radius 内的实体"""
+        return _default_renderer.render(data, max_entities=max_entities, radius=radius, layout=layout, nav=nav,
+                                        memories=memories, selection=selection)
+
+    @staticmethod
+    def get_budgeted_summary(data: dict, token_budget: int, tokenizer=None,
+                             max_entities: int = None, radius: float = None, layout: str = "legacy",
+                             nav=None, memories: list = None, selection: tuple = None) -> tuple:
+        """在 token 预算内生成环境报告，返回 (报告, token 数)"""
+        return _default_renderer.render_budgeted(
+            data, token_budget, tokenizer=tokenizer, max_entities=max_entities, radius=radius, layout=layout,
+            nav=nav, memories=memories, selection=selection
+        )
+
+    @staticmethod
+    def select_entities_batch(entities: list, positions: list, max_entities: int = None,
+                              radius: float = None) -> list:
+        """批量帧：一次计算所有 NPC 位置的实体选择，逐个传给 get_budgeted_summary 的 selection"""
+        return _default_renderer.select_many(entities, positions, max_entities=max_entities, radius=radius)
@@ -0,0 +1,256 @@
+import heapq
+import math
+import re
+from collections import Counter, OrderedDict
+from datetime import datetime
+
+# NPC 记忆索引：gateway 端为每个 NPC 保存过去决策中的想法、经验、说的话与执行的动作，
+# 用 BM25 (中文按字与相邻两字切分) 检索与当前场景最相关的 top-k 条，代替在报告中附上完整的历史列表。
+# 索引只在内存中，启动时从 npc_history 重建，之后随每次保存的决策增量更新；按条目数与总字节数淘汰最旧的记忆。
+
+_TOKEN_RE = re.compile(r"[一-鿿]+|[a-z]+")
+# 高频虚字单独出现时几乎不携带信息 (作为两字词的一部分仍会被索引)
+STOP_CHARS = frozenset("的了我你他她它们是在有和就不也这那着去要把被个得很吧呢吗啊")
+
+# 低于阈值的核心指标为查询追加的关键词
+VITAL_HINTS = (
+    ("satiety", 30, "饱食度 饥饿 吃 食物"),
+    ("hydration", 30, "含水量 口渴 喝水 纯净水"),
+    ("hp", 30, "生命值 受伤 危险"),
+)
+
+
+def tokenize(text: str) -> list:
+    """中文连续片段切为单字 (去除虚字) 与相邻两字，英文按单词，忽略数字与标点"""
+    tokens = []
+    for run in _TOKEN_RE.findall(text.lower()):
+        if run[0] >= "一":
+            tokens.extend(ch for ch in run if ch not in STOP_CHARS)
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            tokens.append(run)
+    return tokens
+
+
+def memory_text(ai_content: dict) -> str:
+    """一次决策对应的记忆文本：想法 | 说 | 经验 | 行动"""
+    parts = []
+    for key, label in (("thought", "想法"), ("text", "说"), ("experience", "经验")):
+        value = ai_content.get(key)
+        if isinstance(value, str) and value.strip():
+            parts.append(f"{label}: {value.strip()}")
+    actions = []
+    for action in ai_content.get("actions") or []:
+        if not isinstance(action, dict):
+            continue
+        detail = action.get("item_name") or action.get("sum")
+        actions.append(f"{action.get('type')} {detail}" if detail is not None else str(action.get("type")))
+    if actions:
+        parts.append(f"行动: {', '.join(actions)}")
+    return " | ".join(parts)
+
+
+def scene_query(data: dict, max_entities: int = 10, recent_chat: int = 3, nearest: list = None) -> str:
+    """
+    由当前场景构造检索查询：最近的若干实体、最近的对话、背包物品与告急的核心指标
+    nearest: 调用方已按距离排好序的实体 (批量帧共享的距离计算结果)，给出时不再遍历全部实体
+    """
+    player = data.get("player_status", {})
+    if nearest is not None:
+        nearest = nearest[:max_entities]
+    else:
+        x, y = (player.get("current_pos") or [0, 0])[:2]
+        nearest = heapq.nsmallest(
+            max_entities, data.get("entities") or [],
+            key=lambda e: (e.get("center", [0, 0])[0] - x) ** 2 + (e.get("center", [0, 0])[1] - y) ** 2,
+        )
+    parts = [f"{e.get('name', '')} {e.get('describe', '')}" for e in nearest]
+    parts += [str(item) for item in (player.get("chat_history") or [])[-recent_chat:]]
+    parts += [item["name"] for item in player.get("inventory") or [] if isinstance(item, dict) and item.get("name")]
+    for key, threshold, hint in VITAL_HINTS:
+        value = player.get(key)
+        if isinstance(value, (int, float)) and value < threshold:
+            parts.append(hint)
+    return " ".join(parts)
+
+
+class _Memory:
+    __slots__ = ("text", "terms", "length", "size", "timestamp")
+
+    def __init__(self, text: str, timestamp):
+        self.text = text
+        self.terms = Counter(tokenize(text))
+        self.length = sum(self.terms.values())
+        self.size = len(text.encode("utf-8"))
+        self.timestamp = timestamp
+
+
+class _NPCIndex:
+    """单个 NPC 的倒排索引：term -> {doc_id: 词频}"""
+    def __init__(self):
+        self.docs = OrderedDict()  # doc_id -> _Memory，按加入顺序
+        self.postings = {}
+        self.total_length = 0
+
+    def add(self, doc_id: int, memory: _Memory):
+        self.docs[doc_id] = memory
+        self.total_length += memory.length
+        for term, tf in memory.terms.items():
+            self.postings.setdefault(term, {})[doc_id] = tf
+
+    def remove(self, doc_id: int) -> _Memory:
+        memory = self.docs.pop(doc_id)
+        self.total_length -= memory.length
+        for term in memory.terms:
+            posting = self.postings[term]
+            del posting[doc_id]
+            if not posting:
+                del self.postings[term]
+        return memory
+
+    def search(self, terms: set, k: int, k1: float, b: float) -> list:
+        n = len(self.docs)
+        if not n or not terms:
+            return []
+        avgdl = self.total_length / n or 1.0
+        scores = {}
+        for term in terms:
+            posting = self.postings.get(term)
+            if not posting:
+                continue
+            idf = math.log(1 + (n - len(posting) + 0.5) / (len(posting) + 0.5))
+            for doc_id, tf in posting.items():
+                dl = self.docs[doc_id].length
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * dl / avgdl))
+        # 同分时较新的记忆 (doc_id 更大) 优先
+        return heapq.nlargest(k, scores.items(), key=lambda item: (item[1], item[0]))
+
+
+class MemoryIndex:
+    """
+    按 NPC 分区的 BM25 记忆索引：
+    1. add 把一次决策 (ai_content) 转为一条记忆并建立倒排；与该 NPC 上一条记忆相同的文本不重复加入。
+    2. search 返回与查询最相关的 top-k 条记忆文本 (相关度降序)，没有任何词命中时返回空列表。
+    3. 每个 NPC 最多 max_per_npc 条、全部记忆文本合计最多 max_bytes 字节，超出时淘汰最早加入的记忆。
+    4. rebuild 从 Mongo 载入历史决策期间，实时加入的决策先缓存，载入完成后再按到达顺序加入，
+       保证历史记忆排在实时记忆之前 (淘汰、去重与同分排序都依赖加入顺序)。
+    """
+    def __init__(self, max_per_npc: int = 500, max_bytes: int = 32 * 1024 * 1024, k1: float = 1.2, b: float = 0.75):
+        self.max_per_npc = max_per_npc
+        self.max_bytes = max_bytes
+        self.k1 = k1
+        self.b = b
+        self._npcs = {}
+        self._order = OrderedDict()  # doc_id -> npc_id，全局加入顺序，用于按字节数淘汰
+        self._last_text = {}
+        self._next_id = 0
+        self._pending = None  # rebuild 期间实时加入的 (npc_id, ai_content, timestamp)
+        self.total_bytes = 0
+        # 指标
+        self.added = 0
+        self.duplicates = 0
+        self.evictions = 0
+        self.searches = 0
+        self.empty_searches = 0
+
+    def __len__(self) -> int:
+        return len(self._order)
+
+    def add(self, npc_id: str, ai_content, timestamp: datetime = None) -> bool:
+        """
+        加入一次决策，返回是否新增了记忆 (非结构化决策、空内容与重复内容不加入)
+        rebuild 进行中时先缓存，返回 False，载入完成后再加入
+        """
+        if self._pending is not None:
+            self._pending.append((npc_id, ai_content, timestamp))
+            return False
+        return self._add(npc_id, ai_content, timestamp)
+
+    def _add(self, npc_id: str, ai_content, timestamp: datetime = None) -> bool:
+        if not isinstance(ai_content, dict):
+            return False
+        body = memory_text(ai_content)
+        if not body:
+            return False
+        # 缓存命中或反射层重复给出的相同决策只保留一条
+        if self._last_text.get(npc_id) == body:
+            self.duplicates += 1
+            return False
+        self._last_text[npc_id] = body
+
+        text = f"[{timestamp:%m-%d %H:%M}] {body}" if isinstance(timestamp, datetime) else body
+        memory = _Memory(text, timestamp)
+        index = self._npcs.setdefault(npc_id, _NPCIndex())
+        doc_id = self._next_id
+        self._next_id += 1
+        index.add(doc_id, memory)
+        self._order[doc_id] = npc_id
+        self.total_bytes += memory.size
+        self.added += 1
+
+        while len(index.docs) > self.max_per_npc:
+            self._evict(next(iter(index.docs)), npc_id)
+        while self.total_bytes > self.max_bytes and len(self._order) > 1:
+            oldest, owner = next(iter(self._order.items()))
+            self._evict(oldest, owner)
+        return True
+
+    def _evict(self, doc_id: int, npc_id: str):
+        self._remove(doc_id, npc_id)
+        self.evictions += 1
+
+    def _remove(self, doc_id: int, npc_id: str):
+        index = self._npcs[npc_id]
+        memory = index.remove(doc_id)
+        del self._order[doc_id]
+        self.total_bytes -= memory.size
+        if not index.docs:
+            del self._npcs[npc_id]
+            self._last_text.pop(npc_id, None)
+
+    def search(self, npc_id: str, query: str, k: int = 5) -> list:
+        self.searches += 1
+        index = self._npcs.get(npc_id)
+        hits = index.search(set(tokenize(query)), k, self.k1, self.b) if index is not None else []
+        if not hits:
+            self.empty_searches += 1
+        return [index.docs[doc_id].text for doc_id, _ in hits]
+
+    def forget(self, npc_id: str) -> int:
+        index = self._npcs.get(npc_id)
+        if index is None:
+            return 0
+        removed = len(index.docs)
+        for doc_id in list(index.docs):
+            self._remove(doc_id, npc_id)
+        return removed
+
+    async def rebuild(self, collection, limit: int = 20000) -> int:
+        """从 npc_history 重建：取最近 limit 条决策，按时间从旧到新加入，返回加入的条数"""
+        self._pending = []
+        loaded = 0
+        try:
+            cursor = collection.find({}, {"npc_id": 1, "timestamp": 1, "ai_content": 1, "_id": 0})
+            documents = [doc async for doc in cursor.sort("timestamp", -1).limit(limit)]
+            for doc in reversed(documents):
+                if self._add(doc.get("npc_id", "unknown_npc"), doc.get("ai_content"), doc.get("timestamp")):
+                    loaded += 1
+        finally:
+            # 载入失败也要补上期间到达的实时决策
+            pending, self._pending = self._pending, None
+            for args in pending:
+                self._add(*args)
+        return loaded
+
+    def snapshot(self) -> dict:
+        return {
+            "npcs": len(self._npcs),
+            "memories": len(self._order),
+            "total_bytes": self.total_bytes,
+            "added": self.added,
+            "duplicates": self.duplicates,
+            "evictions": self.evictions,
+            "searches": self.searches,
+            "empty_searches": self.empty_searches,
+            "rebuilding": self._pending is not None,
+        }
@@ -0,0 +1,263 @@
+import asyncio
+import copy
+import json
+import logging
+import time
+from Metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+OVERFLOW_POLICIES = ("block", "drop_oldest", "spill")
+
+
+class WriteBehindBuffer:
+    """
+    MongoDB 写后缓冲：
+    1. 决策文档先进入有界队列，由后台 worker 攒批后用 insert_many 写入，按数量或时间间隔刷盘。
+    2. 队列满时按 overflow_policy 处理：block 阻塞调用方 (背压) / drop_oldest 丢弃最旧文档 / spill 溢写到本地文件。
+    3. close() 时停止接收新文档并把队列中剩余文档全部写完。
+    before_flush: 每批写入前调用的协程 (如先落库被引用的报告块)；spill_transform: 溢写前对文档的转换。
+    """
+    def __init__(self, collection, max_queue: int = 10000, batch_size: int = 200, flush_interval: float = 0.5,
+                 overflow_policy: str = "drop_oldest", spill_path: str = "mongo_spill.jsonl",
+                 before_flush=None, spill_transform=None):
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"未知的溢出策略: {overflow_policy}，可选 {OVERFLOW_POLICIES}")
+        self.collection = collection
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overflow_policy = overflow_policy
+        self.spill_path = spill_path
+        self.before_flush = before_flush
+        self.spill_transform = spill_transform
+
+        self._queue = None
+        self._worker = None
+        self._closing = False
+        self._pending = []
+        self._inflight = None
+
+        # 指标
+        self.enqueued = 0
+        self.written = 0
+        self.dropped = 0
+        self.spilled = 0
+        self.failed = 0
+        self.flushes = 0
+        self.total_flush_time = 0.0
+        self.max_flush_time = 0.0
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def start(self):
+        if self._worker is None:
+            self._queue = asyncio.Queue(maxsize=self.max_queue)
+            self._closing = False
+            self._worker = asyncio.create_task(self._run())
+
+    async def put(self, document: dict) -> bool:
+        """提交一条文档，返回是否进入了写入队列"""
+        if self._worker is None:
+            self.start()
+        if self._closing:
+            await self._spill([document])
+            return False
+
+        if self.overflow_policy == "block":
+            await self._queue.put(document)
+        elif self._queue.full():
+            if self.overflow_policy == "drop_oldest":
+                self._queue.get_nowait()
+                self.dropped += 1
+                self._queue.put_nowait(document)
+            else:
+                await self._spill([document])
+                return False
+        else:
+            self._queue.put_nowait(document)
+        self.enqueued += 1
+        return True
+
+    async def _next_batch(self) -> list:
+        """等待第一条文档，然后在 flush_interval 内凑满 batch_size"""
+        # 取出的文档先放进 _pending，worker 被取消时 close() 仍能把它们写完
+        pending = self._pending
+        pending.append(await self._queue.get())
+        deadline = time.monotonic() + self.flush_interval
+        while len(pending) < self.batch_size:
+            # 队列里已有的文档直接取走，不必等待
+            while len(pending) < self.batch_size and not self._queue.empty():
+                pending.append(self._queue.get_nowait())
+            timeout = deadline - time.monotonic()
+            if len(pending) >= self.batch_size or timeout <= 0:
+                break
+            try:
+                pending.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        self._pending = []
+        return pending
+
+    async def _run(self):
+        while True:
+            batch = await self._next_batch()
+            # 刷盘过程不随 worker 一起取消，避免写到一半的批次丢失
+            self._inflight = asyncio.ensure_future(self._flush(batch))
+            await asyncio.shield(self._inflight)
+
+    async def _flush(self, batch: list):
+        start = time.perf_counter()
+        try:
+            if self.before_flush is not None:
+                await self.before_flush()
+            await self.collection.insert_many(batch, ordered=False)
+            self.written += len(batch)
+        except Exception as e:
+            # 写入失败的文档溢写到本地文件，避免丢失
+            self.failed += len(batch)
+            logger.warning(f" [DB] 批量写入 MongoDB 失败 ({len(batch)} 条): {e}")
+            await self._spill(batch)
+        elapsed = time.perf_counter() - start
+        REGISTRY.stage_seconds.observe(elapsed, stage="mongo_flush")
+        self.flushes += 1
+        self.total_flush_time += elapsed
+        self.max_flush_time = max(self.max_flush_time, elapsed)
+
+    async def _spill(self, documents: list):
+        if not self.spill_path:
+            self.dropped += len(documents)
+            return
+        if self.spill_transform is not None:
+            documents = [self.spill_transform(doc) for doc in documents]
+        lines = "".join(json.dumps(doc, ensure_ascii=False, default=str) + "\n" for doc in documents)
+
+        def append():
+            with open(self.spill_path, "a", encoding="utf-8") as f:
+                f.write(lines)
+
+        try:
+            await asyncio.to_thread(append)
+            self.spilled += len(documents)
+        except OSError as e:
+            self.dropped += len(documents)
+            logger.warning(f" [DB] 溢写本地文件失败: {e}")
+
+    async def close(self):
+        """停止接收新文档，写完队列中剩余的全部文档"""
+        if self._worker is None:
+            return
+        self._closing = True
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        self._worker = None
+        if self._inflight is not None and not self._inflight.done():
+            await self._inflight
+
+        remaining, self._pending = self._pending, []
+        while not self._queue.empty():
+            remaining.append(self._queue.get_nowait())
+        for i in range(0, len(remaining), self.batch_size):
+            await self._flush(remaining[i:i + self.batch_size])
+
+    def snapshot(self) -> dict:
+        return {
+            "queue_depth": self.queue_depth,
+            "max_queue": self.max_queue,
+            "overflow_policy": self.overflow_policy,
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "dropped": self.dropped,
+            "spilled": self.spilled,
+            "failed": self.failed,
+            "flushes": self.flushes,
+            "avg_flush_ms": round(self.total_flush_time / self.flushes * 1000, 2) if self.flushes else 0,
+            "max_flush_ms": round(self.max_flush_time * 1000, 2),
+        }
+
+
+class InMemoryCollection:
+    """进程内的 MongoDB 集合替身，用于测试与压测，可配置每次写入的延迟与失败"""
+    def __init__(self, insert_latency: float = 0.0, fail_times: int = 0):
+        self.documents = []
+        self._ids = set()
+        self.insert_latency = insert_latency
+        self.fail_times = fail_times
+        self.insert_calls = 0
+
+    async def insert_many(self, documents: list, ordered: bool = True):
+        self.insert_calls += 1
+        if self.insert_latency:
+            await asyncio.sleep(self.insert_latency)
+        if self.fail_times > 0:
+            self.fail_times -= 1
+            raise ConnectionError("模拟的 MongoDB 写入失败")
+        for document in documents:
+            # 与 MongoDB 一致：_id 重复的文档不写入
+            if "_id" in document and document["_id"] in self._ids:
+                continue
+            if "_id" in document:
+                self._ids.add(document["_id"])
+            self.documents.append(copy.deepcopy(document))
+
+    async def insert_one(self, document: dict):
+        await self.insert_many([document])
+
+    def _matches(self, document: dict, query: dict) -> bool:
+        for key, cond in query.items():
+            if isinstance(cond, dict) and "$in" in cond:
+                if document.get(key) not in cond["$in"]:
+                    return False
+            elif isinstance(cond, dict) and cond.get("$type") == "string":
+                if not isinstance(document.get(key), str):
+                    return False
+            elif document.get(key) != cond:
+                return False
+        return True
+
+    def find(self, query: dict = None, projection: dict = None):
+        """
+        仅支持 $in、{"$type": "string"} 与按字段相等过滤 (忽略 projection)，
+        返回支持 sort / limit / batch_size 与 async for 的游标
+        """
+        query = query or {}
+        return _InMemoryCursor([d for d in self.documents if self._matches(d, query)])
+
+    async def bulk_write(self, requests: list, ordered: bool = True):
+        """仅支持 UpdateOne 的 $set / $unset"""
+        for request in requests:
+            # pymongo 的 UpdateOne 不公开过滤条件与更新内容
+            query, update = request._filter, request._doc
+            for document in self.documents:
+                if self._matches(document, query):
+                    document.update(copy.deepcopy(update.get("$set", {})))
+                    for key in update.get("$unset", {}):
+                        document.pop(key, None)
+                    break
+
+
+class _InMemoryCursor:
+    """InMemoryCollection.find 的结果，与 motor 游标一样可链式调用 sort / limit / batch_size"""
+    def __init__(self, documents: list):
+        self._documents = documents
+        self._limit = None
+
+    def sort(self, key: str, direction: int = 1):
+        self._documents = sorted(self._documents, key=lambda d: d.get(key), reverse=direction < 0)
+        return self
+
+    def limit(self, count: int):
+        self._limit = count
+        return self
+
+    def batch_size(self, count: int):
+        return self
+
+    async def __aiter__(self):
+        for document in self._documents[:self._limit]:
+            yield copy.deepcopy(document)
@@ -0,0 +1,312 @@
+import heapq
+import math
+from collections import OrderedDict, deque
+
+SQRT2 = math.sqrt(2)
+# 8 邻接：(dc, dr, 代价)
+NEIGHBOURS = ((1, 0, 1.0), (-1, 0, 1.0), (0, 1, 1.0), (0, -1, 1.0),
+              (1, 1, SQRT2), (1, -1, SQRT2), (-1, 1, SQRT2), (-1, -1, SQRT2))
+
+
+class NavGrid:
+    """
+    占据栅格：
+    1. 按 nav_polygons 扫描线填充可行走单元 (单元中心在任一多边形内)，再把 has_physics_layer 实体的 rect
+       覆盖到的单元标记为不可行走 (与 rect 有任何重叠即视为阻挡，吸附后的坐标保证落在障碍外)。
+    2. 校验与吸附：坐标所在单元可行走即有效，否则吸附到最近可行走单元的中心 (多源 BFS，首次吸附时计算一次)。
+    3. 路径距离：8 邻接 Dijkstra (不允许斜穿障碍拐角)，到达全部目标或超过距离上限即停止，结果按起点单元缓存。
+    精度为一个单元 (cell_size)，单元越小越精确但构建与寻路越慢。
+    """
+    def __init__(self, nav_polygons: list, obstacles: list = (), cell_size: float = 16.0,
+                 max_cached_queries: int = 256):
+        self.cell_size = cell_size
+        points = [p for polygon in nav_polygons for p in polygon]
+        if not points:
+            raise ValueError("nav_polygons 为空，无法构建占据栅格")
+        xs, ys = [float(p[0]) for p in points], [float(p[1]) for p in points]
+        self.x0 = math.floor(min(xs) / cell_size) * cell_size
+        self.y0 = math.floor(min(ys) / cell_size) * cell_size
+        self.cols = max(1, math.ceil((max(xs) - self.x0) / cell_size))
+        self.rows = max(1, math.ceil((max(ys) - self.y0) / cell_size))
+        self.walkable = bytearray(self.cols * self.rows)
+        for polygon in nav_polygons:
+            self._fill_polygon(polygon)
+        for rect in obstacles:
+            self._block_rect(rect)
+        self.walkable_cells = sum(self.walkable)
+        self._nearest = None  # 单元下标 -> 最近可行走单元下标，首次吸附时计算
+        self._goal_cache = {}
+        self._query_cache = OrderedDict()
+        self.max_cached_queries = max_cached_queries
+        self.query_hits = 0
+        self.query_misses = 0
+
+    # --- 构建 ---
+    def _fill_polygon(self, polygon: list):
+        """扫描线：逐行求单元中心所在水平线与多边形边的交点，填充交点对之间的单元"""
+        n = len(polygon)
+        if n < 3:
+            return
+        edges = [(float(polygon[i][0]), float(polygon[i][1]),
+                  float(polygon[(i + 1) % n][0]), float(polygon[(i + 1) % n][1])) for i in range(n)]
+        cs = self.cell_size
+        for r in range(self.rows):
+            y = self.y0 + (r + 0.5) * cs
+            crossings = sorted(
+                x1 + (y - y1) * (x2 - x1) / (y2 - y1)
+                for x1, y1, x2, y2 in edges
+                if (y1 <= y < y2) or (y2 <= y < y1)
+            )
+            base = r * self.cols
+            for xa, xb in zip(crossings[::2], crossings[1::2]):
+                c1 = max(0, math.ceil((xa - self.x0) / cs - 0.5))
+                c2 = min(self.cols - 1, math.floor((xb - self.x0) / cs - 0.5))
+                for c in range(c1, c2 + 1):
+                    self.walkable[base + c] = 1
+
+    def _cell_range(self, x1: float, y1: float, x2: float, y2: float) -> tuple:
+        """与矩形 [x1, x2) × [y1, y2) 有重叠的单元范围"""
+        cs = self.cell_size
+        c1 = max(0, math.floor((x1 - self.x0) / cs))
+        r1 = max(0, math.floor((y1 - self.y0) / cs))
+        c2 = min(self.cols - 1, math.ceil((x2 - self.x0) / cs) - 1)
+        r2 = min(self.rows - 1, math.ceil((y2 - self.y0) / cs) - 1)
+        return c1, r1, c2, r2
+
+    def _block_rect(self, rect):
+        x1, y1, w, h = rect
+        c1, r1, c2, r2 = self._cell_range(x1, y1, x1 + w, y1 + h)
+        for r in range(r1, r2 + 1):
+            base = r * self.cols
+            for c in range(c1, c2 + 1):
+                self.walkable[base + c] = 0
+
+    # --- 坐标换算 ---
+    def cell_of(self, pos) -> int:
+        """坐标所在单元下标，超出栅格时夹到边缘单元"""
+        c = min(self.cols - 1, max(0, math.floor((float(pos[0]) - self.x0) / self.cell_size)))
+        r = min(self.rows - 1, max(0, math.floor((float(pos[1]) - self.y0) / self.cell_size)))
+        return r * self.cols + c
+
+    def in_bounds(self, pos) -> bool:
+        return (self.x0 <= float(pos[0]) < self.x0 + self.cols * self.cell_size
+                and self.y0 <= float(pos[1]) < self.y0 + self.rows * self.cell_size)
+
+    def center_of(self, cell: int) -> list:
+        r, c = divmod(cell, self.cols)
+        return [self.x0 + (c + 0.5) * self.cell_size, self.y0 + (r + 0.5) * self.cell_size]
+
+    # --- 校验与吸附 ---
+    def is_walkable(self, pos) -> bool:
+        return self.in_bounds(pos) and bool(self.walkable[self.cell_of(pos)])
+
+    def _nearest_table(self) -> list:
+        """多源 BFS：每个单元到最近可行走单元 (8 邻接步数意义下)"""
+        nearest = [-1] * len(self.walkable)
+        queue = deque()
+        for i, ok in enumerate(self.walkable):
+            if ok:
+                nearest[i] = i
+                queue.append(i)
+        cols, rows = self.cols, self.rows
+        while queue:
+            i = queue.popleft()
+            r, c = divmod(i, cols)
+            for dc, dr, _ in NEIGHBOURS:
+                nc, nr = c + dc, r + dr
+                if 0 <= nc < cols and 0 <= nr < rows:
+                    j = nr * cols + nc
+                    if nearest[j] < 0:
+                        nearest[j] = nearest[i]
+                        queue.append(j)
+        return nearest
+
+    def snap(self, pos):
+        """有效坐标原样返回；否则返回最近可行走单元的中心；地图上没有可行走单元时返回 None"""
+        if self.is_walkable(pos):
+            return [pos[0], pos[1]]
+        if not self.walkable_cells:
+            return None
+        if self._nearest is None:
+            self._nearest = self._nearest_table()
+        return self.center_of(self._nearest[self.cell_of(pos)])
+
+    # --- 路径距离 ---
+    def _goal_cells(self, center, rect) -> tuple:
+        """实体的可到达目标单元：中心可行走时为中心单元，否则为 rect 外扩一圈后的可行走单元"""
+        key = (*center, *(rect or ()))
+        goals = self._goal_cache.get(key)
+        if goals is None:
+            cell = self.cell_of(center)
+            if self.in_bounds(center) and self.walkable[cell]:
+                goals = (cell,)
+            else:
+                if rect:
+                    x1, y1, w, h = rect
+                else:
+                    x1, y1, w, h = center[0], center[1], 0.0, 0.0
+                cs = self.cell_size
+                c1, r1, c2, r2 = self._cell_range(x1 - cs, y1 - cs, x1 + w + cs, y1 + h + cs)
+                goals = tuple(r * self.cols + c for r in range(r1, r2 + 1) for c in range(c1, c2 + 1)
+                              if self.walkable[r * self.cols + c])
+            if len(self._goal_cache) >= 4096:
+                self._goal_cache.pop(next(iter(self._goal_cache)))
+            self._goal_cache[key] = goals
+        return goals
+
+    def _dijkstra(self, start: int, goals: set, max_steps: float) -> dict:
+        """从 start 出发的单元步数，全部目标已确定或超过 max_steps 时停止"""
+        cols, rows, walkable = self.cols, self.rows, self.walkable
+        dist = {start: 0.0}
+        remaining = set(goals)
+        heap = [(0.0, start)]
+        while heap and remaining:
+            d, i = heapq.heappop(heap)
+            if d > dist.get(i, math.inf):
+                continue
+            if d > max_steps:
+                break
+            remaining.discard(i)
+            r, c = divmod(i, cols)
+            for dc, dr, cost in NEIGHBOURS:
+                nc, nr = c + dc, r + dr
+                if not (0 <= nc < cols and 0 <= nr < rows):
+                    continue
+                j = nr * cols + nc
+                if not walkable[j]:
+                    continue
+                # 斜向移动要求两侧正交单元都可行走，避免穿过障碍拐角
+                if dc and dr and not (walkable[r * cols + nc] and walkable[nr * cols + c]):
+                    continue
+                nd = d + cost
+                if nd < dist.get(j, math.inf):
+                    dist[j] = nd
+                    heapq.heappush(heap, (nd, j))
+        return dist
+
+    def path_distances(self, start, targets: list, detour: float = 3.0) -> list:
+        """
+        起点到各目标 (center, rect) 的路径距离 (像素)，不可达时为 None。
+        搜索范围限制在 detour × 最远目标的直线距离内，绕行超过该倍数的目标视为不可达。
+        """
+        snapped = self.snap(start)
+        if snapped is None:
+            return [None] * len(targets)
+        start_cell = self.cell_of(snapped)
+        goal_sets = [self._goal_cells(center, rect) for center, rect in targets]
+        key = (start_cell, tuple(goal_sets))
+        cached = self._query_cache.get(key)
+        if cached is not None:
+            self._query_cache.move_to_end(key)
+            self.query_hits += 1
+            return cached
+        self.query_misses += 1
+
+        farthest = max((math.dist(start, center) for center, _ in targets), default=0.0)
+        max_steps = detour * farthest / self.cell_size + 2
+        all_goals = {cell for goals in goal_sets for cell in goals}
+        dist = self._dijkstra(start_cell, all_goals, max_steps)
+        result = []
+        for (center, _), goals in zip(targets, goal_sets):
+            steps = min((dist[g] for g in goals if g in dist), default=None)
+            if steps is None or steps > max_steps:
+                result.append(None)
+            else:
+                # 栅格路径不会比直线更短，取两者较大值抵消离散误差
+                result.append(max(steps * self.cell_size, math.dist(start, center)))
+        if len(self._query_cache) >= self.max_cached_queries:
+            self._query_cache.popitem(last=False)
+        self._query_cache[key] = result
+        return result
+
+    def snapshot(self) -> dict:
+        return {
+            "cols": self.cols,
+            "rows": self.rows,
+            "walkable_cells": self.walkable_cells,
+            "query_hits": self.query_hits,
+            "query_misses": self.query_misses,
+        }
+
+
+def obstacle_rects(entities: list) -> list:
+    """has_physics_layer 实体的 rect 即禁止进入区域"""
+    return [tuple(e["rect"]) for e in entities if e.get("has_physics_layer") and len(e.get("rect") or ()) == 4]
+
+
+class NavGridCache:
+    """
+    按地图缓存 NavGrid：键为 (地图版本或 nav_polygons, 障碍 rect)，障碍变化 (如建造、砍树) 时重建。
+    LRU 淘汰，最多保留 max_maps 张栅格。
+    """
+    def __init__(self, cell_size: float = 16.0, max_maps: int = 8):
+        self.cell_size = cell_size
+        self.max_maps = max_maps
+        self._grids = OrderedDict()
+        self.builds = 0
+        self.hits = 0
+        self.snapped = 0
+        self.valid = 0
+        self.unreachable = 0
+
+    def get(self, raw_data: dict):
+        """返回该帧地图的 NavGrid；没有 nav_polygons 时返回 None"""
+        map_metadata = raw_data.get("map_metadata", {})
+        polygons = map_metadata.get("nav_polygons") or []
+        if not any(len(p) >= 3 for p in polygons):
+            return None
+        obstacles = obstacle_rects(raw_data.get("entities", []))
+        version = map_metadata.get("version")
+        map_key = ("version", version) if version is not None else tuple(tuple(tuple(p) for p in poly) for poly in polygons)
+        key = (map_key, tuple(sorted(obstacles)))
+        grid = self._grids.get(key)
+        if grid is not None:
+            self._grids.move_to_end(key)
+            self.hits += 1
+            return grid
+        grid = NavGrid(polygons, obstacles, cell_size=self.cell_size)
+        self.builds += 1
+        if len(self._grids) >= self.max_maps:
+            self._grids.popitem(last=False)
+        self._grids[key] = grid
+        return grid
+
+    def fix_moves(self, decision, grid: NavGrid, count: bool = True) -> list:
+        """就地校验并吸附决策中全部 move 动作的 pos，返回各 move 的结果 (见 fix_action)"""
+        if grid is None or not isinstance(decision, dict) or not isinstance(decision.get("actions"), list):
+            return []
+        results = (self.fix_action(action, grid, count) for action in decision["actions"])
+        return [result for result in results if result is not None]
+
+    def fix_action(self, action, grid: NavGrid, count: bool = True):
+        """
+        校验并吸附单个 move 动作：valid 坐标有效；snapped 已吸附到最近的可行走位置；
+        unreachable 地图上没有可行走位置，保持原样；不是 move 或 pos 格式不对时返回 None
+        count=False 时只吸附不计数 (同一动作已在流式下发时计过)
+        """
+        if grid is None or not isinstance(action, dict) or action.get("type") != "move":
+            return None
+        pos = action.get("pos")
+        if not (isinstance(pos, (list, tuple)) and len(pos) == 2
+                and all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in pos)):
+            return None
+        snapped = grid.snap(pos)
+        if snapped is None:
+            self.unreachable += count
+            return "unreachable"
+        if snapped == [pos[0], pos[1]]:
+            self.valid += count
+            return "valid"
+        self.snapped += count
+        action["pos"] = [round(snapped[0], 1), round(snapped[1], 1)]
+        return "snapped"
+
+    def snapshot(self) -> dict:
+        return {
+            "maps": len(self._grids),
+            "builds": self.builds,
+            "hits": self.hits,
+            "moves_valid": self.valid,
+            "moves_snapped": self.snapped,
+            "moves_unreachable": self.unreachable,
+        }
@@ -0,0 +1,323 @@
+import copy
+import itertools
+import json
+import math
+import time
+from ReflexRules import OPERATORS, SPECIAL_CONDITIONS, inventory_amount, match_conditions
+
+# 计划缓存：LLM 给出的 actions 序列作为多步计划保存，之后每帧只下发当前一步，
+# 直到计划执行完毕或触发器判定计划失效才再次请求 LLM。
+
+# 相对运算：与计划开始时的值比较，条件写作 {"字段": {"drop": 10}}
+RELATIVE_OPERATORS = {
+    "drop": lambda base, now, x: base - now >= x,              # 比计划开始时下降了至少 x
+    "rise": lambda base, now, x: now - base >= x,              # 比计划开始时上升了至少 x
+    "cross_below": lambda base, now, x: base >= x > now,       # 从 x 以上降到 x 以下
+    "cross_above": lambda base, now, x: base < x <= now,       # 从 x 以下升到 x 以上
+    "changed": lambda base, now, x: (base != now) == bool(x),  # 与计划开始时不同
+}
+
+# 相对的特殊条件：
+# new_entity   {"max_dist": 距离, 其他字段...}  计划开始时不存在 (按 id) 的实体出现在 max_dist 内
+# new_player   {"max_dist": 距离}               计划开始时不在 max_dist 内的其他玩家进入范围
+RELATIVE_CONDITIONS = ("new_entity", "new_player")
+
+# 默认触发器：任意一条成立即放弃当前计划。也可使用 ReflexRules 的绝对条件，
+# 但计划开始时已成立的绝对条件会在下一帧立即触发，应优先使用相对条件。
+DEFAULT_TRIGGERS = [
+    {"name": "hp_drop", "when": {"hp": {"drop": 10}}},
+    {"name": "satiety_low", "when": {"satiety": {"cross_below": 30}}},
+    {"name": "hydration_low", "when": {"hydration": {"cross_below": 30}}},
+    {"name": "sleep_changed", "when": {"any": [{"is_sleep": {"changed": True}}, {"is_sleeping": {"changed": True}}]}},
+    {"name": "new_entity", "when": {"new_entity": {"max_dist": 96}}},
+    {"name": "player_approach", "when": {"new_player": {"max_dist": 128}}},
+]
+
+# 可重复下发的动作：未完成时再次下发同一步 (其他动作未完成时下发 WAIT_ACTION)
+IDEMPOTENT_ACTIONS = ("move",)
+# 等待动作：只由 gateway 下发给 Godot，表示上一步仍在执行、本帧不开始新动作。
+# 不属于 STATIC_PROMPT_PREFIX 中 LLM 可输出的动作类型，保证清醒的 NPC 不会收到空的 actions
+WAIT_ACTION = {"type": "wait"}
+
+
+def _player_positions(others: list) -> dict:
+    """orther_players_status -> {npc_name: (x, y)}"""
+    positions = {}
+    for other in others or []:
+        pos = other.get("position") if isinstance(other, dict) else None
+        if isinstance(pos, dict):
+            positions[other.get("npc_name")] = (pos.get("x", 0), pos.get("y", 0))
+        elif isinstance(pos, (list, tuple)) and len(pos) >= 2:
+            positions[other.get("npc_name")] = (pos[0], pos[1])
+    return positions
+
+
+class _View:
+    """触发器关心的一帧世界：玩家状态、实体、其他玩家位置"""
+    __slots__ = ("player", "entities", "others", "pos", "_entity_ids")
+
+    def __init__(self, raw_data: dict):
+        self.player = raw_data.get("player_status", {})
+        self.entities = raw_data.get("entities", [])
+        self.others = _player_positions(raw_data.get("orther_players_status"))
+        self.pos = self.player.get("current_pos") or [0, 0]
+        self._entity_ids = None
+
+    @property
+    def entity_ids(self) -> set:
+        if self._entity_ids is None:
+            self._entity_ids = {e.get("id") for e in self.entities}
+        return self._entity_ids
+
+    def distance(self, point) -> float:
+        return math.hypot(point[0] - self.pos[0], point[1] - self.pos[1])
+
+
+def _fires(when: dict, base: _View, now: _View) -> bool:
+    """when 中的条件是否全部成立；相对条件与 base 比较，其余条件交给 ReflexRules.match_conditions"""
+    for key, expected in when.items():
+        if key == "any":
+            if not any(_fires(sub, base, now) for sub in expected):
+                return False
+        elif key == "not":
+            if _fires(expected, base, now):
+                return False
+        elif key == "new_entity":
+            max_dist = expected.get("max_dist", math.inf)
+            fields = {k: v for k, v in expected.items() if k != "max_dist"}
+            if not any(
+                e.get("id") not in base.entity_ids and e.get("center")
+                and all(e.get(k) == v for k, v in fields.items()) and now.distance(e["center"]) <= max_dist
+                for e in now.entities
+            ):
+                return False
+        elif key == "new_player":
+            max_dist = expected.get("max_dist", math.inf)
+            was_near = {name for name, pos in base.others.items() if base.distance(pos) <= max_dist}
+            if not any(name not in was_near and now.distance(pos) <= max_dist for name, pos in now.others.items()):
+                return False
+        elif isinstance(expected, dict) and set(expected) & set(RELATIVE_OPERATORS):
+            before, value = base.player.get(key), now.player.get(key)
+            try:
+                if before is None or value is None or \
+                        not all(RELATIVE_OPERATORS[op](before, value, x) for op, x in expected.items()):
+                    return False
+            except TypeError:
+                return False
+        elif not match_conditions({key: expected}, now.player, now.entities):
+            return False
+    return True
+
+
+class Trigger:
+    """一条声明式失效触发器：when 中的条件全部成立时放弃当前计划"""
+    def __init__(self, name: str, when: dict):
+        self.name = name
+        self.when = when
+        self._check_conditions(when)
+
+    def _check_conditions(self, when):
+        if not isinstance(when, dict):
+            raise ValueError(f"触发器 {self.name} 的条件必须是对象")
+        for key, expected in when.items():
+            if key == "any":
+                for sub in expected:
+                    self._check_conditions(sub)
+            elif key == "not":
+                self._check_conditions(expected)
+            elif isinstance(expected, dict) and key not in SPECIAL_CONDITIONS + RELATIVE_CONDITIONS:
+                unknown = set(expected) - set(OPERATORS) - set(RELATIVE_OPERATORS)
+                if unknown:
+                    raise ValueError(f"触发器 {self.name} 使用了未知运算符 {sorted(unknown)}")
+                if set(expected) & set(RELATIVE_OPERATORS) and set(expected) & set(OPERATORS):
+                    raise ValueError(f"触发器 {self.name} 的字段 {key} 不能混用相对与绝对运算符")
+
+    @classmethod
+    def from_dict(cls, spec: dict) -> "Trigger":
+        return cls(spec["name"], spec.get("when", {}))
+
+    def fires(self, base: _View, now: _View) -> bool:
+        return _fires(self.when, base, now)
+
+
+def load_triggers(path: str) -> list:
+    """从 JSON 文件加载触发器列表 (格式同 DEFAULT_TRIGGERS)"""
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+class _Plan:
+    __slots__ = ("plan_id", "decision", "steps", "index", "started_at", "baseline",
+                 "step_started_at", "step_item_amount")
+
+    def __init__(self, plan_id: int, decision: dict, baseline: _View, now: float):
+        self.plan_id = plan_id
+        self.decision = decision
+        self.steps = decision["actions"]
+        self.index = 0
+        self.started_at = now
+        self.baseline = baseline
+        self.step_started_at = now
+        self.step_item_amount = None
+
+
+class PlanCache:
+    """
+    按 NPC 保存多步计划：
+    1. start 保存 LLM (或决策缓存) 给出的决策，返回只含第一步的决策；
+    2. 之后每帧 step 先检查失效条件 (显式失败、计划超时、触发器)，再判断当前一步是否完成：
+       move 到达 arrive_radius 内、use 的物品数量减少即完成，interact / attack 下发后的下一帧视为完成；
+       超过 step_timeout 仍未完成视为失败。完成则下发下一步，未完成时 move 重复下发、其他动作下发 WAIT_ACTION 等待。
+    3. 计划失效或执行完毕时 step 返回 None，由调用方请求新的决策。
+    Godot 可在帧中带上 "action_failed": true 显式报告当前一步失败。
+    """
+    def __init__(self, triggers: list = None, max_age: float = 60.0, step_timeout: float = 15.0,
+                 arrive_radius: float = 24.0):
+        self.triggers = [t if isinstance(t, Trigger) else Trigger.from_dict(t)
+                         for t in (DEFAULT_TRIGGERS if triggers is None else triggers)]
+        self.max_age = max_age
+        self.step_timeout = step_timeout
+        self.arrive_radius = arrive_radius
+        self._plans = {}
+        self._ids = itertools.count(1)
+        self._seen = {}  # npc_id -> (首次出现, 最近出现)，用于计算每 NPC 分钟的 LLM 调用数
+        # 指标
+        self.plans_started = 0
+        self.plans_completed = 0
+        self.steps_served = 0
+        self.waits = 0
+        self.plan_frames = 0  # 由计划应答、未调用 LLM 的帧数
+        self.llm_calls = 0
+        self.invalidations = {}
+
+    def __len__(self) -> int:
+        return len(self._plans)
+
+    def _touch(self, npc_id: str, now: float):
+        first, _ = self._seen.get(npc_id, (now, now))
+        self._seen[npc_id] = (first, now)
+
+    def record_llm_call(self, npc_id: str, now: float = None):
+        self.llm_calls += 1
+        self._touch(npc_id, time.monotonic() if now is None else now)
+
+    def invalidate(self, npc_id: str, reason: str) -> bool:
+        if self._plans.pop(npc_id, None) is None:
+            return False
+        self.invalidations[reason] = self.invalidations.get(reason, 0) + 1
+        return True
+
+    def start(self, npc_id: str, decision, raw_data: dict, now: float = None) -> tuple:
+        """
+        保存新计划，返回 (第一步的决策, 计划信息)；没有动作的决策不作为计划，原样返回 (decision, None)。
+        第一步就要使用背包里没有的物品时计划立即失败，同样原样返回，下一帧重新请求决策。
+        """
+        now = time.monotonic() if now is None else now
+        self._plans.pop(npc_id, None)
+        if not isinstance(decision, dict) or not decision.get("actions"):
+            return decision, None
+        plan = _Plan(next(self._ids), copy.deepcopy(decision), _View(raw_data), now)
+        self.plans_started += 1
+        if self._lacks_item(plan.steps[0], plan.baseline):
+            self.invalidations["step_failed"] = self.invalidations.get("step_failed", 0) + 1
+            return decision, None
+        self._plans[npc_id] = plan
+        return self._serve(plan, plan.baseline, now)
+
+    def step(self, npc_id: str, raw_data: dict, now: float = None):
+        """返回 (当前一步的决策, 计划信息)；没有可执行的计划时返回 None"""
+        now = time.monotonic() if now is None else now
+        self._touch(npc_id, now)
+        plan = self._plans.get(npc_id)
+        if plan is None:
+            return None
+        view = _View(raw_data)
+        reason = self._invalid_reason(plan, view, raw_data, now)
+        if reason is None:
+            status = self._step_status(plan, view, now)
+            if status == "pending":
+                self.plan_frames += 1
+                return self._serve(plan, view, now, resend=True)
+            if status == "failed":
+                reason = "step_failed"
+            else:
+                plan.index += 1
+                if plan.index >= len(plan.steps):
+                    del self._plans[npc_id]
+                    self.plans_completed += 1
+                    return None
+                if self._lacks_item(plan.steps[plan.index], view):
+                    reason = "step_failed"  # 下一步要用的物品已经没有了
+                else:
+                    self.plan_frames += 1
+                    return self._serve(plan, view, now)
+        self.invalidate(npc_id, reason)
+        return None
+
+    @staticmethod
+    def _lacks_item(action: dict, view: _View) -> bool:
+        """use 动作要用的物品背包里没有"""
+        return action.get("type") == "use" and inventory_amount(view.player, action.get("item_name")) <= 0
+
+    def _invalid_reason(self, plan: _Plan, view: _View, raw_data: dict, now: float):
+        if raw_data.get("action_failed"):
+            return "step_failed"
+        if now - plan.started_at > self.max_age:
+            return "timeout"
+        for trigger in self.triggers:
+            if trigger.fires(plan.baseline, view):
+                return trigger.name
+        return None
+
+    def _step_status(self, plan: _Plan, view: _View, now: float) -> str:
+        """当前一步：done / pending / failed"""
+        action = plan.steps[plan.index]
+        kind = action.get("type")
+        if kind == "move":
+            done = view.distance(action.get("pos") or view.pos) <= self.arrive_radius
+        elif kind == "use":
+            done = inventory_amount(view.player, action.get("item_name")) < plan.step_item_amount
+        else:
+            done = True
+        if done:
+            return "done"
+        return "failed" if now - plan.step_started_at > self.step_timeout else "pending"
+
+    def _serve(self, plan: _Plan, view: _View, now: float, resend: bool = False) -> tuple:
+        action = plan.steps[plan.index]
+        if not resend:
+            plan.step_started_at = now
+            if action.get("type") == "use":
+                plan.step_item_amount = inventory_amount(view.player, action.get("item_name"))
+        first = plan.index == 0 and not resend
+        wait = resend and action.get("type") not in IDEMPOTENT_ACTIONS
+        decision = {
+            "thought": plan.decision.get("thought", ""),
+            # 说的话与经验只随第一步下发一次
+            "text": plan.decision.get("text", "") if first else "",
+            "experience": plan.decision.get("experience", "") if first else "",
+            "actions": [dict(WAIT_ACTION) if wait else copy.deepcopy(action)],
+        }
+        if wait:
+            self.waits += 1
+        else:
+            self.steps_served += 1
+        return decision, {"plan_id": plan.plan_id, "step": plan.index, "steps": len(plan.steps)}
+
+    def snapshot(self) -> dict:
+        npc_minutes = sum(last - first for first, last in self._seen.values()) / 60
+        decisions = self.llm_calls + self.plan_frames
+        return {
+            "active_plans": len(self._plans),
+            "plans_started": self.plans_started,
+            "plans_completed": self.plans_completed,
+            "steps_served": self.steps_served,
+            "waits": self.waits,
+            "plan_frames": self.plan_frames,
+            "llm_calls": self.llm_calls,
+            "invalidations": dict(self.invalidations),
+            "npc_minutes": round(npc_minutes, 2),
+            # 没有计划缓存时，由计划下发的每一帧都需要一次 LLM 调用 (未计入决策缓存与反射层)
+            "llm_calls_per_npc_minute": round(self.llm_calls / npc_minutes, 2) if npc_minutes else 0,
+            "llm_calls_per_npc_minute_without_plans": round(decisions / npc_minutes, 2) if npc_minutes else 0,
+        }
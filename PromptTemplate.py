@@ -0,0 +1,63 @@
+# Prompt 模板：不依赖 vLLM，推理服务 (AI_Server.py) 与离线分析工具 (prefix_reuse.py) 共用同一份拼接逻辑
+
+# --- 静态 Prompt 部分 (全局只定义一次，放在最前面以最大化缓存命中) ---
+# 🔑 优化：完全静态的规则放最前面，所有 NPC 共享这部分缓存
+STATIC_PROMPT_PREFIX = (
+    "<｜begin of sentence｜>"
+    "### 任务\n请分析现状并给出下一步动作，必须以 JSON 格式输出。\n"
+    "结果样例：{\"thought\": \"需要补水\", \"text\": \"我得找点水喝\", \"actions\": [{ \"type\": \"use\", \"item_name\": \"水壶\" }]}\n"
+    "# Output Format\n"
+    "**注意：你必须仅输出一个合法的 JSON 对象。** 严禁在 JSON 前后添加任何文字说明、解释、换行或 Markdown 代码块标记（如 ```json ）。\n"
+    "\n"
+    "## JSON Structure\n"
+    "{\n"
+    "  \"thought\": \"string (你的内心活动和决策逻辑)\",\n"
+    "  \"text\": \"string (你对玩家说的话)\",\n"
+    "  \"experience\": \"string (你的经验总结)\",\n"
+    "  \"actions\": [\n"
+    "    { \"type\": \"move\", \"pos\": [number, number] },\n"
+    "    { \"type\": \"use\", \"item_name\": \"string\" },\n"
+    "    { \"type\": \"attack\", \"sum\": number },\n"
+    "    { \"type\": \"interact\" }\n"
+    "  ]\n"
+    "}\n"
+    "\n"
+    "# Action Rules\n"
+    "- **main**: 请注意饱食度或含水量低于0的时候会减少生命值，饱食度和含水量高于50的时候会回复生命值，生命值0的时候不允许有任何操作和语言、思考。\n"
+    "- **experience**: 你的经验总结，请根据你之前的记录进行总结。\n"
+    "- **actions**: 必须是数组且不能为空,必须符合上面的json结构。\n"
+    "- **move**: `pos` 必须在地图范围内且属于可行区域（禁止进入目标清单中的不可移动区域），移动后的位置可以会有1-3个单位的误差。\n"
+    "- **use**: `item_name` 必须是你当前背包里已有的物品，use种子的时候需要到可种植土地区域上面才可种植。use不能给别他人使用。\n"
+    "- **attack**: `sum` 必须是整数，代表攻击次数。\n"
+    "- **interact**: 只有当你位于可交互物体附近时才能执行。\n"
+    "- **Constraints**: 禁止出现未定义的字段，严禁返回 null。\n"
+)
+
+# gateway 下发给每个 NPC 的角色设定
+NPC_SYSTEM_PROMPT = (
+    "你是一个2D游戏的NPC，你需要思考自己要如何存活下去。\n"
+    "请认真查看下方的【周围目标清单】，结合你的身份给出合理的决策。"
+)
+
+# 按环境报告布局 (MapAnalyzer.LAYOUTS) 选择角色设定，引用的章节名与报告一致：
+# stable 布局把目标清单拆成静态的"世界与地图目标"与每帧变化的"目标动态"
+NPC_SYSTEM_PROMPTS = {
+    "legacy": NPC_SYSTEM_PROMPT,
+    "stable": (
+        "你是一个2D游戏的NPC，你需要思考自己要如何存活下去。\n"
+        "请认真查看下方的【世界与地图目标】与【目标动态】，结合你的身份给出合理的决策。"
+    ),
+}
+
+def build_prompt(body: dict) -> str:
+    # 🔑 优化后的 prompt 组装顺序：
+    # 1. 先放完全静态的规则 (所有 NPC 共享这部分缓存)
+    # 2. 再放每个 NPC 的个性设定 (system_prompt)
+    # 3. 最后放当前环境报告
+    system_prompt = body.get("system_prompt", "你是一个资深游戏玩家。")
+    return (
+        f"{STATIC_PROMPT_PREFIX}"
+        f"### 角色设定\n{system_prompt}\n"
+        f"### 环境报告\n{body.get('scene_report', '')}\n"
+        f"你的决策："
+    )
@@ -0,0 +1,259 @@
+import copy
+import json
+import math
+
+# 决策结构与 PromptTemplate.STATIC_PROMPT_PREFIX 中的 JSON Structure 保持一致
+DECISION_FIELDS = ("thought", "text", "experience", "actions")
+ACTION_FIELDS = {
+    "move": ("pos",),
+    "use": ("item_name",),
+    "attack": ("sum",),
+    "interact": (),
+}
+
+# 比较运算：条件写作 {"字段": {"<": 30}}，直接写值等价于 {"==": 值}
+OPERATORS = {
+    "==": lambda a, b: a == b,
+    "!=": lambda a, b: a != b,
+    "<": lambda a, b: a is not None and a < b,
+    "<=": lambda a, b: a is not None and a <= b,
+    ">": lambda a, b: a is not None and a > b,
+    ">=": lambda a, b: a is not None and a >= b,
+    "in": lambda a, b: a in b,
+}
+
+# 特殊条件：
+# any          [条件, ...]                 任意一组条件成立
+# not          条件                        条件不成立
+# has_item     "物品名"                    背包中有该物品 (数量 > 0)
+# lacks_item   "物品名"                    背包中没有该物品
+# nearby       {"name"/"type"/..., "max_dist": 距离}  max_dist 内存在字段全部匹配的实体
+SPECIAL_CONDITIONS = ("any", "not", "has_item", "lacks_item", "nearby")
+
+# 默认规则：按顺序匹配，第一条成立的规则直接给出决策
+DEFAULT_RULES = [
+    {
+        # 规则要求生命值为 0 时不允许有任何操作和语言、思考
+        "name": "dead",
+        "when": {"hp": {"<=": 0}},
+        "decision": {"thought": "", "text": "", "experience": "", "actions": []},
+    },
+    {
+        "name": "sleeping",
+        "when": {"any": [{"is_sleep": True}, {"is_sleeping": True}]},
+        "decision": {"thought": "正在睡觉", "text": "", "experience": "", "actions": []},
+    },
+    {
+        "name": "drink_water",
+        "when": {"hydration": {"<": 20}, "has_item": "纯净水"},
+        "decision": {
+            "thought": "含水量太低，先喝纯净水",
+            "text": "先喝口水",
+            "experience": "含水量低于20时应优先喝水",
+            "actions": [{"type": "use", "item_name": "纯净水"}],
+        },
+    },
+    {
+        "name": "eat_carrot",
+        "when": {"satiety": {"<": 20}, "has_item": "胡萝卜"},
+        "decision": {
+            "thought": "饱食度太低，先吃胡萝卜",
+            "text": "先填饱肚子",
+            "experience": "饱食度低于20时应优先进食",
+            "actions": [{"type": "use", "item_name": "胡萝卜"}],
+        },
+    },
+    {
+        "name": "fetch_water",
+        "when": {"hydration": {"<": 20}, "lacks_item": "纯净水",
+                 "nearby": {"type": "purified_water_layer", "can_interact": True, "max_dist": 48}},
+        "decision": {
+            "thought": "没有纯净水了，旁边就是净水点",
+            "text": "去接点水",
+            "experience": "缺水时在净水点交互获取纯净水",
+            "actions": [{"type": "interact"}],
+        },
+    },
+]
+
+
+def validate_decision(decision, reflex: bool = False) -> list:
+    """
+    检查决策是否符合 STATIC_PROMPT_PREFIX 的 JSON 结构，返回问题列表 (为空表示合法)
+    reflex: 反射层规则给出的决策，允许 actions 为空数组 (本轮不做任何操作，如死亡、睡觉)；
+            其余决策按 Prompt 要求 actions 不能为空
+    """
+    if not isinstance(decision, dict):
+        return ["决策必须是 JSON 对象"]
+    problems = [f"未定义的字段 {key}" for key in decision if key not in DECISION_FIELDS]
+    for key in DECISION_FIELDS[:3]:
+        if not isinstance(decision.get(key), str):
+            problems.append(f"{key} 必须是字符串")
+    actions = decision.get("actions")
+    if not isinstance(actions, list):
+        return problems + ["actions 必须是数组"]
+    if not actions and not reflex:
+        problems.append("actions 不能为空")
+    for i, action in enumerate(actions):
+        fields = ACTION_FIELDS.get(action.get("type")) if isinstance(action, dict) else None
+        if fields is None:
+            problems.append(f"actions[{i}] 的 type 无效")
+            continue
+        extra = set(action) - set(fields) - {"type"}
+        missing = [f for f in fields if action.get(f) is None]
+        if extra or missing:
+            problems.append(f"actions[{i}] 字段不符: 多余 {sorted(extra)} 缺少 {missing}")
+    return problems
+
+
+class Rule:
+    """一条声明式规则：when 中的条件全部成立时给出 decision"""
+    def __init__(self, name: str, when: dict, decision: dict):
+        self.name = name
+        self.when = when
+        self.decision = decision
+        self._check_conditions(when)
+        problems = validate_decision(decision, reflex=True)
+        if problems:
+            raise ValueError(f"规则 {name} 的决策不合法: {'; '.join(problems)}")
+
+    def _check_conditions(self, when):
+        if not isinstance(when, dict):
+            raise ValueError(f"规则 {self.name} 的条件必须是对象")
+        for key, expected in when.items():
+            if key == "any":
+                for sub in expected:
+                    self._check_conditions(sub)
+            elif key == "not":
+                self._check_conditions(expected)
+            elif isinstance(expected, dict) and key not in SPECIAL_CONDITIONS:
+                unknown = set(expected) - set(OPERATORS)
+                if unknown:
+                    raise ValueError(f"规则 {self.name} 使用了未知运算符 {sorted(unknown)}")
+
+    @classmethod
+    def from_dict(cls, spec: dict) -> "Rule":
+        return cls(spec["name"], spec.get("when", {}), spec["decision"])
+
+    def matches(self, player: dict, entities: list) -> bool:
+        return match_conditions(self.when, player, entities)
+
+
+def inventory_amount(player: dict, item_name: str) -> float:
+    return sum(item.get("amount", 0) for item in player.get("inventory", [])
+               if item is not None and item.get("name") == item_name)
+
+def _nearby(player: dict, entities: list, spec: dict) -> bool:
+    pos = player.get("current_pos")
+    if not pos:
+        return False
+    max_dist = spec.get("max_dist", math.inf)
+    fields = {k: v for k, v in spec.items() if k != "max_dist"}
+    for e in entities:
+        center = e.get("center")
+        if not center or any(e.get(k) != v for k, v in fields.items()):
+            continue
+        if math.hypot(center[0] - pos[0], center[1] - pos[1]) <= max_dist:
+            return True
+    return False
+
+def match_conditions(when: dict, player: dict, entities: list) -> bool:
+    """when 中的条件是否全部成立 (条件语法见 OPERATORS 与 SPECIAL_CONDITIONS，PlanCache 的触发器同样使用)"""
+    for key, expected in when.items():
+        if key == "any":
+            if not any(match_conditions(sub, player, entities) for sub in expected):
+                return False
+        elif key == "not":
+            if match_conditions(expected, player, entities):
+                return False
+        elif key == "has_item":
+            if inventory_amount(player, expected) <= 0:
+                return False
+        elif key == "lacks_item":
+            if inventory_amount(player, expected) > 0:
+                return False
+        elif key == "nearby":
+            if not _nearby(player, entities, expected):
+                return False
+        elif isinstance(expected, dict):
+            value = player.get(key)
+            try:
+                if not all(OPERATORS[op](value, target) for op, target in expected.items()):
+                    return False
+            except TypeError:
+                return False
+        elif player.get(key) != expected:
+            return False
+    return True
+
+def decisions_agree(rule_decision: dict, llm_decision) -> bool:
+    """影子模式的一致性判定：规则的动作 (type 与目标物品) 是 LLM 动作序列的前缀；规则不动作时要求 LLM 也不动作"""
+    if not isinstance(llm_decision, dict) or not isinstance(llm_decision.get("actions"), list):
+        return False
+    expected = [(a.get("type"), a.get("item_name")) for a in rule_decision["actions"]]
+    actual = [(a.get("type"), a.get("item_name")) for a in llm_decision["actions"] if isinstance(a, dict)]
+    if not expected:
+        return not actual
+    return actual[:len(expected)] == expected
+
+def load_rules(path: str) -> list:
+    """从 JSON 文件加载规则列表 (格式同 DEFAULT_RULES)"""
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+class ReflexEngine:
+    """
+    反射层：在请求 LLM 之前按顺序匹配声明式规则，命中时直接返回符合决策结构的结果，跳过一次模型调用。
+    mode:
+    - on      命中规则时绕过 LLM
+    - shadow  只记录规则会给出的决策，仍然请求 LLM，并比较两者是否一致 (用于上线前评估规则)
+    - off     不匹配规则
+    """
+    MODES = ("on", "shadow", "off")
+
+    def __init__(self, rules: list = None, mode: str = "on"):
+        if mode not in self.MODES:
+            raise ValueError(f"mode 必须是 {self.MODES} 之一")
+        self.mode = mode
+        self.rules = [r if isinstance(r, Rule) else Rule.from_dict(r) for r in (rules or DEFAULT_RULES)]
+        self.evaluated = 0
+        self.fired = {rule.name: 0 for rule in self.rules}
+        self.bypassed = 0
+        self.shadow_agree = {rule.name: 0 for rule in self.rules}
+        self.shadow_disagree = {rule.name: 0 for rule in self.rules}
+
+    def match(self, raw_data: dict):
+        """返回第一条成立的规则及其决策副本 (rule_name, decision)，没有规则成立时返回 None"""
+        if self.mode == "off":
+            return None
+        self.evaluated += 1
+        player = raw_data.get("player_status", {})
+        entities = raw_data.get("entities", [])
+        for rule in self.rules:
+            if rule.matches(player, entities):
+                self.fired[rule.name] += 1
+                if self.mode == "on":
+                    self.bypassed += 1
+                return rule.name, copy.deepcopy(rule.decision)
+        return None
+
+    def record_shadow(self, rule_name: str, rule_decision: dict, llm_decision) -> bool:
+        """影子模式下记录规则决策与 LLM 决策是否一致"""
+        agree = decisions_agree(rule_decision, llm_decision)
+        (self.shadow_agree if agree else self.shadow_disagree)[rule_name] += 1
+        return agree
+
+    def snapshot(self) -> dict:
+        compared = sum(self.shadow_agree.values()) + sum(self.shadow_disagree.values())
+        return {
+            "mode": self.mode,
+            "evaluated": self.evaluated,
+            "bypassed": self.bypassed,
+            "bypass_rate": round(self.bypassed / self.evaluated, 4) if self.evaluated else 0,
+            "fired": dict(self.fired),
+            "shadow_compared": compared,
+            "shadow_agree_rate": round(sum(self.shadow_agree.values()) / compared, 4) if compared else 0,
+            "shadow_agree": dict(self.shadow_agree),
+            "shadow_disagree": dict(self.shadow_disagree),
+        }
@@ -0,0 +1,176 @@
+import hashlib
+import zlib
+from collections import OrderedDict
+
+from bson import Binary
+
+CHUNK_FIELD = "scene_report_chunks"
+
+
+class ReportStore:
+    """
+    场景报告的内容寻址存储：
+    1. 报告按段落/表格行切块，每块以 sha256 前缀为 ID，压缩后只在 chunk 集合中存一份。
+    2. 历史文档只保存块引用列表：块 ID 为字符串；短于 min_chunk_bytes 的块 (如距离数值) 不值得引用，
+       以单元素列表 [原文] 的形式内联。新块先登记为待写入，由写后缓冲在写入历史文档之前批量落库。
+    3. 读取时按 ID 取回并解压，拼接出与原文逐字节一致的报告。
+    """
+    def __init__(self, chunk_collection, hash_chars: int = 16, compress_level: int = 6, min_chunk_bytes: int = 24,
+                 known_cache_size: int = 200000, text_cache_size: int = 20000):
+        self.chunk_collection = chunk_collection
+        self.hash_chars = hash_chars
+        self.min_chunk_bytes = min_chunk_bytes
+        self.compress_level = compress_level
+        self.known_cache_size = known_cache_size
+        self.text_cache_size = text_cache_size
+
+        self._known = OrderedDict()       # 已落库的块 ID (LRU)，避免重复写入
+        self._pending = {}                # 块 ID -> 待写入的块文档
+        self._texts = OrderedDict()       # 块 ID -> 原文 (LRU)，加速读取
+
+        # 统计
+        self.reports = 0
+        self.chunks_seen = 0
+        self.chunks_inline = 0
+        self.chunks_new = 0
+        self.raw_bytes = 0
+        self.stored_bytes = 0
+        self.ref_bytes = 0
+
+    # --- 切块 ---
+    @staticmethod
+    def split(report: str) -> list:
+        """
+        按行切块；表格行再在第 3 列 (目标清单中的距离列) 前后切开，
+        使 NPC 移动时只有距离这一小段变化，整行的其余部分仍可复用。拼接后等于原文。
+        """
+        chunks = []
+        for line in report.splitlines(keepends=True):
+            if line.startswith("| "):
+                cells = line.split(" | ", 3)
+                if len(cells) == 4:
+                    head = f"{cells[0]} | {cells[1]} | "
+                    chunks.extend((head, cells[2], line[len(head) + len(cells[2]):]))
+                    continue
+            chunks.append(line)
+        return chunks
+
+    def _hash(self, chunk: str) -> str:
+        return hashlib.sha256(chunk.encode("utf-8")).hexdigest()[:self.hash_chars]
+
+    def _remember_text(self, chunk_id: str, text: str):
+        self._texts[chunk_id] = text
+        self._texts.move_to_end(chunk_id)
+        while len(self._texts) > self.text_cache_size:
+            self._texts.popitem(last=False)
+
+    def _mark_known(self, chunk_id: str):
+        self._known[chunk_id] = True
+        self._known.move_to_end(chunk_id)
+        while len(self._known) > self.known_cache_size:
+            self._known.popitem(last=False)
+
+    # --- 写入 ---
+    def encode(self, report: str) -> list:
+        """切块并登记新块，返回块引用列表 (同步，不访问数据库)"""
+        refs = []
+        for chunk in self.split(report):
+            raw = chunk.encode("utf-8")
+            if len(raw) < self.min_chunk_bytes:
+                self.chunks_inline += 1
+                refs.append([chunk])
+                self.ref_bytes += len(raw)
+                continue
+            self.chunks_seen += 1
+            chunk_id = self._hash(chunk)
+            refs.append(chunk_id)
+            self.ref_bytes += self.hash_chars
+            if chunk_id in self._known:
+                self._known.move_to_end(chunk_id)
+                self._remember_text(chunk_id, chunk)
+                continue
+            if chunk_id not in self._pending:
+                data = zlib.compress(raw, self.compress_level)
+                self._pending[chunk_id] = {"_id": chunk_id, "data": Binary(data), "size": len(raw)}
+                self._remember_text(chunk_id, chunk)
+                self.chunks_new += 1
+                self.stored_bytes += len(data)
+        self.reports += 1
+        self.raw_bytes += len(report.encode("utf-8"))
+        return refs
+
+    async def flush_pending(self):
+        """把全部待写入块落库，供写后缓冲在写入历史文档之前调用"""
+        if not self._pending:
+            return
+        chunk_ids = list(self._pending)
+        chunk_docs = [self._pending[cid] for cid in chunk_ids]
+        try:
+            await self.chunk_collection.insert_many(chunk_docs, ordered=False)
+        except Exception as e:
+            # 块已存在 (其他进程写过，或已淘汰出本地 LRU) 不算失败
+            details = getattr(e, "details", None) or {}
+            errors = details.get("writeErrors", [])
+            if not errors or any(err.get("code") != 11000 for err in errors):
+                raise
+        for cid in chunk_ids:
+            self._pending.pop(cid, None)
+            self._mark_known(cid)
+
+    def discard_pending(self):
+        """只统计不落库 (如迁移工具的 dry-run)：把待写入块视为已存在"""
+        for cid in self._pending:
+            self._mark_known(cid)
+        self._pending.clear()
+
+    def inline(self, document: dict) -> dict:
+        """把块引用还原为报告原文 (仅使用内存中的块)，用于溢写到本地文件等离线场景"""
+        refs = document.get(CHUNK_FIELD)
+        if refs is None or any(isinstance(ref, str) and ref not in self._texts for ref in refs):
+            return document
+        document = dict(document)
+        document["scene_report"] = self._join(document.pop(CHUNK_FIELD), self._texts)
+        return document
+
+    # --- 读取 ---
+    @staticmethod
+    def _join(refs: list, texts) -> str:
+        return "".join(texts.get(ref, "") if isinstance(ref, str) else ref[0] for ref in refs)
+
+    async def _fetch(self, chunk_ids: set) -> dict:
+        texts = {cid: self._texts[cid] for cid in chunk_ids if cid in self._texts}
+        missing = [cid for cid in chunk_ids if cid not in texts]
+        if missing:
+            async for chunk_doc in self.chunk_collection.find({"_id": {"$in": missing}}):
+                text = zlib.decompress(chunk_doc["data"]).decode("utf-8")
+                texts[chunk_doc["_id"]] = text
+                self._remember_text(chunk_doc["_id"], text)
+        return texts
+
+    async def expand(self, documents: list) -> list:
+        """为历史文档透明地还原 scene_report 字段 (一次查询取回整批文档引用的块)"""
+        texts = await self._fetch({
+            ref for doc in documents for ref in doc.get(CHUNK_FIELD, ()) if isinstance(ref, str)
+        })
+        for doc in documents:
+            refs = doc.pop(CHUNK_FIELD, None)
+            if refs is not None:
+                doc["scene_report"] = self._join(refs, texts)
+        return documents
+
+    async def load(self, refs: list) -> str:
+        texts = await self._fetch({ref for ref in refs if isinstance(ref, str)})
+        return self._join(refs, texts)
+
+    def snapshot(self) -> dict:
+        return {
+            "reports": self.reports,
+            "chunks_seen": self.chunks_seen,
+            "chunks_new": self.chunks_new,
+            "chunks_inline": self.chunks_inline,
+            "pending_chunks": len(self._pending),
+            "dedup_ratio": round(self.chunks_seen / self.chunks_new, 2) if self.chunks_new else 0,
+            "raw_bytes": self.raw_bytes,
+            "stored_bytes": self.stored_bytes + self.ref_bytes,
+            "bytes_saved": self.raw_bytes - self.stored_bytes - self.ref_bytes,
+        }
@@ -0,0 +1,74 @@
+import asyncio
+import itertools
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class RequestPipeline:
+    """
+    单条 Godot 连接上的并发请求管线：
+    1. 不同 NPC 的请求并发执行，总在途数量受 max_in_flight 限制。
+    2. 同一 NPC 的请求保持顺序；新请求到达时取消仍在途的旧请求 (latest-wins)，避免回传过期决策。
+    3. 结果可能乱序返回，由调用方在响应里携带 request_id 进行关联。
+    4. 在途上限可通过 grow() 提高 (例如批量帧一次提交许多 NPC)，不会降低。
+    """
+    def __init__(self, on_result, max_in_flight: int = 8):
+        self.on_result = on_result
+        self.max_in_flight = max_in_flight
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+        self._tasks = {}
+        self._seq = itertools.count(1)
+        self.completed = 0
+        self.superseded = 0
+        self.failed = 0
+
+    def next_request_id(self, key: str) -> str:
+        return f"{key}-{next(self._seq)}"
+
+    def grow(self, max_in_flight: int):
+        """把在途上限提高到 max_in_flight，已在等待的请求立即获得新增的名额"""
+        for _ in range(max_in_flight - self.max_in_flight):
+            self._semaphore.release()
+        self.max_in_flight = max(self.max_in_flight, max_in_flight)
+
+    @property
+    def in_flight(self) -> int:
+        return sum(1 for task in self._tasks.values() if not task.done())
+
+    def submit(self, key: str, coro_factory) -> asyncio.Task:
+        """提交一个请求；coro_factory 为无参函数，返回执行该请求的协程"""
+        previous = self._tasks.get(key)
+        if previous is not None and not previous.done():
+            previous.cancel()
+            self.superseded += 1
+        task = asyncio.create_task(self._run(key, coro_factory, previous))
+        self._tasks[key] = task
+        return task
+
+    async def _run(self, key, coro_factory, previous):
+        try:
+            # 等待被取代的旧请求彻底退出，保证同一 NPC 不会有两个请求同时在途
+            if previous is not None:
+                await asyncio.gather(previous, return_exceptions=True)
+            async with self._semaphore:
+                result = await coro_factory()
+            # 回传阶段不可被取消，避免写出半帧
+            await asyncio.shield(self.on_result(result))
+            self.completed += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.failed += 1
+            logger.error(f" [Error] 请求处理失败 ({key}): {e}")
+        finally:
+            if self._tasks.get(key) is asyncio.current_task():
+                del self._tasks[key]
+
+    async def close(self):
+        """连接断开时取消所有在途请求"""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks.clear()
@@ -0,0 +1,185 @@
+import json
+import re
+
+_STRING_SPECIAL = re.compile(r'["\\]')
+
+
+# --- 增强型 JSON 提取函数 ---
+def extract_json(text: str):
+    """
+    专门适配 DeepSeek-R1 的提取逻辑：
+    1. 先剔除 <think> 标签内容，避免干扰。
+    2. 使用贪婪匹配 r"({[\s\S]*})" 抓取最外层 JSON，确保 actions 数组内的嵌套花括号不被截断。
+    """
+    # 移除思维链内容
+    clean_text = re.sub(r'<think>[\s\S]*?</think>', '', text).strip()
+
+    # 贪婪匹配：找到第一个 { 和最后一个 } 之间的所有内容
+    match = re.search(r"(\{[\s\S]*\})", clean_text)
+
+    if match:
+        json_str = match.group(1)
+        # 移除可能误加的 Markdown 标识
+        json_str = json_str.replace('```json', '').replace('```', '').strip()
+        try:
+            return json.loads(json_str)
+        except json.JSONDecodeError:
+            # 尝试修复末尾多余逗号的常见错误
+            try:
+                json_str = re.sub(r',\s*([\]}])', r'\1', json_str)
+                return json.loads(json_str)
+            except:
+                return None
+    return None
+
+
+def _loads_lenient(text: str):
+    """解析单个 JSON 片段，失败时尝试去掉末尾多余逗号"""
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        try:
+            return json.loads(re.sub(r',\s*([\]}])', r'\1', text))
+        except json.JSONDecodeError:
+            return None
+
+
+class StreamingDecisionParser:
+    """
+    增量 JSON 解析器 (逐段喂入模型输出)：
+    1. 跳过 <think>...</think> 思维链，标签可以被切分在任意两段之间。
+    2. 跟踪最外层决策对象的括号深度 (识别字符串与转义)，actions 数组中每个元素闭合时立即产出。
+    3. 最外层对象闭合即视为完成，调用方可据此提前停止生成。
+    feed() 返回本次新产生的事件列表：("action", dict) / ("decision", dict)。
+    """
+    THINK_OPEN = "<think>"
+    THINK_CLOSE = "</think>"
+
+    def __init__(self):
+        self.thinking_parts = []
+        self.done = False
+        self.decision = None
+        self.actions = []
+
+        self._pending = ""        # 尚未判定是否为 think 标签的尾部
+        self._in_think = False
+        self._buffer = []         # 最外层对象的全部字符
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string_chars = []
+        self._last_key = None     # 深度 1 上最近一个字符串 (即当前键)
+        self._actions_depth = None
+        self._element_start = None
+
+    @property
+    def thinking(self) -> str:
+        return "".join(self.thinking_parts).strip()
+
+    def feed(self, text: str) -> list:
+        if self.done:
+            return []
+        events = []
+        data = self._pending + text
+        self._pending = ""
+        i = 0
+        n = len(data)
+        while i < n and not self.done:
+            if self._in_think:
+                end = data.find(self.THINK_CLOSE, i)
+                if end < 0:
+                    # 保留可能是半个结束标签的尾部
+                    keep = self._partial_tag_len(data, self.THINK_CLOSE)
+                    self.thinking_parts.append(data[i:n - keep])
+                    self._pending = data[n - keep:]
+                    return events
+                self.thinking_parts.append(data[i:end])
+                self._in_think = False
+                i = end + len(self.THINK_CLOSE)
+                continue
+
+            if self._depth == 0:
+                # 尚未进入决策对象：寻找 <think> 或第一个 {
+                brace = data.find("{", i)
+                think = data.find(self.THINK_OPEN, i)
+                if think >= 0 and (brace < 0 or think < brace):
+                    self._in_think = True
+                    i = think + len(self.THINK_OPEN)
+                    continue
+                if brace < 0:
+                    keep = self._partial_tag_len(data, self.THINK_OPEN)
+                    self._pending = data[n - keep:] if keep else ""
+                    return events
+                i = brace
+
+            i = self._scan(data, i, events)
+        return events
+
+    @staticmethod
+    def _partial_tag_len(data: str, tag: str) -> int:
+        if "<" not in data[-(len(tag) - 1):]:
+            return 0
+        for k in range(min(len(tag) - 1, len(data)), 0, -1):
+            if data.endswith(tag[:k]):
+                return k
+        return 0
+
+    def _scan(self, data: str, i: int, events: list) -> int:
+        """在决策对象内部逐字符扫描，直到对象闭合或数据耗尽"""
+        buffer = self._buffer
+        n = len(data)
+        while i < n:
+            if self._in_string and not self._escape:
+                # 字符串内部整段跳到下一个引号或反斜杠，避免逐字符处理
+                match = _STRING_SPECIAL.search(data, i)
+                end = match.start() if match else n
+                if end > i:
+                    buffer.append(data[i:end])
+                    self._string_chars.append(data[i:end])
+                    i = end
+                    if i >= n:
+                        break
+            ch = data[i]
+            buffer.append(ch)
+            i += 1
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                    self._string_chars.append(ch)
+                elif ch == "\\":
+                    self._escape = True
+                    self._string_chars.append(ch)
+                elif ch == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        self._last_key = "".join(self._string_chars)
+                else:
+                    self._string_chars.append(ch)
+                continue
+
+            if ch == '"':
+                self._in_string = True
+                self._string_chars = []
+            elif ch in "{[":
+                self._depth += 1
+                if ch == "[" and self._depth == 2 and self._last_key == "actions":
+                    self._actions_depth = 2
+                elif ch == "{" and self._actions_depth is not None and self._depth == 3:
+                    self._element_start = len(buffer) - 1
+            elif ch in "}]":
+                self._depth -= 1
+                if ch == "}" and self._element_start is not None and self._depth == 2:
+                    action = _loads_lenient("".join(buffer[self._element_start:]))
+                    self._element_start = None
+                    if action is not None:
+                        self.actions.append(action)
+                        events.append(("action", action))
+                elif ch == "]" and self._actions_depth is not None and self._depth == 1:
+                    self._actions_depth = None
+                elif self._depth == 0:
+                    self.done = True
+                    self.decision = _loads_lenient("".join(buffer))
+                    if self.decision is not None:
+                        events.append(("decision", self.decision))
+                    return i
+        return i
@@ -0,0 +1,201 @@
+import math
+
+try:
+    import numpy as np
+except ImportError:  # numpy 不可用时退化为纯 Python 计算
+    np = None
+
+
+class SpatialIndex:
+    """
+    实体空间索引 (均匀网格)：
+    1. 每张地图快照构建一次，实体按中心点与 rect 覆盖的网格单元登记。
+    2. 距离计算在 numpy 可用时向量化，否则逐个计算；结果与 math.sqrt(dx**2 + dy**2) 一致。
+    3. 支持 k 近邻与半径查询，返回按 (保留 1 位小数的距离, 原始下标) 排序的下标列表，不修改输入实体。
+    4. 批量帧中多个 NPC 共享同一批实体：distance_matrix / query_many 一次处理所有 NPC 的位置，
+       numpy 可用时整体广播为 (NPC 数 × 实体数) 的距离矩阵，否则逐个位置查询。
+    """
+    def __init__(self, entities: list, cell_size: float = 64.0):
+        self.cell_size = cell_size
+        self.size = len(entities)
+        xs = [float(e["center"][0]) for e in entities]
+        ys = [float(e["center"][1]) for e in entities]
+        rects = [e.get("rect") if len(e.get("rect") or ()) == 4 else None for e in entities]
+        if np is not None:
+            self._xs = np.array(xs, dtype=np.float64)
+            self._ys = np.array(ys, dtype=np.float64)
+        else:
+            self._xs, self._ys = xs, ys
+        self._rects = rects
+
+        # 网格：单元坐标 -> 实体下标列表
+        self._grid = {}
+        for i, (x, y, rect) in enumerate(zip(xs, ys, rects)):
+            cells = {self._cell(x, y)}
+            if rect is not None:
+                x1, y1, w, h = rect
+                cx1, cy1 = self._cell(x1, y1)
+                cx2, cy2 = self._cell(x1 + w, y1 + h)
+                cells.update((cx, cy) for cx in range(cx1, cx2 + 1) for cy in range(cy1, cy2 + 1))
+            for cell in cells:
+                self._grid.setdefault(cell, []).append(i)
+
+        if self._grid:
+            gx = [c[0] for c in self._grid]
+            gy = [c[1] for c in self._grid]
+            self._extent = (min(gx), min(gy), max(gx), max(gy))
+        else:
+            self._extent = (0, 0, 0, 0)
+
+    @classmethod
+    def from_entities(cls, entities: list, cell_size: float = 64.0) -> "SpatialIndex":
+        return cls(entities, cell_size=cell_size)
+
+    def _cell(self, x: float, y: float) -> tuple:
+        return (math.floor(x / self.cell_size), math.floor(y / self.cell_size))
+
+    # --- 距离 ---
+    def distances(self, point, indices=None) -> list:
+        """点到实体中心的距离，indices 为空时计算全部实体"""
+        px, py = float(point[0]), float(point[1])
+        if np is not None:
+            if indices is None:
+                xs, ys = self._xs, self._ys
+            else:
+                idx = np.fromiter(indices, dtype=np.intp)
+                xs, ys = self._xs[idx], self._ys[idx]
+            return np.sqrt((xs - px) ** 2 + (ys - py) ** 2).tolist()
+        if indices is None:
+            indices = range(self.size)
+        return [math.sqrt((self._xs[i] - px) ** 2 + (self._ys[i] - py) ** 2) for i in indices]
+
+    def _matrix(self, points):
+        px = np.array([float(p[0]) for p in points], dtype=np.float64)[:, None]
+        py = np.array([float(p[1]) for p in points], dtype=np.float64)[:, None]
+        return np.sqrt((self._xs[None, :] - px) ** 2 + (self._ys[None, :] - py) ** 2)
+
+    def distance_matrix(self, points) -> list:
+        """多个点到全部实体中心的距离，第 i 行与 distances(points[i]) 相同"""
+        if np is not None and points:
+            return self._matrix(points).tolist()
+        return [self.distances(point) for point in points]
+
+    def rect_distances(self, point, indices=None) -> list:
+        """点到实体 rect 的最近距离 (点在 rect 内为 0)，无 rect 的实体退化为中心距离"""
+        px, py = float(point[0]), float(point[1])
+        if indices is None:
+            indices = range(self.size)
+        result = []
+        for i in indices:
+            rect = self._rects[i]
+            if rect is None:
+                result.append(math.sqrt((self._xs[i] - px) ** 2 + (self._ys[i] - py) ** 2))
+                continue
+            x1, y1, w, h = rect
+            dx = max(x1 - px, 0.0, px - (x1 + w))
+            dy = max(y1 - py, 0.0, py - (y1 + h))
+            result.append(math.sqrt(dx * dx + dy * dy))
+        return result
+
+    def _ordered(self, indices: list, dists: list) -> list:
+        order = sorted(range(len(indices)), key=lambda j: (round(dists[j], 1), indices[j]))
+        return [(indices[j], dists[j]) for j in order]
+
+    def _measure(self, point, indices: list, metric: str) -> list:
+        if metric == "rect":
+            return self.rect_distances(point, indices)
+        return self.distances(point, indices)
+
+    # --- 查询 ---
+    def _ring(self, center: tuple, r: int):
+        cx, cy = center
+        if r == 0:
+            yield center
+            return
+        for dx in range(-r, r + 1):
+            yield (cx + dx, cy - r)
+            yield (cx + dx, cy + r)
+        for dy in range(-r + 1, r):
+            yield (cx - r, cy + dy)
+            yield (cx + r, cy + dy)
+
+    def _max_ring(self, center: tuple) -> int:
+        x1, y1, x2, y2 = self._extent
+        return max(abs(center[0] - x1), abs(center[0] - x2), abs(center[1] - y1), abs(center[1] - y2))
+
+    def within_radius(self, point, radius: float, metric: str = "center") -> list:
+        """半径内的实体，返回 [(下标, 距离)]，按距离升序"""
+        center = self._cell(float(point[0]), float(point[1]))
+        rings = min(math.ceil(radius / self.cell_size), self._max_ring(center))
+        candidates = set()
+        for r in range(rings + 1):
+            for cell in self._ring(center, r):
+                candidates.update(self._grid.get(cell, ()))
+        indices = sorted(candidates)
+        pairs = [(i, d) for i, d in zip(indices, self._measure(point, indices, metric)) if d <= radius]
+        if not pairs:
+            return []
+        indices, dists = zip(*pairs)
+        return self._ordered(list(indices), list(dists))
+
+    def nearest(self, point, k: int, radius: float = None, metric: str = "center") -> list:
+        """k 近邻 (可选半径上限)，返回 [(下标, 距离)]，按距离升序"""
+        if k <= 0 or self.size == 0:
+            return []
+        center = self._cell(float(point[0]), float(point[1]))
+        max_ring = self._max_ring(center)
+        if radius is not None:
+            max_ring = min(max_ring, math.ceil(radius / self.cell_size))
+
+        seen = set()
+        found = []
+        for r in range(max_ring + 1):
+            ring_indices = []
+            for cell in self._ring(center, r):
+                for i in self._grid.get(cell, ()):
+                    if i not in seen:
+                        seen.add(i)
+                        ring_indices.append(i)
+            if ring_indices:
+                found.extend(zip(ring_indices, self._measure(point, ring_indices, metric)))
+            # 第 r 圈之外的实体距离至少为 r * cell_size，已找到的前 k 个若都更近则可以停止
+            if len(found) >= k:
+                kth = sorted(d for _, d in found)[k - 1]
+                if kth + 0.05 < r * self.cell_size:
+                    break
+
+        if radius is not None:
+            found = [(i, d) for i, d in found if d <= radius]
+        if not found:
+            return []
+        indices, dists = zip(*found)
+        return self._ordered(list(indices), list(dists))[:k]
+
+    def query_many(self, points, k: int = None, radius: float = None) -> list:
+        """
+        批量 k 近邻 / 半径查询 (中心距离)，第 i 项与 nearest(points[i], k, radius) 或
+        within_radius(points[i], radius) 相同。numpy 可用时一次算出距离矩阵，按行用 partition 选出候选，
+        只有候选回到 Python 排序；否则逐个位置走网格查询。
+        """
+        if k is None and radius is None:
+            raise ValueError("query_many 需要 k 或 radius")
+        if np is None or self.size == 0 or not points:
+            if k is not None:
+                return [self.nearest(point, k, radius=radius) for point in points]
+            return [self.within_radius(point, radius) for point in points]
+        if k is not None and k <= 0:
+            return [[] for _ in points]
+        matrix = self._matrix(points)
+        if radius is not None:
+            matrix = np.where(matrix <= radius, matrix, np.inf)
+        candidates = np.isfinite(matrix)
+        if k is not None and k < self.size:
+            # 每行第 k 小的距离；与它相差 0.1 以内的实体保留 1 位小数后可能并列，一并作为候选
+            kth = np.partition(matrix, k - 1, axis=1)[:, k - 1:k]
+            candidates &= matrix <= kth + 0.1
+        result = []
+        for row, mask in zip(matrix, candidates):
+            indices = np.flatnonzero(mask)
+            hits = self._ordered(indices.tolist(), row[indices].tolist())
+            result.append(hits if k is None else hits[:k])
+        return result
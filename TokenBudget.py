@@ -0,0 +1,32 @@
+import logging
+import math
+
+logger = logging.getLogger(__name__)
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    离线 token 估算 (无需加载分词器)：
+    中文等非 ASCII 字符按 1 字 1 token，ASCII 文本按约 4 字符 1 token。
+    对 DeepSeek 系列分词器略偏保守，适合作为预算上限使用。
+    """
+    ascii_chars = len(text.encode("ascii", "ignore"))
+    return (len(text) - ascii_chars) + math.ceil(ascii_chars / 4)
+
+
+def load_tokenizer(model_path: str):
+    """
+    加载与推理模型一致的分词器，返回 text -> token 数的计数函数。
+    transformers 不可用或加载失败时退化为 estimate_tokens。
+    """
+    try:
+        from transformers import AutoTokenizer
+        tokenizer = AutoTokenizer.from_pretrained(model_path, trust_remote_code=True)
+    except Exception as e:
+        logger.warning(f" [Tokenizer] 加载分词器失败，使用离线估算: {e}")
+        return estimate_tokens
+
+    def count_tokens(text: str) -> int:
+        return len(tokenizer.encode(text, add_special_tokens=False))
+
+    return count_tokens
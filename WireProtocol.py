@@ -0,0 +1,227 @@
+from collections import OrderedDict
+
+try:
+    import msgpack
+except ImportError:  # msgpack 不可用时 /ws 只接受 JSON
+    msgpack = None
+
+# Godot -> gateway 的紧凑二进制协议 (可选，经 WebSocket 子协议协商)：
+# 1. 客户端连接 /ws 时在 Sec-WebSocket-Protocol 中提供 SUBPROTOCOL；gateway 装有 msgpack 时接受，否则握手不带子协议，
+#    客户端应回退到 JSON 文本帧。
+# 2. 每个 NPC (npc) 是一条独立的流。客户端发送 MessagePack 二进制帧：
+#      {"t": "full",  "npc": id, "seq": n, "world": {...}}                  完整世界
+#      {"t": "delta", "npc": id, "seq": n, "base": m, "set": {...}, "unset": [...],
+#       "player": {...}, "player_unset": [...], "chat_append": [...],
+#       "upsert": {实体 id: 实体}, "remove": [实体 id...]}                    相对已确认快照 m 的差量 (空字段省略)
+#    实体以 id 为键 (缺少 id 的实体以 "#下标" 为键)，只发送有字段变化的实体 (整条)；player_status 按字段比较，chat_history 只追加时仅发送新增部分。
+#    其他消息 (如 {"type": "invalidate_cache", ...}) 原样以 MessagePack 发送。
+# 3. gateway 应用后回复 {"t": "ack", "npc", "seq"}；找不到 base 时回复 {"t": "resync", "npc", "seq"}，客户端下一帧发送 full。
+#    客户端总是以最近一次被确认的快照为 base，因此确认延迟只会让差量变大，不会出错。
+# 4. gateway -> Godot 的决策仍是 JSON 文本帧 (与 Web 广播共用同一份序列化结果)，只有 ack / resync 为二进制帧。
+# 实体顺序：新实体追加在末尾，已有实体保持首次出现的位置。
+
+SUBPROTOCOL = "fsai.msgpack-delta.v1"
+ENTITY_KEY = "id"
+
+_MISSING = object()
+
+
+def available() -> bool:
+    return msgpack is not None
+
+def pack(obj) -> bytes:
+    return msgpack.packb(obj, use_bin_type=True)
+
+def unpack(data: bytes):
+    return msgpack.unpackb(data, raw=False)
+
+
+class ResyncRequired(Exception):
+    """差量的 base 快照不存在 (gateway 重启、确认落后太多或流从未发送过 full)"""
+    def __init__(self, npc, seq):
+        super().__init__(f"{npc} 的帧 {seq} 缺少 base 快照，需要重新发送完整世界")
+        self.npc = npc
+        self.seq = seq
+
+
+class WorldState:
+    """一帧世界的物化形式：顶层字段、player_status 字段、按 id 索引的实体 (保持顺序)"""
+    __slots__ = ("top", "player", "entities")
+
+    def __init__(self, top: dict, player: dict, entities: dict):
+        self.top = top
+        self.player = player
+        self.entities = entities
+
+    @classmethod
+    def from_world(cls, world: dict, copy_entities: bool = True) -> "WorldState":
+        top = {k: v for k, v in world.items() if k not in ("entities", "player_status")}
+        player = dict(world.get("player_status") or {})
+        if isinstance(player.get("chat_history"), list):
+            player["chat_history"] = list(player["chat_history"])
+        entities = {}
+        for i, e in enumerate(world.get("entities") or []):
+            key = e.get(ENTITY_KEY)
+            entities[key if key is not None else f"#{i}"] = dict(e) if copy_entities else e
+        return cls(top, player, entities)
+
+    def to_world(self) -> dict:
+        """生成交给决策流程的 dict；各层都是新容器，后续帧的差量不会修改已交出的世界"""
+        world = dict(self.top)
+        world["player_status"] = dict(self.player)
+        world["entities"] = list(self.entities.values())
+        return world
+
+
+def _diff_fields(old: dict, new: dict) -> tuple:
+    changed = {k: v for k, v in new.items() if old.get(k, _MISSING) != v}
+    removed = [k for k in old if k not in new]
+    return changed, removed
+
+def diff_states(base: WorldState, state: WorldState) -> dict:
+    """计算 state 相对 base 的差量字段 (空字段省略)"""
+    delta = {}
+    changed, removed = _diff_fields(base.top, state.top)
+    if changed:
+        delta["set"] = changed
+    if removed:
+        delta["unset"] = removed
+
+    changed, removed = _diff_fields(base.player, state.player)
+    old_chat, new_chat = base.player.get("chat_history"), changed.get("chat_history")
+    if isinstance(old_chat, list) and isinstance(new_chat, list) and new_chat[:len(old_chat)] == old_chat:
+        del changed["chat_history"]
+        delta["chat_append"] = new_chat[len(old_chat):]
+    if changed:
+        delta["player"] = changed
+    if removed:
+        delta["player_unset"] = removed
+
+    old_entities = base.entities
+    upsert = {}
+    for key, e in state.entities.items():
+        old = old_entities.get(key)
+        if old is not e and old != e:
+            upsert[key] = e
+    if upsert:
+        delta["upsert"] = upsert
+    removed = [key for key in old_entities if key not in state.entities]
+    if removed:
+        delta["remove"] = removed
+    return delta
+
+def apply_delta(base: WorldState, delta: dict) -> WorldState:
+    """在 base 的副本上应用差量 (写时复制，base 保持不变)"""
+    top = dict(base.top)
+    top.update(delta.get("set") or {})
+    for key in delta.get("unset") or ():
+        top.pop(key, None)
+
+    player = dict(base.player)
+    player.update(delta.get("player") or {})
+    for key in delta.get("player_unset") or ():
+        player.pop(key, None)
+    if delta.get("chat_append"):
+        player["chat_history"] = list(player.get("chat_history") or []) + delta["chat_append"]
+
+    entities = base.entities
+    if delta.get("upsert") or delta.get("remove"):
+        entities = dict(entities)
+        for key in delta.get("remove") or ():
+            entities.pop(key, None)
+        entities.update(delta.get("upsert") or {})
+    return WorldState(top, player, entities)
+
+
+class DeltaDecoder:
+    """
+    gateway 端：每条连接一个，按 NPC 保存最近 history 个已应用的快照。
+    decode 返回交给决策流程的世界 dict；非 full/delta 消息原样返回。
+    """
+    def __init__(self, history: int = 8):
+        self.history = history
+        self.streams = {}  # npc -> OrderedDict(seq -> WorldState)
+        self.full_frames = 0
+        self.delta_frames = 0
+        self.resyncs = 0
+
+    def decode(self, message: dict) -> dict:
+        kind = message.get("t")
+        if kind == "full":
+            state = WorldState.from_world(message["world"], copy_entities=False)
+            self.full_frames += 1
+        elif kind == "delta":
+            snapshots = self.streams.get(message["npc"])
+            base = snapshots.get(message["base"]) if snapshots else None
+            if base is None:
+                self.resyncs += 1
+                raise ResyncRequired(message["npc"], message["seq"])
+            state = apply_delta(base, message)
+            self.delta_frames += 1
+        else:
+            return message
+        snapshots = self.streams.setdefault(message["npc"], OrderedDict())
+        snapshots[message["seq"]] = state
+        while len(snapshots) > self.history:
+            snapshots.popitem(last=False)
+        return state.to_world()
+
+    def forget(self, npc):
+        self.streams.pop(npc, None)
+
+    def snapshot(self) -> dict:
+        return {
+            "streams": len(self.streams),
+            "full_frames": self.full_frames,
+            "delta_frames": self.delta_frames,
+            "resyncs": self.resyncs,
+        }
+
+
+def ack_for(message: dict):
+    """已应用的 full/delta 帧对应的确认消息；其他消息不需要确认"""
+    if message.get("t") in ("full", "delta"):
+        return {"t": "ack", "npc": message["npc"], "seq": message["seq"]}
+    return None
+
+
+class DeltaEncoder:
+    """
+    客户端参考实现 (Godot 端按相同格式实现；压测与测试使用本类)：一个 NPC 一个。
+    copy_entities=False 时直接持有调用方的实体 dict，调用方须保证不原地修改已发送的实体。
+    """
+    def __init__(self, npc_id: str, max_pending: int = 8, copy_entities: bool = True):
+        self.npc_id = npc_id
+        self.max_pending = max_pending
+        self.copy_entities = copy_entities
+        self.seq = 0
+        self.acked = None  # (seq, WorldState)
+        self.pending = OrderedDict()
+
+    def encode(self, world: dict) -> bytes:
+        return pack(self.message(world))
+
+    def message(self, world: dict) -> dict:
+        state = WorldState.from_world(world, copy_entities=self.copy_entities)
+        self.seq += 1
+        self.pending[self.seq] = state
+        while len(self.pending) > self.max_pending:
+            self.pending.popitem(last=False)
+        if self.acked is None:
+            return {"t": "full", "npc": self.npc_id, "seq": self.seq, "world": world}
+        base_seq, base = self.acked
+        return dict(diff_states(base, state), t="delta", npc=self.npc_id, seq=self.seq, base=base_seq)
+
+    def on_ack(self, seq: int):
+        state = self.pending.get(seq)
+        if state is None:
+            return
+        while self.pending:
+            pending_seq, _ = self.pending.popitem(last=False)
+            if pending_seq == seq:
+                break
+        self.acked = (seq, state)
+
+    def on_resync(self):
+        self.acked = None
+        self.pending.clear()
@@ -0,0 +1,64 @@
+import json
+import math
+import platform
+import time
+
+# 基准结果的保存与对比：结果为 {指标名: 数值}，以 JSON 保存，便于与之后的运行逐项比较。
+# 名称以 HIGHER_IS_BETTER 中的后缀结尾的指标越大越好 (吞吐)，以 LOWER_IS_BETTER 结尾的越小越好 (延迟、耗时、消息大小、LLM 调用频率)，
+# 其余 (请求数等随配置变化的计数) 只展示、不判定。
+
+HIGHER_IS_BETTER = ("_per_s", "_speedup", "_hit_rate")
+LOWER_IS_BETTER = ("_ms", "_us", "_bytes", "_per_npc_minute")
+
+def percentile(sorted_values: list, q: float):
+    """最近秩法分位数，sorted_values 需已升序排列"""
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, math.ceil(q * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+def save_baseline(path: str, name: str, results: dict, config: dict = None):
+    document = {
+        "benchmark": name,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "config": config or {},
+        "results": results,
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(document, f, ensure_ascii=False, indent=2)
+    print(f" [Bench] 基线已保存到 {path}")
+
+def compare_baseline(path: str, results: dict, threshold: float = 0.1) -> list:
+    """
+    与已保存的基线逐项比较，打印对比表，返回退化超过 threshold (相对值) 的指标名列表。
+    基线中为 0 或缺失的指标、以及没有方向的计数只展示、不判定。
+    """
+    with open(path, encoding="utf-8") as f:
+        baseline = json.load(f)["results"]
+    regressions = []
+    print("| 指标 | 基线 | 本次 | 变化 | |")
+    print("| :--- | ---: | ---: | ---: | :--- |")
+    for key, value in results.items():
+        old = baseline.get(key)
+        if not isinstance(value, (int, float)) or not isinstance(old, (int, float)):
+            continue
+        if not old:
+            print(f"| {key} | {old} | {value:.3f} | - | |")
+            continue
+        change = (value - old) / abs(old)
+        if key.endswith(HIGHER_IS_BETTER):
+            worse = -change
+        elif key.endswith(LOWER_IS_BETTER):
+            worse = change
+        else:
+            worse = 0.0
+        flag = ""
+        if worse > threshold:
+            flag = "⚠ 退化"
+            regressions.append(key)
+        elif worse < -threshold:
+            flag = "提升"
+        print(f"| {key} | {old:.3f} | {value:.3f} | {change:+.1%} | {flag} |")
+    return regressions
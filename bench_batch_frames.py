@@ -0,0 +1,61 @@
+import asyncio
+import sys
+from bench_baseline import save_baseline, compare_baseline
+from bench_gateway import build_parser, run
+
+# 批量帧基准：对同一个 gateway 依次以逐个 NPC 的请求 (single) 与每 tick 一条批量帧 (batch) 压测，
+# NPC 数取 10、50、200，比较 gateway 进程每个 tick 消耗的 CPU (由 /metrics 的 gateway_process_cpu_seconds 差值得到)。
+# 每次运行使用不同的 NPC id 前缀，避免复用上一次运行留下的计划与缓存决策。默认负载偏向 CPU (较多实体、桩后端低延迟)：
+#   python main.py
+#   python bench_batch_frames.py --npcs-list 10 50 200 --entities 500 --save batch_baseline.json
+
+MODES = ("single", "batch")
+
+def main():
+    parser = build_parser("gateway 批量帧 CPU 基准")
+    parser.add_argument("--npcs-list", type=int, nargs="+", default=[10, 50, 200])
+    parser.set_defaults(entities=500, clients=1, tick_rate=1.0, duration=10.0, stub=True,
+                        stub_latency=0.02, stub_jitter=0.005)
+    args = parser.parse_args()
+
+    results = {}
+    rows = []
+    for npcs in args.npcs_list:
+        row = {}
+        for mode in MODES:
+            args.npcs = npcs
+            args.batch = mode == "batch"
+            args.npc_prefix = f"bench_{mode}_{npcs}"
+            print(f" [Bench] {npcs} NPC, {mode} ...")
+            run_results, _, _ = asyncio.run(run(args))
+            row[mode] = run_results
+            for key in ("gateway_cpu_per_tick_ms", "gateway_cpu_per_request_ms", "latency_p95_ms", "bytes_per_frame"):
+                if key in run_results:
+                    results[f"{mode}_{npcs}_{key}"] = run_results[key]
+        rows.append((npcs, row))
+
+    print(f" [Bench] {args.entities or '模板'} 个实体, {args.tick_rate} tick/s, 每种配置 {args.duration}s")
+    print("| NPC 数 | single CPU(ms/tick) | batch CPU(ms/tick) | 降低 | single p95(ms) | batch p95(ms) | 每 tick 字节 (single / batch) |")
+    print("| ---: | ---: | ---: | ---: | ---: | ---: | ---: |")
+    for npcs, row in rows:
+        single, batch = row["single"], row["batch"]
+        if "gateway_cpu_per_tick_ms" not in single or "gateway_cpu_per_tick_ms" not in batch:
+            print(f"| {npcs} | - | - | - | {single['latency_p95_ms']:.1f} | {batch['latency_p95_ms']:.1f} | - |")
+            continue
+        cpu_single, cpu_batch = single["gateway_cpu_per_tick_ms"], batch["gateway_cpu_per_tick_ms"]
+        reduction = 1 - cpu_batch / cpu_single if cpu_single else 0.0
+        print(f"| {npcs} | {cpu_single:.1f} | {cpu_batch:.1f} | {reduction:.0%} | {single['latency_p95_ms']:.1f} | "
+              f"{batch['latency_p95_ms']:.1f} | {single['bytes_per_frame'] * npcs:.0f} / {batch['bytes_per_frame']:.0f} |")
+        results[f"batch_{npcs}_cpu_speedup"] = cpu_single / cpu_batch if cpu_batch else 0.0
+
+    config = {k: v for k, v in vars(args).items() if k not in ("save", "compare", "threshold", "npcs", "batch", "npc_prefix")}
+    if args.save:
+        save_baseline(args.save, "batch_frames", results, config)
+    if args.compare:
+        regressions = compare_baseline(args.compare, results, args.threshold)
+        if regressions:
+            print(f" [Bench] FAILED: {len(regressions)} 项指标退化: {', '.join(regressions)}")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,531 @@
+import argparse
+import asyncio
+import json
+import math
+import random
+import re
+import sys
+import time
+import aiohttp
+from bench_baseline import percentile, save_baseline, compare_baseline
+from stub_server import StubBackend, LATENCY_DISTRIBUTIONS
+from bench_map_analyzer import build_world
+import WireProtocol
+
+# gateway 无头压测：以 map_dump.json 为模板模拟多个 Godot 客户端、每个客户端多个 NPC，
+# 按固定频率发送决策请求 (NPC 随机移动、饱食度/含水量随时间衰减)，可同时挂载 Web 看板客户端。
+# 统计吞吐、端到端延迟分位数，并抓取 gateway 的 /metrics 得到各阶段耗时。
+#
+# 用法 (gateway 的 AI_BACKENDS 默认指向 127.0.0.1:8000，--stub 会在该端口启动桩服务)：
+#   python main.py
+#   python bench_gateway.py --stub --clients 4 --npcs 10 --tick-rate 1 --duration 30 --save baseline.json
+#   python bench_gateway.py --stub --compare baseline.json
+#   python bench_gateway.py --stub --entities 2000 --protocol msgpack-delta   # 二进制差量协议，对比 json 的字节数与解码耗时
+#   python bench_gateway.py --stub --stub-concurrency 4 --deadline-ms 1500   # 后端饱和时的准入控制 (放弃/降级/过期)
+#   python bench_gateway.py --stub --batch --clients 1 --npcs 50   # 每个连接每 tick 发一条批量帧，对比 gateway CPU/tick
+
+STAGE_METRIC = "stage_duration_seconds"
+CPU_METRIC = "gateway_process_cpu_seconds"
+# 批量帧中每个 NPC 自己的字段，其余 (map_metadata 等) 与 entities 一起作为共享的世界
+NPC_FIELDS = ("player_status", "orther_players_status", "request_id", "timestamp", "stream", "deadline_ms")
+_SAMPLE_RE = re.compile(r'^(\w+)\{([^}]*)\} (\S+)$')
+_LABEL_RE = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+
+class SimNPC:
+    """模拟一个 NPC：在世界边界内随机游走，核心指标随时间衰减，归零后扣血"""
+    def __init__(self, index: int, template: dict, rng: random.Random, prefix: str = "bench_npc"):
+        self.rng = rng
+        self.id = f"{prefix}_{index:04d}"
+        self.name = f"压测NPC{index}"
+        xs, ys = self._bounds(template)
+        self.bounds = (min(xs), max(xs), min(ys), max(ys))
+        self.pos = [rng.uniform(self.bounds[0], self.bounds[1]), rng.uniform(self.bounds[2], self.bounds[3])]
+        self.heading = rng.uniform(0, 2 * math.pi)
+        self.satiety = rng.uniform(40, 100)
+        self.hydration = rng.uniform(40, 100)
+        self.hp = 100.0
+        self.seq = 0
+
+    @staticmethod
+    def _bounds(template: dict) -> tuple:
+        polygons = template.get("map_metadata", {}).get("nav_polygons") or [[[0.0, 0.0], [1150.0, 650.0]]]
+        return [p[0] for p in polygons[0]], [p[1] for p in polygons[0]]
+
+    def step(self, dt: float, speed: float = 40.0):
+        self.heading += self.rng.uniform(-0.8, 0.8)
+        x = self.pos[0] + speed * dt * self.rng.uniform(0.3, 1.0) * math.cos(self.heading)
+        y = self.pos[1] + speed * dt * self.rng.uniform(0.3, 1.0) * math.sin(self.heading)
+        self.pos = [round(min(max(x, self.bounds[0]), self.bounds[1]), 1),
+                    round(min(max(y, self.bounds[2]), self.bounds[3]), 1)]
+        self.satiety = max(0.0, self.satiety - self.rng.uniform(0.2, 0.6) * dt)
+        self.hydration = max(0.0, self.hydration - self.rng.uniform(0.3, 0.8) * dt)
+        if self.satiety == 0 or self.hydration == 0:
+            self.hp = max(0.0, self.hp - 1.0 * dt)
+        # 模拟进食/喝水后的突变，避免长时间压测后所有 NPC 都停在 0
+        if self.rng.random() < 0.02:
+            self.satiety = min(100.0, self.satiety + 30)
+        if self.rng.random() < 0.02:
+            self.hydration = min(100.0, self.hydration + 30)
+
+    def frame(self, template: dict, neighbours: list, stream: bool, deadline_ms: int = 0) -> dict:
+        """template 不含 entities (实体列表由 encode_frame 拼接已序列化的 JSON)"""
+        self.seq += 1
+        player = dict(template["player_status"], player_id=self.id, player_name=self.name,
+                      current_pos=list(self.pos), hp=round(self.hp, 1),
+                      satiety=round(self.satiety, 2), hydration=round(self.hydration, 2))
+        frame = dict(template, player_status=player, timestamp=time.time(),
+                     request_id=f"{self.id}-{self.seq}")
+        frame["orther_players_status"] = [
+            {"npc_name": other.name, "position": {"x": other.pos[0], "y": other.pos[1]}}
+            for other in neighbours if other is not self
+        ]
+        if stream:
+            frame["stream"] = True
+        if deadline_ms:
+            frame["deadline_ms"] = deadline_ms
+        return frame
+
+
+def encode_frame(frame: dict, entities_json: str) -> str:
+    """实体列表每帧不变，只序列化一次后拼接，避免压测端自身成为瓶颈"""
+    return f'{json.dumps(frame, ensure_ascii=False)[:-1]}, "entities": {entities_json}}}'
+
+def batch_frame(template: dict, frames: list) -> dict:
+    """把同一 tick 的多个 NPC 帧合并为一条批量帧 (不含 entities)"""
+    shared = {key: value for key, value in template.items() if key not in NPC_FIELDS}
+    npcs = [{key: frame[key] for key in NPC_FIELDS if key in frame} for frame in frames]
+    return dict(shared, type="batch_frame", npcs=npcs)
+
+
+class LoadStats:
+    def __init__(self):
+        self.sent = 0
+        self.decisions = 0
+        self.superseded = 0
+        self.lost = 0
+        self.errors = 0
+        self.cache_hits = 0
+        self.fallback_decisions = 0
+        self.partials = 0
+        self.latencies = []
+        self.web_messages = 0
+        self.web_clients_connected = 0
+        self.bytes_sent = 0
+        self.frames = 0
+        self.resyncs = 0
+        self.admission = {}
+        self.late = 0
+
+
+async def godot_client(session: aiohttp.ClientSession, url: str, npcs: list, template: dict, entities: list,
+                       entities_json: str, args, stats: LoadStats, stop: asyncio.Event):
+    """
+    一个 Godot 连接：每个 NPC 按 tick_rate 发送请求；回包按 request_id 计算端到端延迟
+    --protocol msgpack-delta 时协商二进制差量协议 (WireProtocol)，gateway 不接受时回退到 JSON
+    --batch 时每个 tick 把所有 NPC 合并为一条批量帧 (二进制协议下为 MessagePack 全量，不做差量)
+    """
+    pending = {}  # request_id -> (npc_id, 发送时间)
+    send_lock = asyncio.Lock()
+    protocols = (WireProtocol.SUBPROTOCOL,) if args.protocol == "msgpack-delta" else ()
+    try:
+        ws = await session.ws_connect(url, max_msg_size=0, protocols=protocols)
+    except aiohttp.ClientError as e:
+        stats.errors += len(npcs)
+        print(f" [Bench] 无法连接 gateway {url}: {e}")
+        return
+    binary = ws.protocol == WireProtocol.SUBPROTOCOL
+    if protocols and not binary:
+        print(" [Bench] gateway 未接受二进制协议，回退到 JSON")
+    # 压测端不修改模板实体，编码器可直接持有它们
+    encoders = {npc.id: WireProtocol.DeltaEncoder(npc.id, copy_entities=False) for npc in npcs} if binary else {}
+
+    async def reader():
+        async for msg in ws:
+            if msg.type == aiohttp.WSMsgType.BINARY:
+                control = WireProtocol.unpack(msg.data)
+                encoder = encoders.get(control.get("npc"))
+                if encoder is None:
+                    continue
+                if control.get("t") == "ack":
+                    encoder.on_ack(control["seq"])
+                elif control.get("t") == "resync":
+                    stats.resyncs += 1
+                    encoder.on_resync()
+                continue
+            if msg.type != aiohttp.WSMsgType.TEXT:
+                break
+            data = json.loads(msg.data)
+            if data.get("type") != "ai_decision":
+                stats.partials += 1
+                continue
+            entry = pending.pop(data.get("request_id"), None)
+            if entry is None:
+                continue
+            npc_id, sent_at = entry
+            stats.decisions += 1
+            latency = time.perf_counter() - sent_at
+            stats.latencies.append(latency)
+            if data.get("admission"):
+                stats.admission[data["admission"]] = stats.admission.get(data["admission"], 0) + 1
+            if args.deadline_ms and latency * 1000 > args.deadline_ms:
+                stats.late += 1
+            if data.get("cache_hit"):
+                stats.cache_hits += 1
+            # AI 失败时 gateway 返回的是兜底文本而不是决策对象
+            if not isinstance(data.get("ai_content"), dict):
+                stats.fallback_decisions += 1
+            # 同一 NPC 更早的在途请求已被 gateway 的最新请求取代，不会再有回包
+            for rid, (other_npc, other_sent) in list(pending.items()):
+                if other_npc == npc_id and other_sent < sent_at:
+                    del pending[rid]
+                    stats.superseded += 1
+
+    async def drive(npc: SimNPC):
+        interval = 1 / args.tick_rate
+        await asyncio.sleep(npc.rng.uniform(0, interval))  # 错开各 NPC 的发送相位
+        last = time.perf_counter()
+        while not stop.is_set():
+            now = time.perf_counter()
+            npc.step(now - last)
+            last = now
+            frame = npc.frame(template, npcs, args.stream, args.deadline_ms)
+            async with send_lock:
+                pending[frame["request_id"]] = (npc.id, time.perf_counter())
+                if binary:
+                    message = encoders[npc.id].encode(dict(frame, entities=entities))
+                    await ws.send_bytes(message)
+                    stats.bytes_sent += len(message)
+                else:
+                    message = encode_frame(frame, entities_json)
+                    await ws.send_str(message)
+                    stats.bytes_sent += len(message.encode("utf-8"))
+            stats.sent += 1
+            stats.frames += 1
+            try:
+                await asyncio.wait_for(stop.wait(), interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def drive_batch():
+        interval = 1 / args.tick_rate
+        last = time.perf_counter()
+        while not stop.is_set():
+            now = time.perf_counter()
+            frames = []
+            for npc in npcs:
+                npc.step(now - last)
+                frames.append(npc.frame(template, npcs, args.stream, args.deadline_ms))
+            last = now
+            batch = batch_frame(template, frames)
+            async with send_lock:
+                sent_at = time.perf_counter()
+                for npc, frame in zip(npcs, frames):
+                    pending[frame["request_id"]] = (npc.id, sent_at)
+                if binary:
+                    message = WireProtocol.pack(dict(batch, entities=entities))
+                    await ws.send_bytes(message)
+                    stats.bytes_sent += len(message)
+                else:
+                    message = encode_frame(batch, entities_json)
+                    await ws.send_str(message)
+                    stats.bytes_sent += len(message.encode("utf-8"))
+            stats.sent += len(frames)
+            stats.frames += 1
+            try:
+                await asyncio.wait_for(stop.wait(), max(0.0, interval - (time.perf_counter() - now)))
+            except asyncio.TimeoutError:
+                pass
+
+    read_task = asyncio.create_task(reader())
+    try:
+        if args.batch:
+            await drive_batch()
+        else:
+            await asyncio.gather(*(drive(npc) for npc in npcs))
+        # 停止发送后等待在途请求完成
+        deadline = time.perf_counter() + args.drain_timeout
+        while pending and time.perf_counter() < deadline and not read_task.done():
+            await asyncio.sleep(0.05)
+    except (aiohttp.ClientError, ConnectionResetError) as e:
+        stats.errors += 1
+        print(f" [Bench] Godot 连接异常: {e}")
+    finally:
+        stats.lost += len(pending)
+        await ws.close()
+        read_task.cancel()
+        try:
+            await read_task
+        except (asyncio.CancelledError, aiohttp.ClientError):
+            pass
+
+async def web_client(session: aiohttp.ClientSession, url: str, stats: LoadStats, stop: asyncio.Event):
+    """Web 看板客户端：只接收广播并计数"""
+    try:
+        async with session.ws_connect(url, max_msg_size=0) as ws:
+            stats.web_clients_connected += 1
+
+            async def receive():
+                async for msg in ws:
+                    if msg.type == aiohttp.WSMsgType.TEXT:
+                        stats.web_messages += 1
+
+            receiver = asyncio.create_task(receive())
+            await stop.wait()
+            receiver.cancel()
+    except aiohttp.ClientError as e:
+        print(f" [Bench] Web 客户端连接失败: {e}")
+
+def parse_stage_histograms(text: str) -> dict:
+    """从 Prometheus 文本中取出 stage_duration_seconds：{stage: {"buckets": {le: 累计数}, "sum", "count"}}"""
+    stages = {}
+    for line in text.splitlines():
+        match = _SAMPLE_RE.match(line)
+        if not match or not match.group(1).startswith(STAGE_METRIC):
+            continue
+        name, labels, value = match.group(1), dict(_LABEL_RE.findall(match.group(2))), float(match.group(3))
+        stage = stages.setdefault(labels.get("stage", ""), {"buckets": {}, "sum": 0.0, "count": 0.0})
+        if name == STAGE_METRIC + "_bucket":
+            stage["buckets"][labels["le"]] = value
+        elif name == STAGE_METRIC + "_sum":
+            stage["sum"] = value
+        elif name == STAGE_METRIC + "_count":
+            stage["count"] = value
+    return stages
+
+def stage_breakdown(before: dict, after: dict) -> dict:
+    """两次抓取之间各阶段的次数、平均耗时与 p95 (按分桶上界估算)"""
+    breakdown = {}
+    for stage, series in after.items():
+        prev = before.get(stage, {"buckets": {}, "sum": 0.0, "count": 0.0})
+        count = series["count"] - prev["count"]
+        if count <= 0:
+            continue
+        p95 = None
+        for le, cumulative in sorted(series["buckets"].items(), key=lambda kv: float(kv[0])):
+            if cumulative - prev["buckets"].get(le, 0) >= 0.95 * count:
+                p95 = float(le)
+                break
+        breakdown[stage] = {
+            "count": int(count),
+            "mean_ms": (series["sum"] - prev["sum"]) / count * 1000,
+            "p95_ms": p95 * 1000 if p95 is not None else None,
+        }
+    return breakdown
+
+async def scrape_stages(session: aiohttp.ClientSession, url: str) -> dict:
+    try:
+        async with session.get(url) as resp:
+            if resp.status != 200:
+                return {}
+            return parse_stage_histograms(await resp.text())
+    except aiohttp.ClientError:
+        return {}
+
+async def scrape_cpu(session: aiohttp.ClientSession, url: str):
+    """gateway 进程累计的 CPU 秒数；抓取失败时返回 None"""
+    try:
+        async with session.get(url) as resp:
+            if resp.status != 200:
+                return None
+            text = await resp.text()
+    except aiohttp.ClientError:
+        return None
+    for line in text.splitlines():
+        if line.startswith(CPU_METRIC + " "):
+            return float(line.split()[1])
+    return None
+
+async def fetch_json(session: aiohttp.ClientSession, url: str) -> dict:
+    try:
+        async with session.get(url) as resp:
+            return await resp.json() if resp.status == 200 else {}
+    except aiohttp.ClientError:
+        return {}
+
+async def wait_for_backends(session: aiohttp.ClientSession, url: str, timeout: float) -> bool:
+    """等待 gateway 的健康检查把 AI 后端标记为可用 (桩后端晚于 gateway 启动时需要)"""
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            async with session.get(url) as resp:
+                if resp.status == 200:
+                    backends = (await resp.json()).get("backends", [])
+                    if any(b.get("healthy") and b.get("breaker") != "open" for b in backends):
+                        return True
+        except aiohttp.ClientError:
+            pass
+        await asyncio.sleep(0.5)
+    return False
+
+async def run(args) -> tuple:
+    template = json.load(open(args.template, encoding="utf-8"))
+    if args.entities:
+        template = build_world(template, args.entities, seed=args.seed)
+    entities = template.pop("entities", [])
+    entities_json = json.dumps(entities, ensure_ascii=False)
+    rng = random.Random(args.seed)
+    base = args.gateway.rstrip("/")
+    ws_base = base.replace("http://", "ws://").replace("https://", "wss://")
+
+    stub = None
+    if args.stub:
+        stub = StubBackend(args.stub_latency, args.stub_jitter, args.stub_fail_rate, seed=args.seed,
+                           name="bench", distribution=args.stub_distribution,
+                           warning_rate=args.stub_warning_rate, max_actions=args.stub_max_actions,
+                           concurrency=args.stub_concurrency)
+        await stub.start(args.stub_port)
+        print(f" [Bench] 桩后端已启动: {stub.url}")
+
+    stats = LoadStats()
+    stop = asyncio.Event()
+    timeout = aiohttp.ClientTimeout(total=None, sock_connect=5)
+    try:
+        async with aiohttp.ClientSession(timeout=timeout) as session:
+            if not await wait_for_backends(session, base + "/ai/stats", args.backend_wait):
+                print(" [Bench] gateway 没有可用的 AI 后端，决策将全部为兜底结果")
+            stages_before = await scrape_stages(session, base + "/metrics")
+            cpu_before = await scrape_cpu(session, base + "/metrics")
+            clients = []
+            for c in range(args.clients):
+                npcs = [SimNPC(c * args.npcs + i, template, random.Random(rng.random()), prefix=args.npc_prefix)
+                        for i in range(args.npcs)]
+                clients.append(godot_client(session, ws_base + "/ws", npcs, template, entities, entities_json,
+                                            args, stats, stop))
+            webs = [web_client(session, ws_base + "/ws/web", stats, stop) for _ in range(args.web_clients)]
+
+            start = time.perf_counter()
+            tasks = [asyncio.create_task(coro) for coro in clients + webs]
+            await asyncio.sleep(args.duration)
+            stop.set()
+            await asyncio.gather(*tasks)
+            elapsed = time.perf_counter() - start
+            stages_after = await scrape_stages(session, base + "/metrics")
+            cpu_after = await scrape_cpu(session, base + "/metrics")
+            plan_stats = await fetch_json(session, base + "/plan/stats")
+    finally:
+        if stub is not None:
+            await stub.stop()
+
+    latencies = sorted(stats.latencies)
+    results = {
+        "requests_sent": stats.sent,
+        "decisions": stats.decisions,
+        "superseded": stats.superseded,
+        "lost": stats.lost,
+        "errors": stats.errors,
+        "throughput_per_s": stats.decisions / elapsed if elapsed else 0.0,
+        "latency_mean_ms": sum(latencies) / len(latencies) * 1000 if latencies else 0.0,
+        "latency_p50_ms": (percentile(latencies, 0.50) or 0.0) * 1000,
+        "latency_p95_ms": (percentile(latencies, 0.95) or 0.0) * 1000,
+        "latency_p99_ms": (percentile(latencies, 0.99) or 0.0) * 1000,
+        "cache_hit_rate": stats.cache_hits / stats.decisions if stats.decisions else 0.0,
+        "fallback_decisions": stats.fallback_decisions,
+        "web_messages_per_s": stats.web_messages / elapsed if elapsed else 0.0,
+        "bytes_per_frame": stats.bytes_sent / stats.frames if stats.frames else 0.0,
+        "resyncs": stats.resyncs,
+        "shed": stats.admission.get("shed", 0),
+        "degraded": stats.admission.get("degraded", 0),
+        "late_decisions": stats.late,
+    }
+    # gateway CPU (含停止发送后处理在途请求的部分)：每个 tick 为所有连接上的全部 NPC 各一次决策请求
+    if cpu_before is not None and cpu_after is not None and stats.sent:
+        ticks = stats.sent / (args.clients * args.npcs)
+        results["gateway_cpu_per_tick_ms"] = (cpu_after - cpu_before) / ticks * 1000
+        results["gateway_cpu_per_request_ms"] = (cpu_after - cpu_before) / stats.sent * 1000
+    # 计划缓存的统计是 gateway 启动以来的累计值，对比时应使用新启动的 gateway
+    for key in ("llm_calls_per_npc_minute", "llm_calls_per_npc_minute_without_plans"):
+        if key in plan_stats:
+            results[key] = plan_stats[key]
+    stages = stage_breakdown(stages_before, stages_after)
+    for stage, row in stages.items():
+        results[f"stage_{stage}_mean_ms"] = row["mean_ms"]
+        if row["p95_ms"] is not None:
+            results[f"stage_{stage}_p95_ms"] = row["p95_ms"]
+    if stub is not None:
+        results["backend_requests"] = stub.requests
+        results["backend_max_in_flight"] = stub.max_in_flight
+        results["backend_expired"] = stub.expired
+    return results, stages, stats
+
+def report(results: dict, stages: dict, stats: LoadStats, args):
+    npc_total = args.clients * args.npcs
+    print(f" [Bench] {args.clients} 个 Godot 连接 × {args.npcs} NPC = {npc_total} NPC, "
+          f"{args.tick_rate} 次/秒/NPC, 持续 {args.duration}s, Web 客户端 {stats.web_clients_connected}")
+    print("| 发送 | 决策 | 兜底 | 被取代 | 未返回 | 错误 | 吞吐(决策/s) | p50(ms) | p95(ms) | p99(ms) | 缓存命中 |")
+    print("| ---: | ---: | ---: | ---: | ---: | ---: | ---: | ---: | ---: | ---: | ---: |")
+    print(f"| {results['requests_sent']} | {results['decisions']} | {results['fallback_decisions']} | "
+          f"{results['superseded']} | {results['lost']} | "
+          f"{results['errors']} | {results['throughput_per_s']:.1f} | {results['latency_p50_ms']:.1f} | "
+          f"{results['latency_p95_ms']:.1f} | {results['latency_p99_ms']:.1f} | {results['cache_hit_rate']:.1%} |")
+    if stages:
+        print("| 阶段 | 次数 | 平均(ms) | p95(ms, 分桶上界) |")
+        print("| :--- | ---: | ---: | ---: |")
+        for stage, row in sorted(stages.items(), key=lambda kv: -kv[1]["mean_ms"]):
+            p95 = f"{row['p95_ms']:.1f}" if row["p95_ms"] is not None else "> 30000"
+            print(f"| {stage} | {row['count']} | {row['mean_ms']:.3f} | {p95} |")
+    else:
+        print(" [Bench] 未能从 /metrics 获取阶段耗时")
+    print(f" [Bench] 线协议 {args.protocol}{' (批量帧)' if args.batch else ''}: "
+          f"平均 {results['bytes_per_frame']:.0f} 字节/帧, 重新同步 {results['resyncs']} 次")
+    if "gateway_cpu_per_tick_ms" in results:
+        print(f" [Bench] gateway CPU: {results['gateway_cpu_per_tick_ms']:.1f} ms/tick, "
+              f"{results['gateway_cpu_per_request_ms']:.2f} ms/请求")
+    if args.deadline_ms:
+        print(f" [Bench] 截止时间 {args.deadline_ms}ms: 放弃 {results['shed']} / 降级 {results['degraded']} 个请求, "
+              f"{results['late_decisions']} 个决策晚于截止时间"
+              + (f", 后端丢弃 {results['backend_expired']} 个过期请求" if "backend_expired" in results else ""))
+    if "llm_calls_per_npc_minute" in results:
+        print(f" [Bench] 计划缓存: 每 NPC 分钟 {results['llm_calls_per_npc_minute']} 次 LLM 调用 "
+              f"(无计划缓存 {results['llm_calls_per_npc_minute_without_plans']} 次)")
+    if args.web_clients:
+        print(f" [Bench] Web 广播: {results['web_messages_per_s']:.1f} 条/秒 (所有看板客户端合计)")
+
+def build_parser(description: str = "gateway 无头压测") -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("--gateway", default="http://127.0.0.1:8765", help="gateway 地址")
+    parser.add_argument("--template", default="map_dump.json", help="Godot 帧模板")
+    parser.add_argument("--entities", type=int, default=0, help="把模板的实体扩展到该数量 (0 为保持原样)")
+    parser.add_argument("--clients", type=int, default=2, help="Godot WebSocket 连接数")
+    parser.add_argument("--npcs", type=int, default=10, help="每个连接上的 NPC 数")
+    parser.add_argument("--tick-rate", type=float, default=1.0, help="每个 NPC 每秒的决策请求数")
+    parser.add_argument("--duration", type=float, default=20.0, help="压测时长 (秒)")
+    parser.add_argument("--drain-timeout", type=float, default=10.0, help="停止发送后等待在途请求的时间")
+    parser.add_argument("--web-clients", type=int, default=0, help="同时挂载的 Web 看板客户端数")
+    parser.add_argument("--stream", action="store_true", help="请求流式动作")
+    parser.add_argument("--protocol", choices=("json", "msgpack-delta"), default="json", help="Godot 连接的线协议")
+    parser.add_argument("--batch", action="store_true", help="每个 tick 把连接上的所有 NPC 合并为一条批量帧")
+    parser.add_argument("--npc-prefix", default="bench_npc", help="NPC id 前缀 (多次运行时避免复用上一次的计划与缓存)")
+    parser.add_argument("--deadline-ms", type=int, default=0, help="每个请求携带的时间预算 (毫秒，0 为使用 gateway 默认值)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--backend-wait", type=float, default=15.0, help="开始前等待 AI 后端可用的最长时间")
+    parser.add_argument("--stub", action="store_true", help="在本进程内启动 /generate 桩后端")
+    parser.add_argument("--stub-port", type=int, default=8000)
+    parser.add_argument("--stub-latency", type=float, default=0.5)
+    parser.add_argument("--stub-jitter", type=float, default=0.1)
+    parser.add_argument("--stub-distribution", choices=LATENCY_DISTRIBUTIONS, default="uniform")
+    parser.add_argument("--stub-fail-rate", type=float, default=0.0)
+    parser.add_argument("--stub-warning-rate", type=float, default=0.0)
+    parser.add_argument("--stub-max-actions", type=int, default=0)
+    parser.add_argument("--stub-concurrency", type=int, default=0, help="桩后端同时推理的请求数上限 (0 为不限)")
+    parser.add_argument("--save", help="把结果保存为基线 JSON")
+    parser.add_argument("--compare", help="与已保存的基线比较，退化超过阈值时退出码为 1")
+    parser.add_argument("--threshold", type=float, default=0.1, help="判定退化的相对变化阈值")
+    return parser
+
+def main():
+    args = build_parser().parse_args()
+
+    results, stages, stats = asyncio.run(run(args))
+    report(results, stages, stats, args)
+    config = {k: v for k, v in vars(args).items() if k not in ("save", "compare", "threshold")}
+    if args.save:
+        save_baseline(args.save, "gateway", results, config)
+    if args.compare:
+        regressions = compare_baseline(args.compare, results, args.threshold)
+        if regressions:
+            print(f" [Bench] FAILED: {len(regressions)} 项指标退化: {', '.join(regressions)}")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+import argparse
+import asyncio
+import time
+from ResponseParser import extract_json, StreamingDecisionParser
+
+# 模拟 DeepSeek-R1 的一次完整输出：思维链 + 决策 JSON + 闭合后仍继续生成的多余文字
+SAMPLE_OUTPUT = (
+    "<think>\n"
+    + ("现在饱食度只有17，含水量96，生命值100。背包里有胡萝卜、纯净水和胡萝卜种子。"
+      "饱食度低于0会扣血，所以应该先吃胡萝卜补充饱食度。然后可以去 seedLayer 种植种子，"
+      "种植之后需要浇水，纯净水在背包里还有3个。purifiedWaterLayer 在 (544,136)，"
+      "是禁止进入区域，只能在附近交互获取纯净水。\n") * 4
+    + "</think>\n"
+    "{\"thought\": \"饱食度偏低，先吃胡萝卜，再去种地\", \"text\": \"先填饱肚子再干活\", "
+    "\"experience\": \"饱食度低于20时应优先进食\", \"actions\": ["
+    "{ \"type\": \"use\", \"item_name\": \"胡萝卜\" }, "
+    "{ \"type\": \"move\", \"pos\": [376, 160] }, "
+    "{ \"type\": \"use\", \"item_name\": \"胡萝卜种子\" }, "
+    "{ \"type\": \"use\", \"item_name\": \"纯净水\" }"
+    "]}\n"
+    + ("以上是我的决策。接下来我会继续观察饱食度与含水量的变化，如果含水量降低到50以下，"
+    "我会优先前往净水点交互获取纯净水，并在种植完成后及时收割胡萝卜。") * 3
+)
+
+def tokenize(text: str, chars_per_token: int = 2) -> list:
+    """粗略切分为 token，中文约 1~2 字一个 token"""
+    return [text[i:i + chars_per_token] for i in range(0, len(text), chars_per_token)]
+
+async def stub_token_stream(tokens: list, token_latency: float):
+    """按固定的单 token 延迟逐个产出 token，模拟流式解码"""
+    for token in tokens:
+        await asyncio.sleep(token_latency)
+        yield token
+
+async def run_blocking(tokens: list, token_latency: float) -> dict:
+    """现状：等待完整输出后再 extract_json"""
+    start = time.perf_counter()
+    parts = []
+    async for token in stub_token_stream(tokens, token_latency):
+        parts.append(token)
+    parse_start = time.perf_counter()
+    decision = extract_json("".join(parts))
+    end = time.perf_counter()
+    assert decision is not None
+    return {
+        "first_action_s": end - start,
+        "decision_s": end - start,
+        "tokens_generated": len(tokens),
+        "parse_ms": (end - parse_start) * 1000,
+    }
+
+async def run_streaming(tokens: list, token_latency: float) -> dict:
+    """流式：增量解析，动作闭合即产出，决策对象闭合即停止生成"""
+    parser = StreamingDecisionParser()
+    start = time.perf_counter()
+    first_action = None
+    parse_time = 0.0
+    generated = 0
+    async for token in stub_token_stream(tokens, token_latency):
+        generated += 1
+        t0 = time.perf_counter()
+        events = parser.feed(token)
+        parse_time += time.perf_counter() - t0
+        if first_action is None and any(kind == "action" for kind, _ in events):
+            first_action = time.perf_counter() - start
+        if parser.done:
+            break
+    end = time.perf_counter()
+    assert parser.decision is not None
+    return {
+        "first_action_s": first_action,
+        "decision_s": end - start,
+        "tokens_generated": generated,
+        "parse_ms": parse_time * 1000,
+    }
+
+def bench_parse_cost(text: str, tokens: list, rounds: int = 2000):
+    """纯解析开销：整段 extract_json vs 增量解析器逐 token 喂入"""
+    start = time.perf_counter()
+    for _ in range(rounds):
+        extract_json(text)
+    regex_us = (time.perf_counter() - start) / rounds * 1e6
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        parser = StreamingDecisionParser()
+        for token in tokens:
+            parser.feed(token)
+            if parser.done:
+                break
+    stream_us = (time.perf_counter() - start) / rounds * 1e6
+    print(f" [Bench] 解析开销: extract_json {regex_us:.1f} us/次, 增量解析 {stream_us:.1f} us/次 (含逐 token 调用)")
+
+async def main(args):
+    tokens = tokenize(SAMPLE_OUTPUT, args.chars_per_token)
+    print(f" [Bench] 输出共 {len(tokens)} 个 token, 单 token 延迟 {args.token_latency * 1000:.1f} ms")
+    bench_parse_cost(SAMPLE_OUTPUT, tokens)
+
+    blocking = await run_blocking(tokens, args.token_latency)
+    streaming = await run_streaming(tokens, args.token_latency)
+    print("| 模式 | 首个动作(s) | 完整决策(s) | 生成 token 数 | 解析耗时(ms) |")
+    print("| :--- | ---: | ---: | ---: | ---: |")
+    for name, r in (("整段 + extract_json", blocking), ("流式增量解析", streaming)):
+        print(f"| {name} | {r['first_action_s']:.3f} | {r['decision_s']:.3f} | "
+              f"{r['tokens_generated']} | {r['parse_ms']:.3f} |")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="流式 JSON 解析与首个动作延迟基准")
+    parser.add_argument("--token-latency", type=float, default=0.005, help="单 token 解码延迟 (秒)")
+    parser.add_argument("--chars-per-token", type=int, default=2)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,119 @@
+import argparse
+import json
+import sys
+import time
+from MapAnalyzer import SceneRenderer
+from ResponseParser import extract_json
+from TokenBudget import estimate_tokens
+from bench_baseline import save_baseline, compare_baseline
+from bench_map_analyzer import build_world, build_ticks
+from bench_json_stream import SAMPLE_OUTPUT
+import WireProtocol
+
+# 热路径微基准：MapAnalyzer 报告渲染 (冷/热缓存、各报告布局、token 预算)、extract_json，
+# 以及 Godot 帧的线协议 (JSON 全量 / MessagePack 全量 / MessagePack 差量) 的字节数与 gateway 端解码耗时。
+# 耗时单位为 微秒/次 (_us)，消息大小为 字节/帧 (_bytes)，可保存为基线并与之后的运行比较。
+#   python bench_micro.py --save micro_baseline.json
+#   python bench_micro.py --compare micro_baseline.json
+
+# extract_json 的典型输入：正常输出、末尾多余逗号、无 JSON
+EXTRACT_CASES = {
+    "ok": SAMPLE_OUTPUT,
+    "trailing_comma": SAMPLE_OUTPUT.replace("\"纯净水\" }", "\"纯净水\" },", 1),
+    "no_json": SAMPLE_OUTPUT.split("</think>")[0] + "</think>\n我决定先休息一下。",
+}
+
+def timeit(fn, rounds: int) -> float:
+    """返回平均每次调用的耗时 (微秒)"""
+    start = time.perf_counter()
+    for _ in range(rounds):
+        fn()
+    return (time.perf_counter() - start) / rounds * 1e6
+
+def bench_map_analyzer(template: dict, sizes: list, ticks: int) -> dict:
+    results = {}
+    for size in sizes:
+        frames = build_ticks(build_world(template, size), ticks)
+        for layout in ("legacy", "stable"):
+            # 冷缓存：每帧使用新的渲染器；热缓存：同一渲染器连续渲染相邻帧
+            cold = sum(timeit(lambda f=f: SceneRenderer().render(f, max_entities=30, layout=layout), 1)
+                       for f in frames) / len(frames)
+            renderer = SceneRenderer()
+            renderer.render(frames[0], max_entities=30, layout=layout)
+            warm = sum(timeit(lambda f=f: renderer.render(f, max_entities=30, layout=layout), 1)
+                       for f in frames) / len(frames)
+            results[f"map_{layout}_{size}_cold_us"] = cold
+            results[f"map_{layout}_{size}_warm_us"] = warm
+        renderer = SceneRenderer()
+        results[f"map_budgeted_{size}_us"] = sum(
+            timeit(lambda f=f: renderer.render_budgeted(f, 1200, tokenizer=estimate_tokens, max_entities=30), 1)
+            for f in frames
+        ) / len(frames)
+    return results
+
+def bench_extract_json(rounds: int) -> dict:
+    results = {}
+    for name, text in EXTRACT_CASES.items():
+        results[f"extract_json_{name}_us"] = timeit(lambda text=text: extract_json(text), rounds)
+    return results
+
+def bench_wire(template: dict, sizes: list, ticks: int) -> dict:
+    """连续帧 (NPC 移动、约 1% 的实体变化) 的平均字节数与解码耗时；差量的解码包含 unpack 与物化世界"""
+    results = {}
+    for size in sizes:
+        frames = build_ticks(build_world(template, size), ticks)
+        payloads = [json.dumps(f, ensure_ascii=False) for f in frames]
+        results[f"wire_json_{size}_bytes"] = sum(len(p.encode("utf-8")) for p in payloads) / ticks
+        results[f"wire_json_{size}_decode_us"] = sum(timeit(lambda p=p: json.loads(p), 1) for p in payloads) / ticks
+        if not WireProtocol.available():
+            continue
+
+        packed = [WireProtocol.pack(f) for f in frames]
+        results[f"wire_msgpack_{size}_bytes"] = sum(len(p) for p in packed) / ticks
+        results[f"wire_msgpack_{size}_decode_us"] = sum(
+            timeit(lambda p=p: WireProtocol.unpack(p), 1) for p in packed) / ticks
+
+        # 差量：每帧都被立即确认，除第一帧外均相对上一帧编码
+        encoder = WireProtocol.DeltaEncoder("bench")
+        deltas = []
+        for f in frames:
+            deltas.append(encoder.encode(f))
+            encoder.on_ack(encoder.seq)
+        decoder = WireProtocol.DeltaDecoder()
+        decoder.decode(WireProtocol.unpack(deltas[0]))
+        results[f"wire_delta_{size}_bytes"] = sum(len(d) for d in deltas[1:]) / (ticks - 1)
+        results[f"wire_delta_{size}_decode_us"] = sum(
+            timeit(lambda d=d: decoder.decode(WireProtocol.unpack(d)), 1) for d in deltas[1:]) / (ticks - 1)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="MapAnalyzer、extract_json 与线协议微基准")
+    parser.add_argument("--template", default="map_dump.json")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[5, 100, 1000])
+    parser.add_argument("--ticks", type=int, default=50, help="MapAnalyzer 与线协议每组的连续帧数")
+    parser.add_argument("--rounds", type=int, default=2000, help="extract_json 每组调用次数")
+    parser.add_argument("--save", help="把结果保存为基线 JSON")
+    parser.add_argument("--compare", help="与已保存的基线比较，退化超过阈值时退出码为 1")
+    parser.add_argument("--threshold", type=float, default=0.2, help="判定退化的相对变化阈值")
+    args = parser.parse_args()
+
+    template = json.load(open(args.template, encoding="utf-8"))
+    results = bench_map_analyzer(template, args.sizes, args.ticks)
+    results.update(bench_extract_json(args.rounds))
+    results.update(bench_wire(template, args.sizes, args.ticks))
+
+    print("| 基准 | 微秒/次 或 字节/帧 |")
+    print("| :--- | ---: |")
+    for name, value in results.items():
+        print(f"| {name} | {value:.1f} |")
+    config = {"sizes": args.sizes, "ticks": args.ticks, "rounds": args.rounds}
+    if args.save:
+        save_baseline(args.save, "micro", results, config)
+    if args.compare:
+        regressions = compare_baseline(args.compare, results, args.threshold)
+        if regressions:
+            print(f" [Bench] FAILED: {len(regressions)} 项指标退化: {', '.join(regressions)}")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+import asyncio
+import subprocess
+import sys
+import time
+import urllib.request
+from bench_baseline import save_baseline
+from bench_gateway import build_parser, run
+
+# 多 worker 扩展性基准：依次以 1、2、4... 个 worker 启动 gateway (python main.py --workers N)，
+# 用同样的负载压测，比较吞吐与延迟，并检查 Web 客户端是否收到了所有 worker 产生的决策。
+# 默认负载偏向 CPU (大量实体、桩后端低延迟)，让 JSON 解析与报告生成成为瓶颈：
+#   python bench_workers.py --workers-list 1 2 4 --entities 2000 --clients 8 --npcs 5 --tick-rate 4 --stub
+
+def wait_ready(url: str, process: subprocess.Popen, timeout: float) -> bool:
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if process.poll() is not None:
+            return False
+        try:
+            with urllib.request.urlopen(url, timeout=1) as resp:
+                if resp.status == 200:
+                    return True
+        except OSError:
+            pass
+        time.sleep(0.5)
+    return False
+
+def run_with_workers(workers: int, args) -> dict:
+    port = args.port
+    process = subprocess.Popen(
+        [sys.executable, "main.py", "--workers", str(workers), "--port", str(port), "--host", "127.0.0.1"],
+        stdout=subprocess.DEVNULL if not args.verbose else None,
+        stderr=subprocess.DEVNULL if not args.verbose else None,
+    )
+    try:
+        args.gateway = f"http://127.0.0.1:{port}"
+        if not wait_ready(args.gateway + "/metrics", process, args.startup_timeout):
+            raise RuntimeError(f"{workers} 个 worker 的 gateway 未能在 {args.startup_timeout}s 内启动")
+        results, _, stats = asyncio.run(run(args))
+    finally:
+        process.terminate()
+        try:
+            process.wait(10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+    # 每条决策都应送达每个 Web 客户端，无论两者是否在同一个 worker 上
+    expected = stats.decisions * stats.web_clients_connected
+    results["web_delivery_ratio"] = stats.web_messages / expected if expected else 0.0
+    return results
+
+def main():
+    parser = build_parser("gateway 多 worker 扩展性基准")
+    parser.add_argument("--workers-list", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--startup-timeout", type=float, default=90.0, help="等待 gateway 启动的最长时间 (含 MongoDB 索引创建)")
+    parser.add_argument("--verbose", action="store_true", help="显示 gateway 的日志")
+    parser.set_defaults(entities=2000, clients=8, npcs=5, tick_rate=4.0, duration=20.0, web_clients=2,
+                        stub=True, stub_latency=0.02, stub_jitter=0.005)
+    args = parser.parse_args()
+
+    rows = {}
+    for workers in args.workers_list:
+        print(f" [Bench] {workers} 个 worker ...")
+        rows[workers] = run_with_workers(workers, args)
+
+    base = rows[args.workers_list[0]]["throughput_per_s"] or 1.0
+    print("| worker 数 | 吞吐(决策/s) | 加速比 | p50(ms) | p95(ms) | p99(ms) | 被取代 | Web 送达率 |")
+    print("| ---: | ---: | ---: | ---: | ---: | ---: | ---: | ---: |")
+    for workers, r in rows.items():
+        print(f"| {workers} | {r['throughput_per_s']:.1f} | {r['throughput_per_s'] / base:.2f}x | "
+              f"{r['latency_p50_ms']:.1f} | {r['latency_p95_ms']:.1f} | {r['latency_p99_ms']:.1f} | "
+              f"{r['superseded']} | {r['web_delivery_ratio']:.1%} |")
+
+    if args.save:
+        results = {}
+        for workers, r in rows.items():
+            results[f"workers_{workers}_throughput_per_s"] = r["throughput_per_s"]
+            results[f"workers_{workers}_latency_p95_ms"] = r["latency_p95_ms"]
+            results[f"workers_{workers}_speedup"] = r["throughput_per_s"] / base
+        config = {k: v for k, v in vars(args).items() if k not in ("save", "compare", "threshold", "gateway")}
+        save_baseline(args.save, "workers", results, config)
+
+if __name__ == "__main__":
+    main()
@@ -1,32 +1,163 @@
+import argparse
 import asyncio
+import base64
 import json
-import aiohttp
+import logging
+import multiprocessing
+import os
+import time
 import uvicorn
-from typing import List
+from typing import Dict, List, Optional
 from datetime import datetime
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from bson import ObjectId
+from fastapi import FastAPI, HTTPException, Query, WebSocket, WebSocketDisconnect
+from fastapi.responses import Response, StreamingResponse
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, DESCENDING
+from RequestPipeline import RequestPipeline
+from DecisionCache import DecisionCache
+from TokenBudget import estimate_tokens, load_tokenizer
+from MongoWriter import WriteBehindBuffer
+from ReportStore import ReportStore, CHUNK_FIELD
+from PromptTemplate import NPC_SYSTEM_PROMPTS
+from BackendPool import BackendPool, DeadlineExceeded
+from AdmissionControl import AdmissionController
+from ReflexRules import ReflexEngine, load_rules
+from PlanCache import PlanCache, load_triggers
+from NavGrid import NavGridCache
+from MemoryIndex import MemoryIndex, scene_query
+from BroadcastBus import create_bus, run_hub
+import WireProtocol
+from Metrics import REGISTRY, CONTENT_TYPE, span, snapshot_samples
+from AsyncLogging import setup_logging
+
+setup_logging()
+logger = logging.getLogger(__name__)
+
+moves_total = REGISTRY.counter("gateway_moves_total", "Move actions checked against the nav grid", ("result",))
+decisions_total = REGISTRY.counter("gateway_decisions_total", "Decisions returned to Godot", ("source",))
+ws_messages_total = REGISTRY.counter("gateway_ws_messages_total", "Messages received from Godot", ("type",))
+ws_frame_bytes = REGISTRY.histogram(
+    "gateway_ws_frame_bytes", "Size of messages received from Godot", ("protocol",),
+    buckets=(256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+)
+ws_frames_total = REGISTRY.counter("gateway_ws_frames_total", "World frames received from Godot", ("protocol", "kind"))
+admission_total = REGISTRY.counter("gateway_admission_total", "AI requests by admission decision", ("decision",))
+batch_frame_npcs = REGISTRY.histogram("gateway_batch_frame_npcs", "NPCs carried by each batched frame",
+                                      buckets=(1, 5, 10, 25, 50, 100, 200, 500, 1000))
 
 # --- Connection Manager ---
+class WebClient:
+    """单个 Web 客户端：独立的有界发送队列 + 写协程，订阅的 npc_id 子集 (None 表示全部)"""
+    def __init__(self, websocket: WebSocket, max_queue: int):
+        self.websocket = websocket
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self.subscriptions: Optional[set] = None
+        self.writer: Optional[asyncio.Task] = None
+
+    def wants(self, npc_id: Optional[str]) -> bool:
+        return self.subscriptions is None or npc_id is None or npc_id in self.subscriptions
+
 class ConnectionManager:
-    def __init__(self):
-        self.active_connections: List[WebSocket] = []
+    """
+    Web 客户端广播：
+    1. broadcast 只把已序列化的消息放入各客户端队列，立即返回，不等待任何客户端。
+    2. 每个客户端由自己的写协程发送；慢客户端队列满时按 lag_policy 丢弃最旧消息或直接断开。
+    """
+    def __init__(self, max_queue: int = 100, lag_policy: str = "drop_oldest"):
+        self.max_queue = max_queue
+        self.lag_policy = lag_policy
+        self.clients: Dict[WebSocket, WebClient] = {}
+        # 指标
+        self.broadcasts = 0
+        self.sent = 0
+        self.dropped = 0
+        self.lag_disconnects = 0
+        self.total_send_latency = 0.0
+        self.max_send_latency = 0.0
 
-    async def connect(self, websocket: WebSocket):
+    @property
+    def active_connections(self) -> List[WebSocket]:
+        return list(self.clients)
+
+    async def connect(self, websocket: WebSocket, npc_ids: Optional[set] = None):
         await websocket.accept()
-        self.active_connections.append(websocket)
+        client = WebClient(websocket, self.max_queue)
+        client.subscriptions = npc_ids
+        client.writer = asyncio.create_task(self._writer(client))
+        self.clients[websocket] = client
 
     def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
+        # 可能被写协程与接收循环各调用一次，重复移除时直接忽略
+        client = self.clients.pop(websocket, None)
+        if client is not None and client.writer is not None and client.writer is not asyncio.current_task():
+            client.writer.cancel()
 
-    async def broadcast(self, message: str):
-        for connection in self.active_connections:
-            try:
-                await connection.send_text(message)
-            except Exception as e:
-                print(f" [Error] Broadcasting failed: {e}")
+    def subscribe(self, websocket: WebSocket, npc_ids: Optional[list]):
+        client = self.clients.get(websocket)
+        if client is not None:
+            client.subscriptions = set(npc_ids) if npc_ids else None
 
-web_connection_manager = ConnectionManager()
+    def broadcast(self, message: str, npc_id: Optional[str] = None):
+        """非阻塞广播：消息只序列化一次，所有客户端共享同一个字符串"""
+        self.broadcasts += 1
+        enqueued_at = time.perf_counter()
+        for websocket, client in list(self.clients.items()):
+            if not client.wants(npc_id):
+                continue
+            if client.queue.full():
+                if self.lag_policy == "disconnect":
+                    self.lag_disconnects += 1
+                    logger.warning(" [System] Web 客户端消费过慢，已断开")
+                    self.disconnect(websocket)
+                    asyncio.create_task(self._close(websocket))
+                    continue
+                client.queue.get_nowait()
+                self.dropped += 1
+            client.queue.put_nowait((message, enqueued_at))
+
+    async def _writer(self, client: WebClient):
+        try:
+            while True:
+                message, enqueued_at = await client.queue.get()
+                await client.websocket.send_text(message)
+                latency = time.perf_counter() - enqueued_at
+                self.sent += 1
+                self.total_send_latency += latency
+                self.max_send_latency = max(self.max_send_latency, latency)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f" [Error] Broadcasting failed: {e}")
+            self.disconnect(client.websocket)
+
+    async def _close(self, websocket: WebSocket):
+        try:
+            await websocket.close(code=1008)
+        except Exception:
+            pass
+
+    def snapshot(self) -> dict:
+        return {
+            "clients": len(self.clients),
+            "queued": sum(c.queue.qsize() for c in self.clients.values()),
+            "broadcasts": self.broadcasts,
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "lag_disconnects": self.lag_disconnects,
+            "avg_send_latency_ms": round(self.total_send_latency / self.sent * 1000, 2) if self.sent else 0,
+            "max_send_latency_ms": round(self.max_send_latency * 1000, 2),
+        }
+
+WEB_CLIENT_QUEUE_SIZE = 100         # 每个 Web 客户端最多积压的消息数
+WEB_CLIENT_LAG_POLICY = "drop_oldest"  # 积压满时: drop_oldest / disconnect
+
+web_connection_manager = ConnectionManager(max_queue=WEB_CLIENT_QUEUE_SIZE, lag_policy=WEB_CLIENT_LAG_POLICY)
+
+# 跨 worker 广播总线：local:// (单进程) / unix:///path (本机中继) / redis://host:6379/0
+# 多 worker 启动时由主进程通过环境变量下发给各 worker，见文件末尾的启动参数
+GATEWAY_BUS_URL = os.environ.get("GATEWAY_BUS_URL", "local://")
+broadcast_bus = create_bus(GATEWAY_BUS_URL)
 
 # 假设 MapAnalyzer 在同级目录下
 try:
@@ -41,147 +172,798 @@ except ImportError:
 app = FastAPI(title="Game AI Gateway")
 
 # --- 配置参数 ---
-VLLM_URL = "http://127.0.0.1:8000/generate"
+# AI_Server 副本列表：按最少在途请求路由，带健康检查与熔断
+AI_BACKENDS = ["http://127.0.0.1:8000"]
+AI_GENERATE_PATH = "/generate"
+AI_STREAM_PATH = "/generate_stream"
+AI_TIMEOUT = 10.0          # 单次整段请求超时 (秒)；流式请求为两次数据之间的最长间隔
+AI_RETRIES = 1             # 失败后换一个后端重试的次数
+AI_HEDGE = False           # 超过该后端 p95 延迟仍未返回时向另一个副本发出对冲请求 (会增加后端负载)
+STREAM_ACTIONS = False  # 默认是否流式转发动作；Godot 也可在单条请求中设置 "stream": true
 MONGO_URI = "mongodb://192.168.31.64:27017"
 DB_NAME = "game_ai_db"
 COLLECTION_NAME = "npc_history"
+CHUNK_COLLECTION_NAME = "scene_chunks"  # 场景报告块 (内容寻址、压缩存储)
+MAX_IN_FLIGHT = 8  # 单条 Godot 连接上同时在途的决策请求上限
+# 批量帧 ({"type": "batch_frame", 共享的 entities/map_metadata, "npcs": [...]})：世界只解析、分析一次，
+# 同一批 NPC 的 AI 请求全部并发发出，连接的在途上限随之提高到批大小 (不超过该值)
+BATCH_MAX_IN_FLIGHT = 256
+# /ws 的二进制线协议 (MessagePack + 实体差量，见 WireProtocol.py)：客户端在握手时协商，未协商或未安装 msgpack 时为 JSON
+WIRE_BINARY_ENABLED = True
+WIRE_DELTA_HISTORY = 8  # 每个 NPC 保留的已确认快照数，应不小于客户端未确认的在途帧数
+REPORT_MAX_ENTITIES = 30  # 环境报告只列出最近的 K 个实体，避免超出 max_model_len
+REPORT_RADIUS = None      # 可选：只列出该半径 (像素) 内的实体
+# 环境报告的 token 预算：max_model_len(4096) - 静态规则与角色设定 - 输出预留
+REPORT_TOKEN_BUDGET = 1200
+# 报告布局：legacy 为原有布局；stable 按稳定程度排序，配合 AI_Server 的 ENABLE_PREFIX_CACHING 提高前缀复用
+# (可先用 prefix_reuse.py 离线评估两种布局的共享前缀长度)
+REPORT_LAYOUT = "legacy"
+TOKENIZER_PATH = None     # 填写模型目录可使用真实分词器计数，否则使用离线估算
+# 占据栅格：由 nav_polygons 与 has_physics_layer 实体的 rect 按地图构建一次并缓存，
+# 用于把 AI 返回的越界/落在障碍内的 move.pos 吸附到最近的可行走位置
+NAV_CELL_SIZE = 16.0      # 栅格单元边长 (像素)，越小越精确、构建与寻路越慢
+NAV_MAX_MAPS = 8
+REPORT_PATH_DISTANCE = False  # 报告中的距离改为绕开障碍的路径距离 (不可达的目标排在最后)
+
+count_tokens = load_tokenizer(TOKENIZER_PATH) if TOKENIZER_PATH else estimate_tokens
+nav_grids = NavGridCache(cell_size=NAV_CELL_SIZE, max_maps=NAV_MAX_MAPS)
+
+def fix_moves(decision, grid, count: bool = True):
+    """校验并吸附决策中的 move 动作，按结果计数；count=False 时只吸附 (流式下发时已逐个计数)"""
+    for result in nav_grids.fix_moves(decision, grid, count):
+        if count:
+            moves_total.inc(result=result)
+
+# --- 决策缓存参数 (分桶越粗命中率越高，但决策越可能滞后于真实状态) ---
+CACHE_STAT_BUCKET = 10.0   # 饱食度/含水量等数值的分桶宽度
+CACHE_POS_BUCKET = 16.0    # 坐标分桶宽度 (像素)
+CACHE_TTL = 30.0           # 缓存决策的有效期 (秒)
+CACHE_MAX_ENTRIES = 2048
+CACHE_MAX_BYTES = 16 * 1024 * 1024
+
+# --- 反射层参数：简单场景 (睡觉、死亡、缺水且有水) 由规则直接决策，不调用模型 ---
+REFLEX_MODE = "on"         # on: 命中规则时绕过 LLM；shadow: 仍请求 LLM 并比较两者；off: 关闭
+REFLEX_RULES_PATH = None   # 规则 JSON 文件，未填写时使用 ReflexRules.DEFAULT_RULES
+
+reflex_engine = ReflexEngine(load_rules(REFLEX_RULES_PATH) if REFLEX_RULES_PATH else None, mode=REFLEX_MODE)
+
+# --- 计划缓存：LLM 给出的 actions 序列按帧逐步下发，触发器成立或计划执行完毕才再次请求 LLM ---
+PLAN_ENABLED = True
+PLAN_TRIGGERS_PATH = None  # 触发器 JSON 文件，未填写时使用 PlanCache.DEFAULT_TRIGGERS
+PLAN_MAX_AGE = 60.0        # 计划最长执行时间 (秒)，超时后重新规划
+PLAN_STEP_TIMEOUT = 15.0   # 单步最长执行时间 (秒)，超时视为失败
+PLAN_ARRIVE_RADIUS = 24.0  # move 到达判定半径 (像素)
+
+plan_cache = PlanCache(load_triggers(PLAN_TRIGGERS_PATH) if PLAN_TRIGGERS_PATH else None, max_age=PLAN_MAX_AGE,
+                       step_timeout=PLAN_STEP_TIMEOUT, arrive_radius=PLAN_ARRIVE_RADIUS)
+
+decision_cache = DecisionCache(
+    stat_bucket=CACHE_STAT_BUCKET,
+    pos_bucket=CACHE_POS_BUCKET,
+    ttl=CACHE_TTL,
+    max_entries=CACHE_MAX_ENTRIES,
+    max_bytes=CACHE_MAX_BYTES,
+)
+
+# --- 截止时间与准入控制 ---
+# Godot 可在请求中携带 deadline_ms (自发出起的时间预算，毫秒)，未携带时使用 DECISION_DEADLINE；
+# 剩余时间随请求下发给 AI_Server，排队中已过期的请求不再推理
+DECISION_DEADLINE = AI_TIMEOUT     # 默认时间预算 (秒)
+ADMISSION_ENABLED = True           # 按最近延迟估计能否按时完成，来不及的请求降级或直接放弃
+ADMISSION_MIN_SAMPLES = 5          # 延迟样本少于该数量时全部放行
+ADMISSION_SAFETY_MARGIN = 0.05     # 为回传与后处理预留的时间 (秒)
+DEGRADED_MAX_TOKENS = 512          # 降级请求的 max_tokens (AI_Server 默认 2048)
+SHED_REUSE_LAST = True             # 放弃或过期的请求复用该 NPC 最近一次未过期的决策，否则返回兜底文本
+
+admission_control = AdmissionController(min_samples=ADMISSION_MIN_SAMPLES, safety_margin=ADMISSION_SAFETY_MARGIN,
+                                        degraded_ratio=DEGRADED_MAX_TOKENS / 2048)
+
+def request_deadline(raw_data: dict) -> float:
+    """请求的截止时间 (time.monotonic() 时刻)，从 gateway 收到请求时开始计算"""
+    budget = raw_data.get("deadline_ms")
+    budget = budget / 1000 if isinstance(budget, (int, float)) and not isinstance(budget, bool) else DECISION_DEADLINE
+    return time.monotonic() + budget
+
+def fallback_decision(npc_id: str):
+    """放弃或过期的请求：复用该 NPC 最近一次未过期的决策，没有时返回兜底文本"""
+    reused = decision_cache.latest(npc_id) if SHED_REUSE_LAST else None
+    return reused if reused is not None else "AI 无法决策"
+
+# 全局共享的 AI 后端连接池 (keep-alive)，所有 Godot 连接复用
+ai_backends = BackendPool(AI_BACKENDS, timeout=AI_TIMEOUT, stream_read_timeout=AI_TIMEOUT,
+                          retries=AI_RETRIES, hedge=AI_HEDGE)
+
+@app.on_event("startup")
+async def start_broadcast_bus():
+    # 其他 worker 产生的决策投递给本进程的 Web 客户端
+    await broadcast_bus.start(web_connection_manager.broadcast)
+
+@app.on_event("shutdown")
+async def stop_broadcast_bus():
+    await broadcast_bus.close()
+
+@app.on_event("startup")
+async def start_ai_backends():
+    await ai_backends.start()
+
+@app.on_event("shutdown")
+async def stop_ai_backends():
+    await ai_backends.close()
 
 # --- 数据库初始化 ---
 client = AsyncIOMotorClient(MONGO_URI)
 db = client[DB_NAME]
 collection = db[COLLECTION_NAME]
+report_store = ReportStore(db[CHUNK_COLLECTION_NAME])
+
+# --- 写后缓冲参数 ---
+MONGO_QUEUE_SIZE = 10000           # 待写入文档队列上限
+MONGO_BATCH_SIZE = 200             # 单次 insert_many 的文档数
+MONGO_FLUSH_INTERVAL = 0.5         # 未凑满一批时的最长等待 (秒)
+MONGO_OVERFLOW_POLICY = "spill"    # 队列满时: block / drop_oldest / spill
+MONGO_SPILL_PATH = "mongo_spill.jsonl"
+
+mongo_writer = WriteBehindBuffer(
+    collection,
+    max_queue=MONGO_QUEUE_SIZE,
+    batch_size=MONGO_BATCH_SIZE,
+    flush_interval=MONGO_FLUSH_INTERVAL,
+    overflow_policy=MONGO_OVERFLOW_POLICY,
+    spill_path=MONGO_SPILL_PATH,
+    # 历史文档只引用报告块，写入前先把新块落库；溢写到本地时还原为完整报告
+    before_flush=report_store.flush_pending,
+    spill_transform=report_store.inline,
+)
 
-async def save_to_mongo(npc_id: str, scene_report: str, ai_content: any,timestamp:datetime):
-    """将决策数据异步存入 MongoDB"""
+@app.on_event("startup")
+async def start_mongo_writer():
+    mongo_writer.start()
+
+@app.on_event("shutdown")
+async def stop_mongo_writer():
+    # 关闭前把缓冲中的决策全部写入 MongoDB
+    await mongo_writer.close()
+    logger.info(f" [DB] 写后缓冲已排空: {mongo_writer.snapshot()}")
+
+# --- NPC 记忆索引：报告中以检索到的相关记忆代替 Godot 上报的完整 experiences 列表 ---
+MEMORY_ENABLED = True
+MEMORY_TOP_K = 5                      # 每次决策检索的相关记忆条数
+MEMORY_MAX_PER_NPC = 500              # 每个 NPC 保留的记忆条数
+MEMORY_MAX_BYTES = 32 * 1024 * 1024   # 全部记忆文本的字节上限
+MEMORY_REBUILD_LIMIT = 20000          # 启动时从 npc_history 载入的最近决策条数
+
+memory_index = MemoryIndex(max_per_npc=MEMORY_MAX_PER_NPC, max_bytes=MEMORY_MAX_BYTES)
+
+async def rebuild_memory_index():
     try:
-        document = {
-            "npc_id": npc_id,
-            "timestamp": timestamp,
-            "scene_report": scene_report,
-            "ai_content": ai_content
-        }
-        result = await collection.insert_one(document)
-        print(f" [DB] 数据已持久化, ID: {result.inserted_id}")
+        loaded = await memory_index.rebuild(collection, limit=MEMORY_REBUILD_LIMIT)
+        logger.info(f" [Memory] 已从 MongoDB 重建记忆索引: {loaded} 条")
     except Exception as e:
-        print(f" [DB] 存储至 MongoDB 失败: {e}")
+        logger.warning(f" [Memory] 重建记忆索引失败，仅记录本次运行的决策: {e}")
+
+@app.on_event("startup")
+async def start_memory_rebuild():
+    # 后台重建，不阻塞启动；期间到达的决策先缓存在 MemoryIndex 中，重建完成后按到达顺序加入索引
+    if MEMORY_ENABLED:
+        asyncio.create_task(rebuild_memory_index())
+
+async def save_to_mongo(npc_id: str, scene_report: str, ai_content: any, timestamp: datetime):
+    """将决策数据放入写后缓冲，由后台批量存入 MongoDB；场景报告只保存块引用"""
+    document = {
+        "npc_id": npc_id,
+        "timestamp": timestamp,
+        CHUNK_FIELD: report_store.encode(scene_report),
+        "ai_content": ai_content
+    }
+    await mongo_writer.put(document)
+
+async def request_ai(payload: dict, deadline: float = None) -> Optional[dict]:
+    """整段请求 AI 后端，返回后端结果"""
+    return await ai_backends.post_json(AI_GENERATE_PATH, payload, deadline=deadline)
+
+async def request_ai_stream(payload: dict, on_action, deadline: float = None) -> Optional[dict]:
+    """流式请求 AI 后端 (SSE)：每个动作生成完毕即回调 on_action，返回最终结果"""
+    async with ai_backends.stream(AI_STREAM_PATH, payload, deadline=deadline) as resp:
+        if resp.status != 200:
+            logger.warning(f" [AI] 后端响应异常, 状态码: {resp.status}")
+            return None
+        event = None
+        async for raw_line in resp.content:
+            line = raw_line.decode("utf-8").strip()
+            if line.startswith("event:"):
+                event = line[len("event:"):].strip()
+            elif line.startswith("data:"):
+                data = json.loads(line[len("data:"):])
+                if event == "action":
+                    await on_action(data)
+                elif event in ("decision", "error"):
+                    return data
+    return None
+
+def load_nav_grid(raw_data: dict):
+    try:
+        with span("nav_grid"):
+            return nav_grids.get(raw_data)
+    except Exception as e:
+        logger.error(f" [Error] 占据栅格构建失败: {e}")
+        return None
+
+def expand_batch(frame: dict) -> list:
+    """
+    批量帧：共享的世界 (entities、map_metadata 等) 只分析一次 —— 占据栅格、实体指纹、
+    所有 NPC 到实体的距离 (一次批量计算)，返回每个 NPC 的 (raw_data, shared)。
+    raw_data 与单条请求的格式相同 (npcs 中每项的 player_status / request_id / deadline_ms 等覆盖共享字段)，
+    所有 NPC 引用同一个实体列表，不复制。
+    """
+    npcs = [npc for npc in frame.get("npcs") or [] if isinstance(npc, dict)]
+    world = {key: value for key, value in frame.items() if key not in ("type", "npcs")}
+    entities = world.setdefault("entities", [])
+    nav_grid = load_nav_grid(world)
+    with span("batch_world"):
+        entities_key = decision_cache.entities_key(entities)
+        positions = [npc.get("player_status", {}).get("current_pos", [0, 0]) for npc in npcs]
+        try:
+            selections = MapAnalyzer.select_entities_batch(entities, positions, max_entities=REPORT_MAX_ENTITIES,
+                                                           radius=REPORT_RADIUS)
+        except Exception as e:
+            logger.error(f" [Error] 批量实体选择失败: {e}")
+            selections = [None] * len(npcs)
+    batch = []
+    for npc, selection in zip(npcs, selections):
+        shared = {"nav_grid": nav_grid, "entities_key": entities_key, "selection": selection}
+        # 记忆检索只取最近的若干实体，按直线距离排好序的选择结果可直接复用
+        if selection is not None and REPORT_RADIUS is None:
+            shared["nearest"] = [entities[i] for i in selection[0]]
+        batch.append(({**world, **npc}, shared))
+    return batch
+
+async def process_decision(raw_data: dict, request_id: str, emit=None, deadline: float = None,
+                           shared: dict = None) -> dict:
+    """
+    单个 NPC 的完整决策流程：场景分析 -> 请求 AI -> 后台存储，返回回传给 Godot 的结果
+    emit: 流式模式下用于提前下发单个动作的协程
+    deadline: 截止时间 (time.monotonic() 时刻)，用于准入判断并随请求传给 AI 后端
+    shared: 批量帧中由 expand_batch 预先算好的共享分析结果，给出的部分不再逐个计算
+    """
+    player_status = raw_data.get("player_status", {})
+    npc_id = player_status.get("player_id", "unknown_npc")
+    npc_name = player_status.get("player_name", "unknown_npc")
+    shared = shared or {}
+
+    # 1. 场景分析 (控制在 token 预算内，预填充开销可预期)
+    report_tokens = 0
+    start = time.perf_counter()
+    nav_grid = shared["nav_grid"] if "nav_grid" in shared else load_nav_grid(raw_data)
+    memories = None
+    if MEMORY_ENABLED:
+        with span("memory_search"):
+            memories = memory_index.search(npc_id, scene_query(raw_data, nearest=shared.get("nearest")), MEMORY_TOP_K)
+    try:
+        with span("scene_report"):
+            scene_report, report_tokens = MapAnalyzer.get_budgeted_summary(
+                raw_data, REPORT_TOKEN_BUDGET, tokenizer=count_tokens,
+                max_entities=REPORT_MAX_ENTITIES, radius=REPORT_RADIUS, layout=REPORT_LAYOUT,
+                nav=nav_grid if REPORT_PATH_DISTANCE else None, memories=memories,
+                selection=shared.get("selection")
+            )
+    except Exception as e:
+        scene_report = "场景解析异常"
+        logger.error(f" [Error] MapAnalyzer 报错: {e}")
+
+    # 2. 构建 AI Prompt
+    system_prompt = NPC_SYSTEM_PROMPTS[REPORT_LAYOUT]
+
+    # 3. 反射层：规则成立时直接给出决策；影子模式下仅记录，稍后与 LLM 决策比较
+    with span("reflex"):
+        reflex = reflex_engine.match(raw_data)
+    reflex_rule = reflex[0] if reflex is not None and reflex_engine.mode == "on" else None
+
+    # 4. 执行中的计划按步下发；没有计划时查询决策缓存：近似场景直接复用最近一次的决策
+    # 流式请求的动作在生成时已全部下发给 Godot，不使用计划
+    cache_hit = False
+    plan = None
+    from_plan = False
+    streaming = raw_data.get("stream", STREAM_ACTIONS) and emit is not None
+    use_plan = PLAN_ENABLED and not streaming
+    if reflex_rule is not None:
+        ai_content = reflex[1]
+        decisions_total.inc(source="reflex")
+        plan_cache.invalidate(npc_id, "reflex")
+    else:
+        if use_plan:
+            with span("plan_step"):
+                planned = plan_cache.step(npc_id, raw_data)
+            if planned is not None:
+                ai_content, plan = planned
+                from_plan = True
+                decisions_total.inc(source="plan")
+        elif PLAN_ENABLED:
+            plan_cache.invalidate(npc_id, "stream")
+        if not from_plan:
+            fingerprint = decision_cache.fingerprint(raw_data, shared.get("entities_key"))
+            ai_content = decision_cache.get(npc_id, fingerprint)
+            cache_hit = ai_content is not None
+
+    # 5. 未命中时请求 AI 后端：先按剩余时间做准入判断，来不及完成的请求降级 (更小的 max_tokens) 或直接放弃
+    admission = None
+    reused = False  # 放弃或过期时复用的旧决策 (fallback_decision)
+    if reflex_rule is None and not from_plan and not cache_hit:
+        remaining = deadline - time.monotonic() if deadline is not None else None
+        admission = admission_control.decide(remaining) if ADMISSION_ENABLED else "full"
+        admission_total.inc(decision=admission)
+    if admission == "shed":
+        ai_content = fallback_decision(npc_id)
+        reused = True
+        decisions_total.inc(source="shed")
+    elif admission is not None:
+        ai_content = "AI 无法决策"
+        plan_cache.record_llm_call(npc_id)
+        token = admission_control.begin(admission)
+        try:
+            payload = {
+                "system_prompt": system_prompt,
+                "scene_report": scene_report,
+                "temperature": 0.1
+            }
+            if admission == "degraded":
+                payload["max_tokens"] = DEGRADED_MAX_TOKENS
+            if streaming:
+                # 流式：动作逐个生成完毕就先下发给 Godot，NPC 可以提前开始执行
+                async def on_action(data: dict):
+                    fix_moves({"actions": [data.get("action")]}, nav_grid)
+                    await emit({
+                        "type": "ai_action",
+                        "request_id": request_id,
+                        "npc_id": npc_id,
+                        "index": data.get("index"),
+                        "action": data.get("action"),
+                    })
+                with span("ai_request_stream"):
+                    result = await request_ai_stream(payload, on_action, deadline)
+            else:
+                with span("ai_request"):
+                    result = await request_ai(payload, deadline)
+            if result is not None and result.get("status") == "expired":
+                # AI_Server 在排队期间发现请求已过期，没有推理
+                ai_content = fallback_decision(npc_id)
+                reused = True
+                decisions_total.inc(source="ai_expired")
+            elif result is not None:
+                ai_content = result.get("response", result)
+                # 只缓存成功解析出的结构化决策 (move 已吸附到可行走位置)
+                if result.get("status") == "success" and isinstance(ai_content, dict):
+                    with span("move_snap"):
+                        fix_moves(ai_content, nav_grid, count=not streaming)
+                    decision_cache.put(npc_id, fingerprint, ai_content)
+                    decisions_total.inc(source="ai")
+                    if reflex is not None:
+                        reflex_engine.record_shadow(reflex[0], reflex[1], ai_content)
+                else:
+                    decisions_total.inc(source="ai_unparsed")
+            else:
+                decisions_total.inc(source="ai_failed")
+        except asyncio.CancelledError:
+            # 被同一 NPC 的新请求取代：耗时不代表后端延迟，不计入估计
+            admission_control.abandon(token)
+            raise
+        except DeadlineExceeded:
+            ai_content = fallback_decision(npc_id)
+            reused = True
+            decisions_total.inc(source="ai_expired")
+        except Exception as e:
+            decisions_total.inc(source="ai_failed")
+            logger.warning(f" [AI] 请求失败: {e}")
+        admission_control.end(token, met_deadline=deadline is None or time.monotonic() <= deadline)
+    elif cache_hit:
+        decisions_total.inc(source="cache")
+
+    # 新的决策 (LLM 或决策缓存给出) 保存为计划，本帧只下发第一步；
+    # 过载时复用的旧决策只下发这一帧，不作为计划，后端恢复后下一帧即重新请求 LLM
+    decision = ai_content
+    if use_plan and reflex_rule is None and not from_plan and not reused:
+        ai_content, plan = plan_cache.start(npc_id, decision, raw_data)
+
+    timestamp = datetime.now()
+    # 6. 放入写后缓冲，后台批量存储；新决策同时加入记忆索引 (缓存命中、复用的决策与计划中的后续步骤已在索引中)
+    with span("mongo_enqueue"):
+        await save_to_mongo(npc_id, scene_report, ai_content, timestamp)
+    if MEMORY_ENABLED and not cache_hit and not from_plan and not reused:
+        memory_index.add(npc_id, decision, timestamp)
+    REGISTRY.stage_seconds.observe(time.perf_counter() - start, stage="decision_total")
+
+    return {
+        "type": "ai_decision",
+        "request_id": request_id,
+        "npc_id": npc_id,
+        "npc_name": npc_name,
+        "ai_content": ai_content,
+        "cache_hit": cache_hit,
+        "reflex_rule": reflex_rule,
+        "plan": plan,
+        "admission": admission,
+        "report_tokens": report_tokens,
+        "timestamp": timestamp.isoformat(),
+        "scene_report": scene_report
+    }
 
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
-    """处理来自 Godot 游戏后端的 WebSocket 决策请求"""
-    await websocket.accept()
-    print(" [System] Godot 客户端已连接")
-    
-    async with aiohttp.ClientSession() as session:
-        try:
-            while True:
+    """
+    处理来自 Godot 游戏后端的 WebSocket 决策请求
+    客户端在握手时提供 WireProtocol.SUBPROTOCOL 子协议即改用 MessagePack + 实体差量 (见 WireProtocol.py)，否则为 JSON
+    除逐个 NPC 的请求外，也接受一帧携带多个 NPC 的批量帧 (JSON 或 MessagePack 均可，见 expand_batch)：
+    {"type": "batch_frame", "entities": [...], "map_metadata": {...}, "npcs": [{"player_status": {...}, ...}]}
+    """
+    # 协商线协议：msgpack 不可用时不接受子协议，客户端回退到 JSON
+    binary = WIRE_BINARY_ENABLED and WireProtocol.available() and \
+        WireProtocol.SUBPROTOCOL in websocket.scope.get("subprotocols", [])
+    protocol = WireProtocol.SUBPROTOCOL if binary else "json"
+    await websocket.accept(subprotocol=WireProtocol.SUBPROTOCOL if binary else None)
+    logger.info(f" [System] Godot 客户端已连接 (协议: {protocol})")
+    decoder = WireProtocol.DeltaDecoder(history=WIRE_DELTA_HISTORY) if binary else None
+
+    send_lock = asyncio.Lock()
+
+    async def send_control(message: dict):
+        # ack / resync 为二进制帧，决策仍为 JSON 文本帧
+        async with send_lock:
+            await websocket.send_bytes(WireProtocol.pack(message))
+
+    async def send_result(response_payload: dict):
+        # 7. 回传结果 (多个请求并发完成，发送需串行化)
+        with span("json_encode"):
+            response_json = json.dumps(response_payload)
+        with span("godot_send"):
+            async with send_lock:
+                await websocket.send_text(response_json)
+        # Broadcast to web clients (仅入队，不等待慢客户端)；再经总线发给其他 worker 上的 Web 客户端
+        with span("broadcast"):
+            web_connection_manager.broadcast(response_json, npc_id=response_payload.get("npc_id"))
+            await broadcast_bus.publish(response_json, npc_id=response_payload.get("npc_id"))
+
+    async def send_partial(partial_payload: dict):
+        # 流式动作只发给 Godot，Web 端仍以完整决策为准
+        async with send_lock:
+            await websocket.send_text(json.dumps(partial_payload))
+
+    pipeline = RequestPipeline(send_result, max_in_flight=MAX_IN_FLIGHT)
+
+    def submit(raw_data: dict, shared: dict = None) -> tuple:
+        npc_id = raw_data.get("player_status", {}).get("player_id", "unknown_npc")
+        request_id = raw_data.get("request_id") or pipeline.next_request_id(npc_id)
+        deadline = request_deadline(raw_data)
+        ws_messages_total.inc(type="decision_request")
+        # 不同 NPC 并发处理；同一 NPC 的新请求会取代仍在途的旧请求
+        pipeline.submit(npc_id, lambda: process_decision(raw_data, request_id, emit=send_partial, deadline=deadline,
+                                                         shared=shared))
+        return npc_id, request_id
+
+    try:
+        while True:
+            if decoder is None:
                 message = await websocket.receive_text()
-                raw_data = json.loads(message)
-                
-                player_status = raw_data.get("player_status", {})
-                npc_id = player_status.get("player_id", "unknown_npc")
-                npc_name = player_status.get("player_name", "unknown_npc")
-                
-                print(f" [Request] 收到来自 {npc_id} 的决策请求")
-
-                # 1. 场景分析
+                # 文本帧已由服务器解码为 str，按 UTF-8 编码后的长度计字节，与 msgpack 帧可直接比较
+                ws_frame_bytes.observe(len(message.encode("utf-8")), protocol=protocol)
+                with span("json_decode"):
+                    raw_data = json.loads(message)
+                ws_frames_total.inc(protocol=protocol, kind="full")
+            else:
+                message = await websocket.receive_bytes()
+                ws_frame_bytes.observe(len(message), protocol=protocol)
+                with span("msgpack_decode"):
+                    frame = WireProtocol.unpack(message)
                 try:
-                    scene_report = MapAnalyzer.get_scene_summary(raw_data)
-                except Exception as e:
-                    scene_report = "场景解析异常"
-                    print(f" [Error] MapAnalyzer 报错: {e}")
-
-                # 2. 构建 AI Prompt
-                system_prompt = (
-                    "你是一个2D游戏的NPC，你需要思考自己要如何存活下去。\n"
-                    "请认真查看下方的【周围目标清单】，结合你的身份给出合理的决策。"
-                )
-                
-                # 3. 请求 AI 后端
-                ai_content = "AI 无法决策"
-                try:
-                    payload = {
-                        "system_prompt": system_prompt,
-                        "scene_report": scene_report,
-                        "temperature": 0.1
-                    }
-                    async with session.post(VLLM_URL, json=payload, timeout=10) as resp:
-                        if resp.status == 200:
-                            result = await resp.json()
-                            ai_content = result.get("response", result) 
-                        else:
-                            print(f" [AI] 后端响应异常, 状态码: {resp.status}")
-                except Exception as e:
-                    print(f" [AI] 请求失败: {e}")
-                timestamp=datetime.now()
-                # 4. 后台异步存储
-                asyncio.create_task(save_to_mongo(npc_id, scene_report, ai_content,timestamp))
-
-                # 5. 回传结果
-                response_payload = {
-                    "type": "ai_decision",
-                    "npc_id": npc_id,
-                    "npc_name": npc_name,
-                    "ai_content": ai_content,
-                    "timestamp": timestamp.isoformat(),
-                    "scene_report":scene_report
-                }
-                response_json = json.dumps(response_payload)
-                await websocket.send_text(response_json)
-                # Broadcast to web clients
-                await web_connection_manager.broadcast(response_json)
+                    with span("delta_apply"):
+                        raw_data = decoder.decode(frame)
+                except WireProtocol.ResyncRequired as e:
+                    ws_frames_total.inc(protocol=protocol, kind="resync")
+                    logger.warning(f" [Wire] {e}")
+                    await send_control({"t": "resync", "npc": e.npc, "seq": e.seq})
+                    continue
+                ack = WireProtocol.ack_for(frame)
+                if ack is not None:
+                    ws_frames_total.inc(protocol=protocol, kind=frame["t"])
+                    await send_control(ack)
 
-        except WebSocketDisconnect:
-            print(f" [System] Godot 客户端已断开")
-        except Exception as e:
-            print(f" [Error] Godot 路由异常: {e}")
+            # Godot 通知某个 NPC 的状态发生突变，丢弃其缓存决策
+            if raw_data.get("type") == "invalidate_cache":
+                ws_messages_total.inc(type="invalidate_cache")
+                removed = decision_cache.invalidate(raw_data.get("npc_id", ""))
+                plan_cache.invalidate(raw_data.get("npc_id", ""), "invalidated")
+                logger.info(f" [Cache] 已清除 {raw_data.get('npc_id')} 的 {removed} 条缓存决策")
+                continue
+
+            # 批量帧：共享的世界分析一次，再逐个 NPC 提交，同一批的 AI 请求并发发出
+            if raw_data.get("type") == "batch_frame":
+                ws_messages_total.inc(type="batch_frame")
+                batch = expand_batch(raw_data)
+                batch_frame_npcs.observe(len(batch))
+                pipeline.grow(min(len(batch), BATCH_MAX_IN_FLIGHT))
+                for npc_data, shared in batch:
+                    submit(npc_data, shared)
+                logger.info(f" [Request] 收到批量帧: {len(batch)} 个 NPC 的决策请求")
+                continue
+
+            npc_id, request_id = submit(raw_data)
+            logger.info(f" [Request] 收到来自 {npc_id} 的决策请求 ({request_id})")
+
+    except WebSocketDisconnect:
+        logger.info(f" [System] Godot 客户端已断开")
+    except Exception as e:
+        logger.error(f" [Error] Godot 路由异常: {e}")
+    finally:
+        await pipeline.close()
 
 @app.websocket("/ws/web")
-async def web_websocket_endpoint(websocket: WebSocket):
-    """处理来自 Web 前端（如监控面板、数据展示）的 WebSocket 连接"""
-    await web_connection_manager.connect(websocket)
-    print(" [System] Web 客户端已连接")
+async def web_websocket_endpoint(websocket: WebSocket, npc_ids: Optional[str] = None):
+    """
+    处理来自 Web 前端（如监控面板、数据展示）的 WebSocket 连接
+    可通过 ?npc_ids=a,b 或发送 {"type": "subscribe", "npc_ids": [...]} 只订阅部分 NPC
+    """
+    subscriptions = set(npc_ids.split(",")) if npc_ids else None
+    await web_connection_manager.connect(websocket, subscriptions)
+    logger.info(" [System] Web 客户端已连接")
     try:
         while True:
-            await websocket.receive_text()
+            message = await websocket.receive_text()
+            try:
+                data = json.loads(message)
+            except json.JSONDecodeError:
+                continue
+            if isinstance(data, dict) and data.get("type") == "subscribe":
+                web_connection_manager.subscribe(websocket, data.get("npc_ids"))
     except WebSocketDisconnect:
+        logger.info(" [System] Web 客户端已断开")
+    except Exception as e:
+        logger.error(f" [Error] Web 路由异常: {e}")
+    finally:
         web_connection_manager.disconnect(websocket)
-        print(" [System] Web 客户端已断开")
+
+HISTORY_MAX_PAGE_SIZE = 1000
+# 列表接口默认不返回体积最大的 scene_report
+HISTORY_PROJECTION = {"npc_id": 1, "timestamp": 1, "ai_content": 1}
+
+async def create_history_indexes():
+    """为按 NPC + 时间范围的查询建立复合索引 (已存在时为空操作)"""
+    try:
+        await collection.create_index([("npc_id", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)])
+        await collection.create_index([("timestamp", DESCENDING), ("_id", DESCENDING)])
     except Exception as e:
-        print(f" [Error] Web 路由异常: {e}")
+        logger.warning(f" [DB] 创建索引失败: {e}")
+
+@app.on_event("startup")
+async def ensure_history_indexes():
+    # 后台建立索引，不阻塞启动 (MongoDB 不可达时会等待到服务器选择超时)
+    asyncio.create_task(create_history_indexes())
+
+def encode_history_cursor(item: dict) -> str:
+    """用最后一条记录的 (timestamp, _id) 生成下一页游标"""
+    raw = f"{item['timestamp'].isoformat()}|{item['_id']}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_history_cursor(cursor: str) -> tuple:
+    try:
+        timestamp, oid = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(timestamp), ObjectId(oid)
+    except Exception:
+        raise HTTPException(status_code=400, detail="无效的分页游标")
+
+def build_history_query(npc_id: Optional[str], start: Optional[datetime], end: Optional[datetime],
+                        cursor: Optional[str]) -> dict:
+    query = {}
+    if npc_id:
+        query["npc_id"] = npc_id
+    if start or end:
+        query["timestamp"] = {}
+        if start:
+            query["timestamp"]["$gte"] = start
+        if end:
+            query["timestamp"]["$lt"] = end
+    if cursor:
+        # 按 (timestamp, _id) 倒序翻页，同一时间戳的记录用 _id 区分
+        last_ts, last_id = decode_history_cursor(cursor)
+        query["$or"] = [
+            {"timestamp": {"$lt": last_ts}},
+            {"timestamp": last_ts, "_id": {"$lt": last_id}},
+        ]
+    return query
+
+def serialize_history_item(item: dict) -> dict:
+    # 处理 ObjectId / datetime 序列化问题
+    item["_id"] = str(item["_id"])
+    if isinstance(item.get("timestamp"), datetime):
+        item["timestamp"] = item["timestamp"].isoformat()
+    return item
 
 @app.get("/history")
-async def get_history():
-    """获取 MongoDB 中的历史决策数据"""
+async def get_history(
+    npc_id: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    limit: int = Query(100, ge=1, le=HISTORY_MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    include_report: bool = False,
+    format: str = Query("json", pattern="^(json|ndjson)$"),
+):
+    """
+    获取 MongoDB 中的历史决策数据
+    - npc_id / start / end: 按 NPC 与时间范围过滤
+    - cursor: 上一页返回的 next_cursor
+    - include_report: 是否返回完整的 scene_report
+    - format=ndjson: 流式导出整个时间范围 (忽略 limit)，不在内存中缓冲
+    """
+    query = build_history_query(npc_id, start, end, cursor)
+    projection = None if include_report else HISTORY_PROJECTION
+    sort = [("timestamp", DESCENDING), ("_id", DESCENDING)]
+
+    if format == "ndjson":
+        async def to_lines(batch: list) -> str:
+            if include_report:
+                await report_store.expand(batch)
+            return "".join(
+                json.dumps(serialize_history_item(item), ensure_ascii=False, default=str) + "\n" for item in batch
+            )
+
+        async def export():
+            batch = []
+            async for item in collection.find(query, projection).sort(sort).batch_size(500):
+                batch.append(item)
+                if len(batch) >= 200:
+                    yield await to_lines(batch)
+                    batch = []
+            if batch:
+                yield await to_lines(batch)
+        return StreamingResponse(export(), media_type="application/x-ndjson")
+
     try:
-        # 1. 获取最近的 100 条记录
-        cursor = collection.find().sort("timestamp", -1).limit(100)
-        history = await cursor.to_list(length=100)
-        
+        # 多取一条判断是否还有下一页
+        history = await collection.find(query, projection).sort(sort).limit(limit + 1).to_list(length=limit + 1)
+        next_cursor = encode_history_cursor(history[limit - 1]) if len(history) > limit else None
+        history = history[:limit]
+        if include_report:
+            # 由块引用透明地还原完整报告
+            await report_store.expand(history)
+
         npc_name_map = {}
-        
         for item in history:
-            # 2. 处理 ObjectId 序列化问题
-            if "_id" in item:
-                item["_id"] = str(item["_id"])
-            
-            # 3. 简化分组逻辑
-            npc_id = item.get("npc_id", "unknown")
-            if npc_id not in npc_name_map:
-                npc_name_map[npc_id] = []
-            npc_name_map[npc_id].append(item)
-            
+            npc_name_map.setdefault(item.get("npc_id", "unknown"), []).append(serialize_history_item(item))
+
         return {
             "code": 200,
             "status": "success",
             "data": npc_name_map,
+            "count": len(history),
+            "next_cursor": next_cursor,
         }
     except Exception as e:
-        # 4. 使用 HTTPException 返回标准的 500 错误
+        # 使用 HTTPException 返回标准的 500 错误
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/db/stats")
+async def get_db_stats():
+    """写后缓冲的队列深度与刷盘耗时，以及场景报告的去重率"""
+    return {**mongo_writer.snapshot(), "report_dedup": report_store.snapshot()}
+
+@app.get("/ws/web/stats")
+async def get_broadcast_stats():
+    """Web 广播的延迟与丢弃统计 (仅本 worker)，以及跨 worker 总线的收发统计"""
+    return {**web_connection_manager.snapshot(), "bus": broadcast_bus.snapshot()}
+
+@app.get("/cache/stats")
+async def get_cache_stats():
+    """决策缓存命中统计"""
+    return decision_cache.snapshot()
+
+@app.get("/nav/stats")
+async def get_nav_stats():
+    """占据栅格的构建次数与 move 校验/吸附统计"""
+    return nav_grids.snapshot()
+
+@app.get("/reflex/stats")
+async def get_reflex_stats():
+    """反射层的规则命中、绕过率与影子模式一致率"""
+    return reflex_engine.snapshot()
+
+@app.get("/plan/stats")
+async def get_plan_stats():
+    """计划缓存：下发的步骤数、各失效原因次数，以及有无计划时每 NPC 分钟的 LLM 调用数"""
+    return plan_cache.snapshot()
+
+@app.get("/admission/stats")
+async def get_admission_stats():
+    """准入控制：放行 / 降级 / 放弃的请求数、错过截止时间的请求数与当前的完成时间估计"""
+    return admission_control.snapshot()
+
+@app.get("/memory/stats")
+async def get_memory_stats():
+    """记忆索引的条目数、字节数、淘汰与检索统计"""
+    return memory_index.snapshot()
+
+@app.get("/memory/search")
+async def search_memory(npc_id: str, q: str, k: int = Query(MEMORY_TOP_K, ge=1, le=50)):
+    """按关键词检索某个 NPC 的记忆 (调试用)，返回相关度降序的记忆文本"""
+    return {"npc_id": npc_id, "memories": memory_index.search(npc_id, q, k)}
+
+@app.get("/ai/stats")
+async def get_ai_stats():
+    """各 AI 后端的在途请求、熔断状态与延迟"""
+    return ai_backends.snapshot()
+
+def collect_component_metrics() -> list:
+    """抓取时导出各组件 snapshot() 中的数值"""
+    samples = []
+    samples += snapshot_samples("gateway_mongo_writer", mongo_writer.snapshot())
+    samples += snapshot_samples("gateway_report_store", report_store.snapshot())
+    samples += snapshot_samples("gateway_decision_cache", decision_cache.snapshot())
+    samples += snapshot_samples("gateway_web_clients", web_connection_manager.snapshot())
+    samples += snapshot_samples("gateway_bus", broadcast_bus.snapshot())
+    samples += snapshot_samples("gateway_ai_pool", ai_backends.snapshot())
+    samples += snapshot_samples("gateway_nav", nav_grids.snapshot())
+    samples += snapshot_samples("gateway_memory", memory_index.snapshot())
+    samples += snapshot_samples("gateway_admission", admission_control.snapshot())
+    # 进程累计 CPU 时间 (含日志等后台线程)，压测时按前后差值计算每 tick 的 gateway CPU
+    samples.append(("gateway_process_cpu_seconds", {}, time.process_time()))
+    plans = plan_cache.snapshot()
+    samples += snapshot_samples("gateway_plan", plans)
+    for reason, count in plans["invalidations"].items():
+        samples.append(("gateway_plan_invalidations", {"reason": reason}, float(count)))
+    reflex = reflex_engine.snapshot()
+    samples += snapshot_samples("gateway_reflex", reflex)
+    for rule, fired in reflex["fired"].items():
+        labels = {"rule": rule}
+        samples.append(("gateway_reflex_rule_fired", labels, float(fired)))
+        samples.append(("gateway_reflex_shadow_agree", labels, float(reflex["shadow_agree"][rule])))
+        samples.append(("gateway_reflex_shadow_disagree", labels, float(reflex["shadow_disagree"][rule])))
+    for backend in ai_backends.backends:
+        labels = {"backend": backend.url}
+        snapshot = backend.snapshot()
+        samples += snapshot_samples("gateway_ai_backend", snapshot, labels)
+        samples.append(("gateway_ai_backend_up", labels, float(snapshot["healthy"] and snapshot["breaker"] != "open")))
+    return samples
+
+REGISTRY.add_collector(collect_component_metrics)
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus 文本格式的指标：各阶段耗时直方图、决策计数与组件状态"""
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+def serve(host: str, port: int, workers: int, bus_url: str = None):
+    """
+    workers > 1 时以多进程运行：每条 Godot / Web 连接固定在接受它的 worker 上 (决策缓存、请求流水线均为进程内)，
+    Web 广播经总线跨 worker 转发。未指定总线时由主进程启动本机 Unix socket 中继。
+    注意 /metrics 与各 /stats 接口只反映处理该次请求的 worker。
+    """
+    hub = None
+    if workers > 1:
+        if not bus_url or bus_url.startswith("local:"):
+            socket_path = f"/tmp/gateway_bus_{os.getpid()}.sock"
+            hub = multiprocessing.Process(target=run_hub, args=(socket_path,), daemon=True)
+            hub.start()
+            bus_url = f"unix://{socket_path}"
+        os.environ["GATEWAY_BUS_URL"] = bus_url
+        logger.info(f" [Init] 以 {workers} 个 worker 启动，广播总线: {bus_url}")
+        try:
+            # log_config=None：uvicorn 的日志同样经由 setup_logging 的异步队列输出
+            uvicorn.run("main:app", host=host, port=port, workers=workers, log_config=None)
+        finally:
+            if hub is not None:
+                hub.terminate()
+        return
+    if bus_url:
+        global broadcast_bus
+        broadcast_bus = create_bus(bus_url)
+    uvicorn.run(app, host=host, port=port, log_config=None)
+
 if __name__ == "__main__":
     # 启动后：
     # Godot 连接地址: ws://localhost:8765/ws
     # Web 连接地址:   ws://localhost:8765/ws/web
-    print(f" [Init] WebSocket 多路由网关尝试启动...")
-    uvicorn.run(app, host="0.0.0.0", port=8765)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Game AI Gateway")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=1, help="worker 进程数")
+    parser.add_argument("--bus", default=None, help="跨 worker 广播总线，如 unix:///tmp/gw.sock 或 redis://127.0.0.1:6379/0")
+    args = parser.parse_args()
+    logger.info(f" [Init] WebSocket 多路由网关尝试启动...")
+    serve(args.host, args.port, args.workers, args.bus)
@@ -0,0 +1,63 @@
+import argparse
+import asyncio
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+from ReportStore import ReportStore, CHUNK_FIELD
+
+# 将旧的 npc_history 文档中的完整 scene_report 迁移为内容寻址的块引用
+# 用法: python migrate_scene_reports.py --dry-run   (只统计去重效果)
+#       python migrate_scene_reports.py             (执行迁移)
+
+async def migrate_collection(history, store: ReportStore, batch_size: int = 500, dry_run: bool = False) -> int:
+    """把 history 中仍为完整字符串的 scene_report 改写为块引用，返回处理条数；已迁移的文档不再处理"""
+    async def flush(updates):
+        if dry_run:
+            store.discard_pending()
+            return
+        # 先写块，再把历史文档切换为块引用，保证任意时刻都能还原报告
+        await store.flush_pending()
+        await history.bulk_write(updates, ordered=False)
+
+    migrated = 0
+    updates = []
+    cursor = history.find({"scene_report": {"$type": "string"}}, {"scene_report": 1}).batch_size(batch_size)
+    async for doc in cursor:
+        chunk_ids = store.encode(doc["scene_report"])
+        updates.append(UpdateOne(
+            {"_id": doc["_id"]},
+            {"$set": {CHUNK_FIELD: chunk_ids}, "$unset": {"scene_report": ""}},
+        ))
+        if len(updates) >= batch_size:
+            await flush(updates)
+            migrated += len(updates)
+            updates = []
+            print(f" [Migrate] 已处理 {migrated} 条")
+    if updates:
+        await flush(updates)
+        migrated += len(updates)
+    return migrated
+
+async def migrate(args):
+    client = AsyncIOMotorClient(args.uri, serverSelectionTimeoutMS=5000)
+    db = client[args.db]
+    store = ReportStore(db[args.chunk_collection])
+    try:
+        migrated = await migrate_collection(db[args.collection], store, args.batch_size, args.dry_run)
+    finally:
+        client.close()
+
+    stats = store.snapshot()
+    print("-" * 25)
+    print(f" [Migrate] {'(dry-run) ' if args.dry_run else ''}共处理 {migrated} 条历史记录")
+    print(f" [Migrate] 块总数 {stats['chunks_seen']}，去重后 {stats['chunks_new']}，去重比 {stats['dedup_ratio']}")
+    print(f" [Migrate] 原始 {stats['raw_bytes']} 字节 -> 存储 {stats['stored_bytes']} 字节，节省 {stats['bytes_saved']} 字节")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="迁移 scene_report 到内容寻址块存储")
+    parser.add_argument("--uri", default="mongodb://192.168.31.64:27017")
+    parser.add_argument("--db", default="game_ai_db")
+    parser.add_argument("--collection", default="npc_history")
+    parser.add_argument("--chunk-collection", default="scene_chunks")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--dry-run", action="store_true", help="只统计去重效果，不修改数据库")
+    asyncio.run(migrate(parser.parse_args()))
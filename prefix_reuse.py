@@ -0,0 +1,166 @@
+import argparse
+import copy
+import json
+import os
+import random
+from collections import defaultdict
+from MapAnalyzer import SceneRenderer, LAYOUTS
+from PromptTemplate import NPC_SYSTEM_PROMPTS, build_prompt
+from TokenBudget import estimate_tokens, load_tokenizer
+
+# 离线评估前缀 KV 缓存的可复用程度：
+# 重放一串 Godot 请求，按 gateway 的方式渲染报告并拼出 AI_Server 的完整 prompt，
+# 统计每个 NPC 相邻两次 prompt 的公共前缀长度。vLLM 只缓存写满的 KV 块，因此同时给出按块对齐后的可复用 token 数。
+
+def load_requests(path: str) -> list:
+    """读取 JSONL：每行一条 /ws 收到的原始 JSON (含 player_status / entities)"""
+    requests = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                requests.append(json.loads(line))
+    return requests
+
+def simulate_requests(template: dict, npc_count: int, tick_count: int, seed: int = 0) -> list:
+    """
+    以 map_dump.json 为模板生成请求流：多个 NPC 交替上报，
+    每帧小幅移动、饱食度/含水量按浮点衰减、作物倒计时减少，每次决策后追加一条对话记录。
+    """
+    rng = random.Random(seed)
+    npcs = []
+    for n in range(npc_count):
+        player = copy.deepcopy(template["player_status"])
+        player["player_id"] = f"npc_{n + 1:03d}"
+        player["player_name"] = f"{player.get('player_name', 'NPC')}{n + 1}"
+        player["current_pos"] = [float(rng.randint(0, 1150)), float(rng.randint(0, 650))]
+        player["satiety"] = rng.uniform(40, 100)
+        player["hydration"] = rng.uniform(40, 100)
+        player["chat_history"] = []
+        npcs.append(player)
+
+    entities = copy.deepcopy(template["entities"])
+    for i, e in enumerate(entities):
+        if i % 3 == 0:
+            e.update(is_crop=True, stage_name="幼苗", time_left_sec=rng.randint(30, 300))
+
+    requests = []
+    for tick in range(tick_count):
+        for e in entities:
+            if e.get("is_crop") and e["time_left_sec"] > 0:
+                e["time_left_sec"] -= 1
+        for player in npcs:
+            x, y = player["current_pos"]
+            player["current_pos"] = [round(x + rng.uniform(-8, 8), 1), round(y + rng.uniform(-8, 8), 1)]
+            player["satiety"] = max(0.0, player["satiety"] - rng.uniform(0.05, 0.3))
+            player["hydration"] = max(0.0, player["hydration"] - rng.uniform(0.05, 0.3))
+            others = [
+                {"npc_name": p["player_name"], "position": {"x": p["current_pos"][0], "y": p["current_pos"][1]}}
+                for p in npcs if p is not player
+            ]
+            frame = dict(template, entities=[dict(e) for e in entities], orther_players_status=others)
+            frame["player_status"] = copy.deepcopy(player)
+            requests.append(frame)
+            player["chat_history"].append(f"第{tick}轮：我去看看{rng.choice(entities)['name']}")
+    return requests
+
+def common_prefix_len(a: str, b: str) -> int:
+    n = min(len(a), len(b))
+    i = 0
+    # 先按块比较，再逐字符定位
+    step = 256
+    while i + step <= n and a[i:i + step] == b[i:i + step]:
+        i += step
+    while i < n and a[i] == b[i]:
+        i += 1
+    return i
+
+def analyze(requests: list, layout: str, count, block_size: int, token_budget: int = None,
+            max_entities: int = None, radius: float = None) -> dict:
+    renderer = SceneRenderer()
+    last_prompt = {}
+    per_npc = defaultdict(lambda: {"requests": 0, "pairs": 0, "prompt_tokens": 0,
+                                   "shared_chars": 0, "shared_tokens": 0, "reusable_tokens": 0})
+    for data in requests:
+        npc_id = data.get("player_status", {}).get("player_id", "unknown_npc")
+        if token_budget:
+            report, _ = renderer.render_budgeted(data, token_budget, tokenizer=count, max_entities=max_entities,
+                                                 radius=radius, layout=layout)
+        else:
+            report = renderer.render(data, max_entities=max_entities, radius=radius, layout=layout)
+        prompt = build_prompt({"system_prompt": NPC_SYSTEM_PROMPTS[layout], "scene_report": report})
+
+        stats = per_npc[npc_id]
+        stats["requests"] += 1
+        previous = last_prompt.get(npc_id)
+        if previous is not None:
+            # 公共前缀的 token 数按前缀文本计数，分界处可能有 1 个 token 的误差
+            shared = common_prefix_len(previous, prompt)
+            shared_tokens = count(prompt[:shared])
+            stats["pairs"] += 1
+            stats["prompt_tokens"] += count(prompt)
+            stats["shared_chars"] += shared
+            stats["shared_tokens"] += shared_tokens
+            stats["reusable_tokens"] += shared_tokens // block_size * block_size
+        last_prompt[npc_id] = prompt
+
+    summary = {"requests": 0, "pairs": 0, "prompt_tokens": 0, "shared_chars": 0,
+               "shared_tokens": 0, "reusable_tokens": 0}
+    for stats in per_npc.values():
+        for key in summary:
+            summary[key] += stats[key]
+    return {"per_npc": dict(per_npc), "summary": summary}
+
+def _row(name: str, stats: dict) -> str:
+    pairs = stats["pairs"] or 1
+    prompt_tokens = stats["prompt_tokens"] or 1
+    return (f"| {name} | {stats['requests']} | {stats['prompt_tokens'] / pairs:.0f} | "
+            f"{stats['shared_chars'] / pairs:.0f} | {stats['shared_tokens'] / pairs:.0f} | "
+            f"{stats['reusable_tokens'] / pairs:.0f} | {stats['reusable_tokens'] / prompt_tokens:.1%} |")
+
+def print_report(layout: str, result: dict, show_npcs: bool):
+    print(f"\n### 布局: {layout}")
+    print("| NPC | 请求数 | 平均 prompt token | 平均公共前缀(字符) | 平均公共前缀(token) | 块对齐可复用 token | 复用率 |")
+    print("| :--- | ---: | ---: | ---: | ---: | ---: | ---: |")
+    if show_npcs:
+        for npc_id, stats in sorted(result["per_npc"].items()):
+            print(_row(npc_id, stats))
+    print(_row("**合计**", result["summary"]))
+
+def main():
+    parser = argparse.ArgumentParser(description="重放请求流，统计每个 NPC 相邻 prompt 的公共前缀长度")
+    parser.add_argument("--input", help="JSONL 请求文件 (每行一条原始请求)；缺省时以 map_dump.json 为模板模拟")
+    parser.add_argument("--template", default="map_dump.json")
+    parser.add_argument("--npcs", type=int, default=5, help="模拟的 NPC 数")
+    parser.add_argument("--ticks", type=int, default=50, help="模拟的帧数")
+    parser.add_argument("--layouts", default=",".join(LAYOUTS), help="要对比的报告布局，逗号分隔")
+    parser.add_argument("--token-budget", type=int, default=1200, help="与 gateway 的 REPORT_TOKEN_BUDGET 一致，0 表示不限")
+    parser.add_argument("--max-entities", type=int, default=30)
+    parser.add_argument("--radius", type=float, default=None)
+    parser.add_argument("--block-size", type=int, default=16, help="推理端 KV 缓存块大小 (token)")
+    parser.add_argument("--tokenizer", help="模型目录，使用真实分词器计数")
+    parser.add_argument("--per-npc", action="store_true", help="逐个 NPC 输出")
+    parser.add_argument("--json", dest="json_path", help="把结果另存为 JSON")
+    args = parser.parse_args()
+
+    if args.input:
+        requests = load_requests(args.input)
+    else:
+        with open(args.template, encoding="utf-8") as f:
+            requests = simulate_requests(json.load(f), args.npcs, args.ticks)
+    count = load_tokenizer(args.tokenizer) if args.tokenizer else estimate_tokens
+    print(f" [Prefix] 共 {len(requests)} 条请求, KV 块大小 {args.block_size}, "
+          f"分词: {os.path.basename(args.tokenizer) if args.tokenizer else '离线估算'}")
+
+    results = {}
+    for layout in args.layouts.split(","):
+        results[layout] = analyze(requests, layout, count, args.block_size, args.token_budget or None,
+                                  args.max_entities, args.radius)
+        print_report(layout, results[layout], args.per_npc)
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
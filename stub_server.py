@@ -0,0 +1,191 @@
+import argparse
+import asyncio
+import json
+import random
+import time
+from aiohttp import web
+
+# 模拟 AI_Server 的本地桩服务：接口与响应格式一致 (/generate, /generate_stream, /health)，
+# 可注入延迟、抖动与失败率，用于在没有 GPU 的环境下测试 gateway 的负载均衡、熔断与对冲。
+
+STUB_DECISION = {
+    "thought": "先观察一下周围",
+    "text": "我四处看看",
+    "experience": "保持警惕",
+    "actions": [{"type": "move", "pos": [376, 160]}, {"type": "interact"}],
+}
+
+# 随机决策时可选的动作
+STUB_ACTIONS = [
+    {"type": "move", "pos": [376, 160]},
+    {"type": "interact"},
+    {"type": "use", "item_name": "胡萝卜"},
+    {"type": "use", "item_name": "纯净水"},
+    {"type": "attack", "sum": 1},
+]
+
+LATENCY_DISTRIBUTIONS = ("uniform", "exponential", "lognormal")
+FULL_MAX_TOKENS = 2048  # 与 AI_Server 的默认 max_tokens 一致；更小的 max_tokens 按比例缩短延迟 (模拟降级请求)
+
+class StubBackend:
+    """
+    latency: 平均响应延迟 (秒)；jitter: 延迟在 ±jitter 内均匀抖动；
+    fail_rate: 返回 500 的概率；healthy: /health 是否返回 200 (可在测试中切换)
+    distribution: 延迟分布，uniform (latency ± jitter) / exponential (均值 latency) /
+                  lognormal (中位数 latency，jitter 为对数标准差，模拟推理的长尾)
+    warning_rate: 返回 "未能解析出 JSON" 的概率；max_actions > 0 时每个决策随机包含 1~max_actions 个动作
+    concurrency > 0 时最多同时"推理"该数量的请求，其余排队 (模拟 GPU 饱和)；
+    与 AI_Server 一致，排队期间超过 deadline_ms 的请求不再推理，返回 status=expired
+    """
+    def __init__(self, latency: float = 0.05, jitter: float = 0.0, fail_rate: float = 0.0,
+                 seed: int = None, name: str = "stub", distribution: str = "uniform",
+                 warning_rate: float = 0.0, max_actions: int = 0, concurrency: int = 0):
+        if distribution not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"distribution 必须是 {LATENCY_DISTRIBUTIONS} 之一")
+        self.latency = latency
+        self.jitter = jitter
+        self.fail_rate = fail_rate
+        self.distribution = distribution
+        self.warning_rate = warning_rate
+        self.max_actions = max_actions
+        self.warnings = 0
+        self.healthy = True
+        self.name = name
+        self.rng = random.Random(seed)
+        self.requests = 0
+        self.failures = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.concurrency = concurrency
+        self.expired = 0
+        self._slots = None
+        self._runner = None
+        self.port = None
+
+        self.app = web.Application()
+        self.app.router.add_post("/generate", self.generate)
+        self.app.router.add_post("/generate_stream", self.generate_stream)
+        self.app.router.add_get("/health", self.health)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def _delay(self) -> float:
+        if self.distribution == "exponential":
+            return self.rng.expovariate(1 / self.latency) if self.latency > 0 else 0.0
+        if self.distribution == "lognormal":
+            return self.latency * self.rng.lognormvariate(0, self.jitter) if self.latency > 0 else 0.0
+        return max(0.0, self.latency + self.rng.uniform(-self.jitter, self.jitter))
+
+    def _decision(self) -> dict:
+        if self.max_actions <= 0:
+            return STUB_DECISION
+        count = self.rng.randint(1, self.max_actions)
+        return dict(STUB_DECISION, actions=[self.rng.choice(STUB_ACTIONS) for _ in range(count)])
+
+    def _unparsed(self) -> bool:
+        if self.warning_rate and self.rng.random() < self.warning_rate:
+            self.warnings += 1
+            return True
+        return False
+
+    async def _serve(self, body: dict):
+        """模拟一次推理：返回 "failed" / "expired"，正常完成时返回 None"""
+        self.requests += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        deadline_ms = body.get("deadline_ms")
+        deadline = time.monotonic() + deadline_ms / 1000 if isinstance(deadline_ms, (int, float)) else None
+        delay = self._delay() * min(1.0, body.get("max_tokens", FULL_MAX_TOKENS) / FULL_MAX_TOKENS)
+        try:
+            if self.concurrency:
+                if self._slots is None:
+                    self._slots = asyncio.Semaphore(self.concurrency)
+                async with self._slots:
+                    if deadline is not None and time.monotonic() >= deadline:
+                        self.expired += 1
+                        return "expired"
+                    await asyncio.sleep(delay)
+            else:
+                await asyncio.sleep(delay)
+        finally:
+            self.in_flight -= 1
+        if self.rng.random() < self.fail_rate:
+            self.failures += 1
+            return "failed"
+        return None
+
+    async def generate(self, request: web.Request) -> web.Response:
+        outcome = await self._serve(await request.json())
+        if outcome == "failed":
+            return web.json_response({"status": "error", "message": "注入的故障"}, status=500)
+        if outcome == "expired":
+            return web.json_response({"status": "expired", "message": "请求在排队期间已超过截止时间"})
+        if self._unparsed():
+            return web.json_response({"status": "warning", "message": "未能解析出符合结构的 JSON",
+                                      "raw_output": "嗯……"})
+        return web.json_response({"status": "success", "response": self._decision(),
+                                  "thinking_raw": f"来自 {self.name}"})
+
+    async def generate_stream(self, request: web.Request) -> web.StreamResponse:
+        outcome = await self._serve(await request.json())
+        if outcome == "failed":
+            return web.json_response({"status": "error", "message": "注入的故障"}, status=500)
+        resp = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await resp.prepare(request)
+        if outcome == "expired":
+            error = json.dumps({"status": "expired", "message": "请求在排队期间已超过截止时间"}, ensure_ascii=False)
+            await resp.write(f"event: error\ndata: {error}\n\n".encode("utf-8"))
+            await resp.write_eof()
+            return resp
+        if self._unparsed():
+            error = json.dumps({"status": "warning", "message": "未能解析出符合结构的 JSON",
+                                "raw_output": "嗯……"}, ensure_ascii=False)
+            await resp.write(f"event: error\ndata: {error}\n\n".encode("utf-8"))
+            await resp.write_eof()
+            return resp
+        decision = self._decision()
+        for index, action in enumerate(decision["actions"]):
+            data = json.dumps({"index": index, "action": action}, ensure_ascii=False)
+            await resp.write(f"event: action\ndata: {data}\n\n".encode("utf-8"))
+        decision = json.dumps({"status": "success", "response": decision,
+                               "thinking_raw": f"来自 {self.name}"}, ensure_ascii=False)
+        await resp.write(f"event: decision\ndata: {decision}\n\n".encode("utf-8"))
+        await resp.write_eof()
+        return resp
+
+    async def health(self, request: web.Request) -> web.Response:
+        if not self.healthy:
+            return web.json_response({"status": "unhealthy"}, status=503)
+        return web.json_response({"status": "ok", "engine_mode": "stub", "in_flight": self.in_flight})
+
+    async def start(self, port: int = 0) -> str:
+        """在本进程内启动，port=0 时由系统分配空闲端口，返回服务地址"""
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        return self.url
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="AI_Server 桩服务")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0.5, help="平均响应延迟 (秒)")
+    parser.add_argument("--jitter", type=float, default=0.1)
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    parser.add_argument("--distribution", choices=LATENCY_DISTRIBUTIONS, default="uniform")
+    parser.add_argument("--warning-rate", type=float, default=0.0, help="返回未解析输出的概率")
+    parser.add_argument("--max-actions", type=int, default=0, help="随机动作数上限 (0 为固定决策)")
+    parser.add_argument("--concurrency", type=int, default=0, help="同时推理的请求数上限，其余排队 (0 为不限)")
+    args = parser.parse_args()
+    stub = StubBackend(args.latency, args.jitter, args.fail_rate, name=f"stub:{args.port}",
+                       distribution=args.distribution, warning_rate=args.warning_rate,
+                       max_actions=args.max_actions, concurrency=args.concurrency)
+    web.run_app(stub.app, host="0.0.0.0", port=args.port)
@@ -0,0 +1,63 @@
+import sys
+import time
+from AdmissionControl import AdmissionController
+
+def warm_up(controller: AdmissionController, latency: float, samples: int = 5, mode: str = "full"):
+    """伪造 samples 个耗时为 latency 的已完成请求 (在途数为 1)"""
+    for _ in range(samples):
+        mode_, concurrency, _ = controller.begin(mode)
+        controller.end((mode_, concurrency, time.perf_counter() - latency))
+
+def test_cold_start_and_decisions():
+    controller = AdmissionController(min_samples=5, safety_margin=0.0, degraded_ratio=0.25, probe_interval=60)
+    assert controller.decide(0.01) == "full", "样本不足时全部放行"
+    assert controller.decide(None) == "full", "没有截止时间的请求全部放行"
+    assert controller.decide(-0.1) == "shed", "到达时已过期的请求直接放弃"
+
+    warm_up(controller, 0.4)
+    assert abs(controller.estimate() - 0.4) < 0.01
+    assert controller.decide(0.5) == "full"
+    # 完整请求来不及，但按 max_tokens 比例估计的降级请求来得及
+    assert controller.decide(0.2) == "degraded"
+    assert controller.decide(0.05) == "shed"
+    snapshot = controller.snapshot()
+    print(f" [Test] 准入统计: {snapshot}")
+    assert snapshot["admitted"] == 3 and snapshot["degraded"] == 1 and snapshot["shed"] == 2
+    assert snapshot["expired_on_arrival"] == 1
+
+def test_queue_growth_raises_estimate():
+    controller = AdmissionController(min_samples=5, safety_margin=0.0, probe_interval=60)
+    warm_up(controller, 0.2)
+    tokens = [controller.begin() for _ in range(4)]
+    # 在途 4 个、观测时只有 1 个：新请求预计要等待前面 4 个
+    assert abs(controller.estimate() - 1.0) < 0.01, controller.estimate()
+    assert controller.decide(0.6) == "degraded"
+    for token in tokens:
+        controller.abandon(token)
+    assert controller.in_flight == 0 and controller.completed == 5, "取消的请求不计入延迟样本"
+    assert controller.decide(0.5) == "full"
+
+def test_probe_recovers_after_slowdown():
+    controller = AdmissionController(min_samples=5, safety_margin=0.0, probe_interval=0.05)
+    warm_up(controller, 2.0)
+    assert controller.decide(0.1) == "shed"
+    time.sleep(0.06)
+    # 超过 probe_interval 没有完整请求的样本：放行一个探测请求，其余继续放弃
+    assert controller.decide(0.1) == "full" and controller.decide(0.1) == "shed"
+    # 后端已经恢复：探测与之后的请求把估计拉回来
+    warm_up(controller, 0.01, samples=20)
+    assert controller.decide(0.1) == "full" and controller.probes == 1
+    print(f" [Test] 恢复后的估计: {controller.snapshot()['estimate_ms']} ms")
+
+def main():
+    test_cold_start_and_decisions()
+    test_queue_growth_raises_estimate()
+    test_probe_recovers_after_slowdown()
+    print(" [Test] SUCCESS: 准入控制验证通过!")
+
+if __name__ == "__main__":
+    try:
+        main()
+    except AssertionError as e:
+        print(f" [Test] FAILED: {e}")
+        sys.exit(1)
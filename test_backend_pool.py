@@ -0,0 +1,208 @@
+import asyncio
+import sys
+import time
+from BackendPool import BackendPool, DeadlineExceeded, NoBackendAvailable
+from stub_server import StubBackend
+
+PAYLOAD = {"system_prompt": "测试", "scene_report": "报告", "temperature": 0.1}
+
+async def start_stubs(*stubs):
+    return [await stub.start() for stub in stubs]
+
+async def test_least_outstanding():
+    # 快的后端完成得早，在途请求少，应承担更多请求
+    fast, slow = StubBackend(latency=0.01, name="fast"), StubBackend(latency=0.2, name="slow")
+    pool = BackendPool(await start_stubs(fast, slow), health_interval=0)
+    await pool.start()
+    try:
+        # 开环到达：每 10ms 发起一个请求
+        tasks = []
+        for _ in range(60):
+            tasks.append(asyncio.ensure_future(pool.post_json("/generate", PAYLOAD)))
+            await asyncio.sleep(0.01)
+        results = await asyncio.gather(*tasks)
+    finally:
+        await pool.close()
+        await fast.stop()
+        await slow.stop()
+    print(f" [Test] 最少在途路由: fast={fast.requests}, slow={slow.requests}")
+    assert all(r["status"] == "success" for r in results)
+    assert fast.requests > slow.requests * 2
+
+async def test_circuit_breaker():
+    # 持续失败的后端被熔断，请求全部重试到健康后端
+    good, bad = StubBackend(latency=0.01, name="good"), StubBackend(latency=0.01, fail_rate=1.0, name="bad")
+    pool = BackendPool(await start_stubs(good, bad), health_interval=0, failure_threshold=3, reset_timeout=0.3)
+    await pool.start()
+    try:
+        for _ in range(30):
+            result = await pool.post_json("/generate", PAYLOAD)
+            assert result["status"] == "success"
+        bad_backend = next(b for b in pool.backends if b.url == bad.url)
+        print(f" [Test] 熔断: {bad_backend.snapshot()}")
+        assert bad_backend.breaker.state == "open"
+        assert bad.requests == 3, "熔断后仍有请求发往故障后端"
+
+        # reset_timeout 之后放行一个探测请求，后端恢复则关闭熔断
+        bad.fail_rate = 0.0
+        await asyncio.sleep(0.35)
+        for _ in range(10):
+            await pool.post_json("/generate", PAYLOAD)
+        assert bad_backend.breaker.state == "closed"
+
+        # 全部后端都不可用时直接报错，而不是等待超时
+        good.fail_rate = bad.fail_rate = 1.0
+        for _ in range(6):
+            try:
+                await pool.post_json("/generate", PAYLOAD)
+            except Exception:
+                pass
+        try:
+            await pool.post_json("/generate", PAYLOAD)
+            raise AssertionError("所有后端熔断时应抛出 NoBackendAvailable")
+        except NoBackendAvailable:
+            pass
+    finally:
+        await pool.close()
+        await good.stop()
+        await bad.stop()
+
+async def test_health_check():
+    a, b = StubBackend(latency=0.01, name="a"), StubBackend(latency=0.01, name="b")
+    pool = BackendPool(await start_stubs(a, b), health_interval=0.05)
+    await pool.start()
+    try:
+        b.healthy = False
+        await asyncio.sleep(0.15)
+        before = b.requests
+        for _ in range(10):
+            await pool.post_json("/generate", PAYLOAD)
+        assert b.requests == before, "健康检查失败的后端仍在接收请求"
+        b.healthy = True
+        await asyncio.sleep(0.15)
+        assert all(backend.healthy for backend in pool.backends)
+        print(f" [Test] 健康检查: {[backend.snapshot()['health_failures'] for backend in pool.backends]}")
+    finally:
+        await pool.close()
+        await a.stop()
+        await b.stop()
+
+async def test_hedging():
+    # 一个后端偶发长尾：超过 p95 后向另一个后端对冲，尾延迟被截断
+    tail, steady = StubBackend(latency=0.02, seed=1, name="tail"), StubBackend(latency=0.02, name="steady")
+    pool = BackendPool(await start_stubs(tail, steady), health_interval=0, hedge=True,
+                       hedge_min_samples=10, hedge_min_delay=0.03)
+    await pool.start()
+    try:
+        for _ in range(20):
+            await pool.post_json("/generate", PAYLOAD)
+        tail.latency = 1.0
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        for _ in range(5):
+            await pool.post_json("/generate", PAYLOAD)
+        elapsed = loop.time() - start
+    finally:
+        await pool.close()
+        await tail.stop()
+        await steady.stop()
+    print(f" [Test] 对冲: {pool.snapshot()['hedges']} 次对冲, {pool.hedge_wins} 次胜出, 5 次请求耗时 {elapsed:.2f}s")
+    assert elapsed < 1.0, "对冲未能截断长尾延迟"
+
+async def test_stream():
+    stub = StubBackend(latency=0.01)
+    pool = BackendPool(await start_stubs(stub), health_interval=0)
+    await pool.start()
+    try:
+        async with pool.stream("/generate_stream", PAYLOAD) as resp:
+            body = await resp.text()
+        assert "event: decision" in body
+        assert pool.backends[0].outstanding == 0
+    finally:
+        await pool.close()
+        await stub.stop()
+
+async def test_deadline():
+    # 后端排队 (同时只推理 1 个)：截止时间截断等待，不计入熔断；排队中过期的请求由后端丢弃
+    stub = StubBackend(latency=0.2, concurrency=1)
+    pool = BackendPool(await start_stubs(stub), health_interval=0, failure_threshold=2, retries=1)
+    await pool.start()
+    try:
+        start = time.monotonic()
+        try:
+            await pool.post_json("/generate", PAYLOAD, deadline=time.monotonic() + 0.05)
+            raise AssertionError("超过截止时间的请求应抛出 DeadlineExceeded")
+        except DeadlineExceeded:
+            pass
+        assert time.monotonic() - start < 0.15, "请求没有在截止时间处返回"
+        await asyncio.sleep(0.25)  # 被放弃的请求仍占着后端唯一的推理名额
+
+        # 第一个按时完成；第二个推理中被截断；第三个在后端排队期间过期，没有推理
+
+        tasks = [asyncio.ensure_future(pool.post_json("/generate", PAYLOAD, deadline=time.monotonic() + 0.3))
+                 for _ in range(3)]
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        await asyncio.sleep(0.5)  # 等待后端处理完被放弃的请求
+        statuses = [r["status"] if isinstance(r, dict) else type(r).__name__ for r in results]
+        print(f" [Test] 截止时间: {statuses}, 后端丢弃 {stub.expired} 个过期请求, {pool.snapshot()['deadline_exceeded']} 次超时")
+        assert statuses == ["success", "DeadlineExceeded", "DeadlineExceeded"] and stub.expired == 1
+        assert pool.backends[0].breaker.state == "closed" and pool.backends[0].failures == 0
+        assert stub.requests == 4, "截止时间耗尽后不应重试"
+    finally:
+        await pool.close()
+        await stub.stop()
+
+async def test_hanging_backend():
+    # 后端挂起：截止时间与 timeout 相同 (gateway 默认)，超时计入熔断而不是当作截止时间截断
+    hang = StubBackend(latency=1.0, name="hang")
+    pool = BackendPool(await start_stubs(hang), timeout=0.2, health_interval=0, failure_threshold=2, retries=1)
+    await pool.start()
+    try:
+        for _ in range(2):
+            try:
+                await pool.post_json("/generate", PAYLOAD, deadline=time.monotonic() + 0.2)
+                raise AssertionError("挂起的后端不应返回结果")
+            except DeadlineExceeded:
+                raise AssertionError("后端超过自身超时不应视为截止时间截断")
+            except asyncio.TimeoutError:
+                pass
+        backend = pool.backends[0]
+        print(f" [Test] 挂起的后端: {backend.snapshot()}")
+        assert backend.failures == 2 and backend.breaker.state == "open"
+    finally:
+        await pool.close()
+        await hang.stop()
+
+    # 预算仍有剩余时换到另一个后端重试
+    hang, good = StubBackend(latency=1.0, name="hang"), StubBackend(latency=0.01, name="good")
+    pool = BackendPool(await start_stubs(hang, good), timeout=0.2, health_interval=0, failure_threshold=2, retries=1)
+    await pool.start()
+    try:
+        for _ in range(20):
+            result = await pool.post_json("/generate", PAYLOAD, deadline=time.monotonic() + 1.0)
+            assert result["status"] == "success"
+            if hang.requests >= 2:
+                break
+        hang_backend = next(b for b in pool.backends if b.url == hang.url)
+        assert hang_backend.failures == 2 and hang_backend.breaker.state == "open" and pool.retried == 2
+    finally:
+        await pool.close()
+        await hang.stop()
+        await good.stop()
+
+async def main():
+    await test_least_outstanding()
+    await test_circuit_breaker()
+    await test_health_check()
+    await test_hedging()
+    await test_stream()
+    await test_deadline()
+    await test_hanging_backend()
+    print(" [Test] SUCCESS: 后端连接池验证通过!")
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except AssertionError as e:
+        print(f" [Test] FAILED: {e}")
+        sys.exit(1)
@@ -0,0 +1,106 @@
+import asyncio
+import json
+import random
+import sys
+import SpatialIndex as spatial
+from SpatialIndex import SpatialIndex
+from MapAnalyzer import SceneRenderer
+from DecisionCache import DecisionCache
+from RequestPipeline import RequestPipeline
+from bench_map_analyzer import build_world
+
+TEMPLATE = json.load(open("map_dump.json", encoding="utf-8"))
+
+def npc_frames(world: dict, count: int, seed: int = 0) -> list:
+    """同一批实体上的多个 NPC (位置随机)，与批量帧展开后的单条请求相同"""
+    rng = random.Random(seed)
+    frames = []
+    for i in range(count):
+        player = dict(world["player_status"], player_id=f"npc_{i}",
+                      current_pos=[round(rng.uniform(0, 1150), 1), round(rng.uniform(0, 650), 1)])
+        frames.append(dict(world, player_status=player))
+    return frames
+
+def test_batch_queries_match_single():
+    world = build_world(TEMPLATE, 500)
+    index = SpatialIndex(world["entities"])
+    points = [f["player_status"]["current_pos"] for f in npc_frames(world, 20)]
+    assert index.distance_matrix(points) == [index.distances(p) for p in points]
+    for k, radius in ((30, None), (5, 120.0), (None, 200.0), (1000, None)):
+        expected = [index.nearest(p, k, radius=radius) if k is not None else index.within_radius(p, radius)
+                    for p in points]
+        assert index.query_many(points, k, radius) == expected, f"k={k} radius={radius}"
+    assert index.query_many([], 10) == [] and index.query_many(points[:2], 0) == [[], []]
+    assert SpatialIndex([]).query_many(points[:2], 10) == [[], []]
+
+def test_batch_reports_match_single():
+    world = build_world(TEMPLATE, 300)
+    frames = npc_frames(world, 12)
+    positions = [f["player_status"]["current_pos"] for f in frames]
+    for max_entities, radius in ((30, None), (None, 150.0), (None, None)):
+        for layout in ("legacy", "stable"):
+            single, batched = SceneRenderer(), SceneRenderer()
+            selections = batched.select_many(world["entities"], positions, max_entities, radius)
+            for frame, selection in zip(frames, selections):
+                expected = single.render_budgeted(frame, 1200, max_entities=max_entities, radius=radius, layout=layout)
+                actual = batched.render_budgeted(frame, 1200, max_entities=max_entities, radius=radius, layout=layout,
+                                                 selection=selection)
+                assert actual == expected, f"max_entities={max_entities} radius={radius} layout={layout}"
+
+def test_shared_fingerprint():
+    cache = DecisionCache()
+    world = build_world(TEMPLATE, 100)
+    key = cache.entities_key(world["entities"])
+    for frame in npc_frames(world, 5):
+        assert cache.fingerprint(frame, key) == cache.fingerprint(frame)
+    moved = npc_frames(world, 2)
+    assert cache.fingerprint(moved[0], key) != cache.fingerprint(moved[1], key)
+
+async def check_pipeline_grow():
+    active, peak = 0, 0
+    release = asyncio.Event()
+
+    async def work(i):
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await release.wait()
+        active -= 1
+        return i
+
+    results = []
+    async def on_result(result):
+        results.append(result)
+
+    pipeline = RequestPipeline(on_result, max_in_flight=2)
+    for i in range(10):
+        pipeline.submit(f"npc_{i}", lambda i=i: work(i))
+    await asyncio.sleep(0.01)
+    assert peak == 2
+    pipeline.grow(10)
+    pipeline.grow(4)  # 不会降低
+    await asyncio.sleep(0.01)
+    assert peak == 10 and pipeline.max_in_flight == 10, (peak, pipeline.max_in_flight)
+    release.set()
+    await asyncio.sleep(0.01)
+    assert sorted(results) == list(range(10))
+    await pipeline.close()
+
+def main():
+    # numpy 可用时同时验证向量化路径与纯 Python 路径
+    backends = [("numpy", spatial.np), ("python", None)] if spatial.np is not None else [("python", None)]
+    for name, np in backends:
+        spatial.np = np
+        test_batch_queries_match_single()
+        test_batch_reports_match_single()
+        print(f" [Test] 批量距离计算 ({name}) 与逐个 NPC 计算一致")
+    test_shared_fingerprint()
+    asyncio.run(check_pipeline_grow())
+    print(" [Test] SUCCESS: 批量帧共享分析验证通过!")
+
+if __name__ == "__main__":
+    try:
+        main()
+    except AssertionError as e:
+        print(f" [Test] FAILED: {e}")
+        sys.exit(1)
@@ -0,0 +1,72 @@
+import asyncio
+import sys
+import time
+from BatchScheduler import BatchScheduler, DeadlineExceeded, StubEngine
+
+async def test_batch_scheduler(npc_count=24, batch_latency=0.2):
+    engine = StubEngine(batch_latency=batch_latency)
+    scheduler = BatchScheduler(engine, batch_window_ms=20, max_batch_size=16)
+    scheduler.start()
+
+    print(f" [Test] {npc_count} 个 NPC 并发提交，单批耗时 {batch_latency}s")
+    start = time.perf_counter()
+    outputs = await asyncio.gather(*[
+        scheduler.submit(f"prompt_{i}", None) for i in range(npc_count)
+    ])
+    elapsed = time.perf_counter() - start
+    await scheduler.stop()
+
+    # 每条输出必须回到自己的调用方
+    for i, output in enumerate(outputs):
+        assert output.outputs[0].text == f"prompt_{i}", f"第 {i} 条输出路由错误"
+
+    print(f" [Test] 总耗时: {elapsed:.3f}s, 引擎调用批次: {engine.calls}")
+    print(f" [Test] 统计: {scheduler.stats.snapshot()}")
+    # 串行需要 npc_count 次调用，批处理应只需 ceil(npc_count / max_batch_size) 次
+    assert len(engine.calls) < npc_count
+
+async def test_expired_requests_dropped(batch_latency=0.2):
+    # 每批只能处理 2 条：第二批在第一批完成后才发车，其中已过截止时间的请求不交给引擎
+    engine = StubEngine(batch_latency=batch_latency)
+    scheduler = BatchScheduler(engine, batch_window_ms=20, max_batch_size=2)
+    scheduler.start()
+    deadline = time.monotonic() + batch_latency * 0.5  # 第一批发车前不会过期，第二批发车时已过期
+    results = await asyncio.gather(
+        scheduler.submit("a", None, deadline=deadline),
+        scheduler.submit("b", None, deadline=deadline),
+        scheduler.submit("c", None, deadline=deadline),
+        scheduler.submit("d", None),
+        return_exceptions=True,
+    )
+    await scheduler.stop()
+    print(f" [Test] 过期请求: 引擎调用批次 {engine.calls}, 统计 {scheduler.stats.snapshot()['expired']} 条过期")
+    assert isinstance(results[2], DeadlineExceeded), results[2]
+    assert [r.outputs[0].text for i, r in enumerate(results) if i != 2] == ["a", "b", "d"]
+    assert engine.calls == [2, 1] and scheduler.stats.expired == 1
+
+async def test_stop_resolves_pending(batch_latency=0.2):
+    # 第一批推理中、第二批仍在排队时停止：所有调用方都应收到异常，而不是永久等待
+    engine = StubEngine(batch_latency=batch_latency)
+    scheduler = BatchScheduler(engine, batch_window_ms=5, max_batch_size=2)
+    scheduler.start()
+    tasks = [asyncio.create_task(scheduler.submit(f"prompt_{i}", None)) for i in range(5)]
+    await asyncio.sleep(batch_latency * 0.5)
+    assert engine.calls == [2] and scheduler.queue_depth == 3
+    await scheduler.stop()
+    results = await asyncio.wait_for(asyncio.gather(*tasks, return_exceptions=True), 1.0)
+    print(f" [Test] 停止时未完成的请求: {[type(r).__name__ for r in results]}")
+    assert all(isinstance(r, RuntimeError) and str(r) == "scheduler stopped" for r in results), results
+    assert scheduler.queue_depth == 0
+
+async def main():
+    await test_batch_scheduler()
+    await test_expired_requests_dropped()
+    await test_stop_resolves_pending()
+    print(" [Test] SUCCESS: 批处理调度验证通过!")
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except AssertionError as e:
+        print(f" [Test] FAILED: {e}")
+        sys.exit(1)
@@ -0,0 +1,80 @@
+import asyncio
+import os
+import sys
+import tempfile
+from BroadcastBus import BroadcastBus, BusHub, LocalBus, RedisBus, UnixSocketBus, create_bus
+
+async def wait_for(predicate, timeout: float = 2.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not predicate():
+        if asyncio.get_running_loop().time() > deadline:
+            return False
+        await asyncio.sleep(0.01)
+    return True
+
+async def test_unix_bus():
+    path = os.path.join(tempfile.mkdtemp(), "bus.sock")
+    hub = BusHub(path)
+    await hub.start()
+    inbox = {"a": [], "b": [], "c": []}
+    buses = {name: UnixSocketBus(path) for name in inbox}
+    for name, bus in buses.items():
+        await bus.start(lambda message, npc_id, name=name: inbox[name].append((message, npc_id)))
+
+    await buses["a"].publish('{"text": "你好"}', npc_id="npc_1")
+    assert await wait_for(lambda: inbox["b"] and inbox["c"]), f"其他 worker 未收到: {inbox}"
+    assert inbox["b"] == [('{"text": "你好"}', "npc_1")]
+    await asyncio.sleep(0.05)
+    assert inbox["a"] == [], "发布方不应收到自己的消息"
+
+    # 中继断开后 publish 只计入 dropped，重新启动后自动重连
+    await hub.close()
+    assert await wait_for(lambda: not buses["b"].snapshot()["connected"])
+    await buses["b"].publish("lost")
+    assert buses["b"].dropped == 1
+    hub = BusHub(path)
+    await hub.start()
+    assert await wait_for(lambda: all(b.snapshot()["connected"] for b in buses.values()))
+    await buses["b"].publish("again")
+    assert await wait_for(lambda: len(inbox["a"]) == 1 and len(inbox["c"]) == 2)
+
+    snapshot = buses["b"].snapshot()
+    print(f" [Test] Unix socket 总线: {snapshot}")
+    assert snapshot["published"] == 1 and snapshot["reconnects"] == 1
+    for bus in buses.values():
+        await bus.close()
+    await hub.close()
+
+def test_create_bus():
+    assert isinstance(create_bus(None), LocalBus)
+    assert isinstance(create_bus("local://"), LocalBus)
+    bus = create_bus("unix:///tmp/gw.sock")
+    assert isinstance(bus, UnixSocketBus) and bus.path == "/tmp/gw.sock"
+    try:
+        assert isinstance(create_bus("redis://localhost:6379/0"), RedisBus)
+    except RuntimeError as e:
+        print(f" [Test] 跳过 Redis: {e}")
+    try:
+        create_bus("kafka://localhost")
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("未知总线应被拒绝")
+    try:
+        BroadcastBus()
+    except TypeError:
+        pass
+    else:
+        raise AssertionError("总线接口不能直接实例化")
+
+def main():
+    asyncio.run(test_unix_bus())
+    test_create_bus()
+    print(" [Test] SUCCESS: 广播总线验证通过!")
+
+if __name__ == "__main__":
+    try:
+        main()
+    except AssertionError as e:
+        print(f" [Test] FAILED: {e}")
+        sys.exit(1)
@@ -0,0 +1,111 @@
+import asyncio
+import sys
+from main import ConnectionManager
+
+class FakeWebSocket:
+    """Web 客户端替身：记录收到的消息；gate 未打开时 send_text 阻塞 (模拟慢客户端)"""
+    def __init__(self, slow: bool = False, broken: bool = False):
+        self.sent = []
+        self.closed_code = None
+        self.broken = broken
+        self.gate = asyncio.Event()
+        if not slow:
+            self.gate.set()
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, message: str):
+        if self.broken:
+            raise ConnectionResetError("连接已断开")
+        await self.gate.wait()
+        self.sent.append(message)
+
+    async def close(self, code: int = 1000):
+        self.closed_code = code
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+async def test_drop_oldest():
+    manager = ConnectionManager(max_queue=2, lag_policy="drop_oldest")
+    slow, fast = FakeWebSocket(slow=True), FakeWebSocket()
+    await manager.connect(slow)
+    await manager.connect(fast)
+    await settle()
+    manager.broadcast("m0")
+    await settle()  # 慢客户端的写协程取走 m0 后阻塞在发送上
+    for i in range(1, 5):
+        manager.broadcast(f"m{i}")
+        await settle()
+    assert manager.dropped == 2, manager.snapshot()
+    slow.gate.set()
+    await settle()
+    assert slow.sent == ["m0", "m3", "m4"], slow.sent
+    assert fast.sent == [f"m{i}" for i in range(5)], "快客户端不受慢客户端影响"
+    assert manager.snapshot()["sent"] == 8
+
+async def test_disconnect_policy():
+    manager = ConnectionManager(max_queue=2, lag_policy="disconnect")
+    slow, fast = FakeWebSocket(slow=True), FakeWebSocket()
+    await manager.connect(slow)
+    await manager.connect(fast)
+    await settle()
+    for i in range(4):
+        manager.broadcast(f"m{i}")
+        await settle()
+    assert manager.lag_disconnects == 1 and manager.active_connections == [fast], manager.snapshot()
+    assert slow.closed_code == 1008 and manager.dropped == 0
+    assert fast.sent == [f"m{i}" for i in range(4)]
+
+async def test_subscriptions():
+    manager = ConnectionManager()
+    only_npc_1, everyone = FakeWebSocket(), FakeWebSocket()
+    await manager.connect(only_npc_1, {"npc_1"})
+    await manager.connect(everyone)
+    for npc_id in ("npc_1", "npc_2", None):
+        manager.broadcast(f"from {npc_id}", npc_id)
+    await settle()
+    # 不带 npc_id 的消息发给所有客户端
+    assert only_npc_1.sent == ["from npc_1", "from None"], only_npc_1.sent
+    assert everyone.sent == ["from npc_1", "from npc_2", "from None"]
+    # 空订阅列表恢复为接收全部
+    manager.subscribe(only_npc_1, [])
+    manager.broadcast("from npc_2 again", "npc_2")
+    await settle()
+    assert only_npc_1.sent[-1] == "from npc_2 again"
+
+async def test_double_disconnect():
+    manager = ConnectionManager()
+    websocket = FakeWebSocket()
+    await manager.connect(websocket)
+    writer = manager.clients[websocket].writer
+    manager.disconnect(websocket)
+    manager.disconnect(websocket)  # 接收循环与写协程可能各调用一次
+    await settle()
+    assert manager.active_connections == [] and writer.cancelled()
+    manager.broadcast("after")
+    assert websocket.sent == []
+
+    # 发送失败时写协程自行断开，随后接收循环再断开一次也不报错
+    broken = FakeWebSocket(broken=True)
+    await manager.connect(broken)
+    manager.broadcast("boom")
+    await settle()
+    assert manager.active_connections == []
+    manager.disconnect(broken)
+
+async def main():
+    await test_drop_oldest()
+    await test_disconnect_policy()
+    await test_subscriptions()
+    await test_double_disconnect()
+    print(" [Test] SUCCESS: Web 客户端广播验证通过!")
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except AssertionError as e:
+        print(f" [Test] FAILED: {e}")
+        sys.exit(1)
@@ -0,0 +1,103 @@
+import copy
+import json
+import sys
+import time
+from DecisionCache import DecisionCache
+
+TEMPLATE = json.load(open("map_dump.json", encoding="utf-8"))
+DECISION = {"thought": "去喝水", "text": "", "experience": "", "actions": [{"type": "interact"}]}
+
+def with_stat(frame: dict, **stats) -> dict:
+    return dict(frame, player_status=dict(frame["player_status"], **stats))
+
+def test_fingerprint_buckets():
+    cache = DecisionCache(stat_bucket=10.0, pos_bucket=16.0)
+    frame = with_stat(copy.deepcopy(TEMPLATE), hydration=42)
+    base = cache.fingerprint(frame)
+    # 每帧变化但与决策无关的字段不参与指纹
+    assert cache.fingerprint(dict(frame, timestamp="later")) == base
+    assert cache.fingerprint(with_stat(frame, hydration=47.5)) == base
+    assert cache.fingerprint(with_stat(frame, current_pos=[0, 0])) != cache.fingerprint(with_stat(frame, current_pos=[40, 0]))
+    # 实体顺序不影响指纹
+    shuffled = dict(frame, entities=list(reversed(frame["entities"])))
+    assert cache.fingerprint(shuffled) == base
+
+def test_depleted_stats_fingerprint():
+    # hp 为 0 (死亡) 不能复用 hp 1~9 时缓存的决策；同为终止状态或同一非零桶内仍然命中
+    cache = DecisionCache(stat_bucket=10.0)
+    frame = copy.deepcopy(TEMPLATE)
+    for field in ("hp", "hydration"):
+        fingerprint = lambda value: cache.fingerprint(with_stat(frame, **{field: value}))
+        assert fingerprint(0) != fingerprint(5), field
+        assert fingerprint(0) == fingerprint(-3), field
+        assert fingerprint(1) == fingerprint(9), field
+
+def test_hits_and_misses():
+    cache = DecisionCache()
+    assert cache.get("npc_1", "a") is None
+    cache.put("npc_1", "a", DECISION)
+    assert cache.get("npc_1", "a") == DECISION
+    assert cache.get("npc_2", "a") is None, "不同 NPC 不共享决策"
+    snapshot = cache.snapshot()
+    assert (snapshot["hits"], snapshot["misses"], snapshot["hit_rate"]) == (1, 2, round(1 / 3, 4)), snapshot
+
+def test_lru_eviction():
+    cache = DecisionCache(max_entries=2)
+    cache.put("npc_1", "a", DECISION)
+    cache.put("npc_1", "b", DECISION)
+    cache.get("npc_1", "a")  # a 最近使用，b 最先淘汰
+    cache.put("npc_1", "c", DECISION)
+    assert cache.get("npc_1", "b") is None and cache.get("npc_1", "a") == DECISION
+    assert cache.snapshot()["entries"] == 2 and cache.evictions == 1
+
+def test_byte_cap():
+    size = len(json.dumps(DECISION, ensure_ascii=False).encode("utf-8"))
+    cache = DecisionCache(max_bytes=size * 2)
+    for fingerprint in "abc":
+        cache.put("npc_1", fingerprint, DECISION)
+    assert cache.total_bytes == size * 2 and cache.evictions == 1
+    assert cache.get("npc_1", "a") is None
+    # 单条超过上限的决策不缓存
+    cache.put("npc_2", "big", dict(DECISION, thought="x" * size * 2))
+    assert cache.get("npc_2", "big") is None and cache.total_bytes == size * 2
+
+def test_ttl_expiry():
+    cache = DecisionCache(ttl=0.05)
+    cache.put("npc_1", "a", DECISION)
+    assert cache.latest("npc_1") == DECISION
+    time.sleep(0.06)
+    assert cache.latest("npc_1") is None
+    assert cache.get("npc_1", "a") is None
+    snapshot = cache.snapshot()
+    assert snapshot["expirations"] == 1 and snapshot["entries"] == 0 and snapshot["bytes"] == 0, snapshot
+
+def test_latest_and_invalidate():
+    cache = DecisionCache()
+    cache.put("npc_1", "a", DECISION)
+    time.sleep(0.001)
+    newer = dict(DECISION, thought="去吃饭")
+    cache.put("npc_1", "b", newer)
+    cache.put("npc_2", "a", DECISION)
+    hits = cache.hits
+    assert cache.latest("npc_1") == newer and cache.hits == hits, "latest 不计入命中统计"
+    assert cache.invalidate("npc_1") == 2 and cache.invalidate("npc_1") == 0
+    assert cache.latest("npc_1") is None and cache.get("npc_2", "a") == DECISION
+    size = len(json.dumps(DECISION, ensure_ascii=False).encode("utf-8"))
+    assert cache.snapshot()["entries"] == 1 and cache.total_bytes == size
+
+def main():
+    test_fingerprint_buckets()
+    test_depleted_stats_fingerprint()
+    test_hits_and_misses()
+    test_lru_eviction()
+    test_byte_cap()
+    test_ttl_expiry()
+    test_latest_and_invalidate()
+    print(" [Test] SUCCESS: 决策缓存验证通过!")
+
+if __name__ == "__main__":
+    try:
+        main()
+    except AssertionError as e:
+        print(f" [Test] FAILED: {e}")
+        sys.exit(1)
@@ -0,0 +1,49 @@
+import copy
+import json
+import sys
+from MapAnalyzer import SceneRenderer
+from bench_map_analyzer import legacy_scene_summary
+
+TEMPLATE = json.load(open("map_dump.json", encoding="utf-8"))
+
+def as_int(value):
+    return int(value) if isinstance(value, float) and value.is_integer() else value
+
+def mixed_frames() -> list:
+    """同一张地图的两帧：数值相等但 int / float 类型互换，渲染结果应随类型不同"""
+    floats = copy.deepcopy(TEMPLATE)
+    for e in floats["entities"]:
+        e["hp"] = 100
+    ints = copy.deepcopy(floats)
+    for e in ints["entities"]:
+        e["center"] = [as_int(v) for v in e["center"]]
+        e["rect"] = [as_int(v) for v in e.get("rect", [])]
+        e["hp"] = 100.0
+    ints["map_metadata"]["nav_polygons"] = [[[as_int(v) for v in p] for p in polygon]
+                                           for polygon in ints["map_metadata"]["nav_polygons"]]
+    return [floats, ints, floats]
+
+def test_mixed_types_match_legacy():
+    renderer = SceneRenderer()
+    for i, frame in enumerate(mixed_frames()):
+        assert renderer.render(frame) == legacy_scene_summary(frame), f"第 {i} 帧与原始实现不一致"
+    assert renderer.row_hits > 0, "第三帧应命中第一帧缓存的行"
+
+def test_stable_rows_keep_types():
+    renderer = SceneRenderer()
+    floats, ints, _ = mixed_frames()
+    assert "`[544.0, 136.0]`" in renderer.render(floats, layout="stable")
+    report = renderer.render(ints, layout="stable")
+    assert "`[544, 136]`" in report and "HP:100.0" in report
+
+def main():
+    test_mixed_types_match_legacy()
+    test_stable_rows_keep_types()
+    print(" [Test] SUCCESS: 场景报告渲染验证通过!")
+
+if __name__ == "__main__":
+    try:
+        main()
+    except AssertionError as e:
+        print(f" [Test] FAILED: {e}")
+        sys.exit(1)
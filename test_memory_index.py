@@ -0,0 +1,159 @@
+import asyncio
+import copy
+import json
+import sys
+from datetime import datetime, timedelta
+from MemoryIndex import MemoryIndex, memory_text, scene_query, tokenize
+from MapAnalyzer import SceneRenderer
+from MongoWriter import InMemoryCollection
+
+TEMPLATE = json.load(open("map_dump.json", encoding="utf-8"))
+START = datetime(2026, 1, 1, 8, 0)
+
+DECISIONS = [
+    {"thought": "口渴了，去净水点打水", "text": "", "experience": "净水点可以交互获得纯净水",
+     "actions": [{"type": "interact"}]},
+    {"thought": "在土地上种下种子", "text": "种点胡萝卜", "experience": "种子要在可种植土地上使用",
+     "actions": [{"type": "use", "item_name": "种子"}]},
+    {"thought": "饿了，吃一根胡萝卜", "text": "", "experience": "胡萝卜可以增加饱食度",
+     "actions": [{"type": "use", "item_name": "胡萝卜"}]},
+    {"thought": "天黑了，四处走走", "text": "晚上好", "experience": "",
+     "actions": [{"type": "move", "pos": [100, 200]}]},
+]
+
+def make_index(**kwargs) -> MemoryIndex:
+    index = MemoryIndex(**kwargs)
+    for i, decision in enumerate(DECISIONS):
+        assert index.add("npc_1", decision, START + timedelta(minutes=i))
+    return index
+
+def test_tokenize_and_text():
+    assert tokenize("我去净水点打水!") == ["净", "水", "点", "打", "水", "我去", "去净", "净水", "水点", "点打", "打水"]
+    assert tokenize("use 123 Carrot") == ["use", "carrot"]
+    text = memory_text(DECISIONS[2])
+    assert text == "想法: 饿了，吃一根胡萝卜 | 经验: 胡萝卜可以增加饱食度 | 行动: use 胡萝卜", text
+
+def test_relevance_ranking():
+    index = make_index()
+    assert index.search("npc_1", "口渴 纯净水", k=1)[0].endswith("行动: interact")
+    hits = index.search("npc_1", "饱食度 饥饿 胡萝卜", k=2)
+    print(f" [Test] 检索 '饱食度 饥饿 胡萝卜': {hits}")
+    assert "吃一根胡萝卜" in hits[0] and "种下种子" in hits[1]
+    assert hits[0].startswith("[01-01 08:02] ")
+    assert index.search("npc_1", "攻击 敌人") == [], "没有任何词命中时返回空列表"
+    assert index.search("npc_2", "胡萝卜") == [], "记忆按 NPC 隔离"
+
+    # 场景查询：缺水时检索到打水的记忆
+    frame = copy.deepcopy(TEMPLATE)
+    frame["player_status"].update(hydration=5, satiety=90)
+    query = scene_query(frame)
+    assert "口渴" in query and "饥饿" not in query
+    assert "打水" in index.search("npc_1", query, k=1)[0]
+
+def test_dedupe_and_eviction():
+    index = make_index(max_per_npc=3)
+    assert not index.add("npc_1", DECISIONS[3], START), "与上一条相同的决策不重复加入"
+    assert not index.add("npc_1", "AI 无法决策"), "非结构化决策不加入"
+    assert len(index) == 3 and index.search("npc_1", "净水") == [], "超出条数上限时淘汰最旧的记忆"
+
+    index = make_index()
+    size = index.total_bytes
+    index.max_bytes = size  # 再加入任何记忆都会淘汰最旧的一条
+    index.add("npc_2", DECISIONS[0], START)
+    assert index.total_bytes <= size and index.snapshot()["evictions"] >= 1
+    assert index.search("npc_2", "净水点") and index.snapshot()["npcs"] == 2
+
+    assert index.forget("npc_2") == 1 and index.search("npc_2", "净水点") == []
+
+def test_rebuild_from_collection():
+    collection = InMemoryCollection()
+    docs = [{"npc_id": "npc_1", "timestamp": START + timedelta(minutes=i), "ai_content": d}
+            for i, d in enumerate(DECISIONS)]
+    docs.append({"npc_id": "npc_1", "timestamp": START + timedelta(minutes=9), "ai_content": "AI 无法决策"})
+    asyncio.run(collection.insert_many(docs[::-1]))
+    index = MemoryIndex()
+    # limit 取最近的 3 条 (其中 1 条为兜底文本)，最早的两条决策不载入
+    assert asyncio.run(index.rebuild(collection, limit=3)) == 2
+    assert index.search("npc_1", "净水") == [] and index.search("npc_1", "胡萝卜")
+
+class SlowCursor:
+    """每返回一条文档都让出事件循环，模拟载入期间有实时决策到达"""
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    def sort(self, key: str, direction: int = 1):
+        self.cursor.sort(key, direction)
+        return self
+
+    def limit(self, count: int):
+        self.cursor.limit(count)
+        return self
+
+    async def __aiter__(self):
+        async for doc in self.cursor:
+            await asyncio.sleep(0)
+            yield doc
+
+class SlowCollection(InMemoryCollection):
+    def find(self, query: dict = None, projection: dict = None):
+        return SlowCursor(super().find(query, projection))
+
+async def check_rebuild_keeps_live_order():
+    collection = SlowCollection()
+    await collection.insert_many([{"npc_id": "npc_1", "timestamp": START + timedelta(minutes=i), "ai_content": d}
+                                  for i, d in enumerate(DECISIONS[:3])])
+    index = MemoryIndex(max_per_npc=3)
+    task = asyncio.create_task(index.rebuild(collection))
+    await asyncio.sleep(0)
+    assert index.snapshot()["rebuilding"]
+    assert not index.add("npc_1", DECISIONS[3], START + timedelta(hours=1)), "载入期间的实时决策先缓存"
+    assert await task == 3 and not index.snapshot()["rebuilding"]
+    # 实时决策排在历史之后：超出上限时淘汰的是最旧的历史记忆，而不是刚到达的决策
+    assert index.search("npc_1", "四处走走") and index.search("npc_1", "净水") == []
+    assert not index.add("npc_1", DECISIONS[3]), "去重比较的是最新的实时决策"
+
+def test_rebuild_keeps_live_order():
+    asyncio.run(check_rebuild_keeps_live_order())
+
+def test_report_uses_memories():
+    frame = copy.deepcopy(TEMPLATE)
+    frame["player_status"]["experiences"] = ["很久以前的经验"] * 50
+    memories = make_index().search("npc_1", "胡萝卜", k=2)
+    renderer = SceneRenderer()
+    report = renderer.render(frame, memories=memories)
+    assert "相关记忆" in report and "很久以前的经验" not in report
+    budgeted, _ = renderer.render_budgeted(frame, 10_000, memories=memories)
+    assert f"- **相关记忆**: {memories}\n" in budgeted and "很久以前的经验" not in budgeted
+    # 预算不足时先丢弃相关度低的记忆
+    full_tokens = renderer.render_budgeted(frame, 10_000, memories=memories)[1]
+    tight, _ = renderer.render_budgeted(frame, full_tokens - 10, memories=memories)
+    assert f"- **相关记忆**: {memories[:1]} (另有 1 条相关记忆已省略)\n" in tight, tight
+    # 未提供记忆时保持原有报告
+    assert "- **经验**:" in renderer.render_budgeted(frame, 10_000)[0]
+
+def test_cold_start_keeps_experiences():
+    # 新 NPC / 重建尚未完成 / 没有词命中：检索为空时保留 Godot 发来的 experiences
+    frame = copy.deepcopy(TEMPLATE)
+    frame["player_status"]["experiences"] = ["净水点可以打水", "胡萝卜可以吃"]
+    memories = MemoryIndex().search(frame["player_status"].get("player_id", "npc_1"), scene_query(frame))
+    assert memories == []
+    renderer = SceneRenderer()
+    for report in (renderer.render(frame, memories=memories), renderer.render_budgeted(frame, 10_000, memories=memories)[0]):
+        assert "- **经验**: ['净水点可以打水', '胡萝卜可以吃']\n" in report and "相关记忆" not in report
+
+def main():
+    test_tokenize_and_text()
+    test_relevance_ranking()
+    test_dedupe_and_eviction()
+    test_rebuild_from_collection()
+    test_rebuild_keeps_live_order()
+    test_report_uses_memories()
+    test_cold_start_keeps_experiences()
+    print(" [Test] SUCCESS: 记忆索引验证通过!")
+
+if __name__ == "__main__":
+    try:
+        main()
+    except AssertionError as e:
+        print(f" [Test] FAILED: {e}")
+        sys.exit(1)
@@ -0,0 +1,64 @@
+import logging
+import sys
+import time
+from Metrics import MetricsRegistry, snapshot_samples
+from AsyncLogging import setup_logging
+
+def test_histogram_render():
+    registry = MetricsRegistry()
+    for value in (0.0003, 0.004, 0.004, 0.2, 50.0):
+        registry.stage_seconds.observe(value, stage="scene_report")
+    text = registry.render()
+    print(text)
+    assert "# TYPE stage_duration_seconds histogram" in text
+    assert 'stage_duration_seconds_bucket{stage="scene_report",le="0.0005"} 1' in text
+    assert 'stage_duration_seconds_bucket{stage="scene_report",le="0.005"} 3' in text
+    # 超出最大分桶的样本只计入 +Inf
+    assert 'stage_duration_seconds_bucket{stage="scene_report",le="30"} 4' in text
+    assert 'stage_duration_seconds_bucket{stage="scene_report",le="+Inf"} 5' in text
+    assert 'stage_duration_seconds_count{stage="scene_report"} 5' in text
+    assert registry.stage_seconds.quantile(0.5, stage="scene_report") == 0.005
+
+def test_span_and_counters():
+    registry = MetricsRegistry()
+    decisions = registry.counter("decisions_total", "Decisions", ("source",))
+    decisions.inc(source="ai")
+    decisions.inc(2, source="cache")
+    # 同名重复注册返回同一个指标
+    assert registry.counter("decisions_total", "Decisions", ("source",)) is decisions
+    try:
+        with registry.span("json_decode"):
+            raise ValueError("bad json")
+    except ValueError:
+        pass
+    with registry.span("json_decode"):
+        time.sleep(0.001)
+    assert registry.stage_seconds.count(stage="json_decode") == 2
+    registry.add_collector(lambda: snapshot_samples("writer", {"queued": 3, "policy": "block", "closed": False}))
+    text = registry.render()
+    assert 'decisions_total{source="cache"} 2' in text
+    assert "writer_queued 3" in text
+    assert "writer_policy" not in text and "writer_closed" not in text
+
+def test_async_logging():
+    listener = setup_logging()
+    assert setup_logging() is listener, "重复调用应复用同一个监听线程"
+    assert isinstance(logging.getLogger().handlers[0], logging.handlers.QueueHandler)
+    start = time.perf_counter()
+    for i in range(200):
+        logging.getLogger("test").info(f" [Test] 日志 {i}")
+    elapsed = time.perf_counter() - start
+    print(f" [Test] 200 条日志入队耗时 {elapsed * 1000:.1f}ms")
+
+def main():
+    test_histogram_render()
+    test_span_and_counters()
+    test_async_logging()
+    print(" [Test] SUCCESS: 指标与异步日志验证通过!")
+
+if __name__ == "__main__":
+    try:
+        main()
+    except AssertionError as e:
+        print(f" [Test] FAILED: {e}")
+        sys.exit(1)
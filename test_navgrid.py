@@ -0,0 +1,104 @@
+import copy
+import json
+import sys
+import time
+from NavGrid import NavGrid, NavGridCache, obstacle_rects
+from MapAnalyzer import SceneRenderer
+
+TEMPLATE = json.load(open("map_dump.json", encoding="utf-8"))
+
+def test_walkable_and_snap():
+    # 100×100 的方形地图，中间一堵竖墙 (x: 40~60, y: 0~80)，下方留出通道
+    grid = NavGrid([[[0, 0], [100, 0], [100, 100], [0, 100]]], [(40, 0, 20, 80)], cell_size=10)
+    assert grid.is_walkable([10, 10])
+    assert not grid.is_walkable([50, 40]), "障碍内不可行走"
+    assert not grid.is_walkable([150, 40]), "越界不可行走"
+    assert grid.snap([10, 10]) == [10, 10], "有效坐标保持不变"
+    snapped = grid.snap([45, 40])
+    assert grid.is_walkable(snapped) and abs(snapped[0] - 45) <= 10, snapped
+    snapped = grid.snap([150, 40])
+    assert grid.is_walkable(snapped) and snapped[0] > 90, snapped
+
+    # 绕墙的路径距离大于直线距离；没有阻挡时等于直线距离
+    straight, around = grid.path_distances([15, 15], [([15, 95], None), ([85, 15], None)])
+    assert abs(straight - 80) < 1e-6, straight
+    assert around > 130, f"应绕过墙: {around}"
+    # 中心在障碍内的目标按 rect 周围的可行走单元计算
+    (wall,) = grid.path_distances([15, 15], [([50, 40], [40, 0, 20, 80])])
+    assert wall is not None and wall < 60
+
+def test_unreachable():
+    # 两个互不连通的区域
+    grid = NavGrid([[[0, 0], [40, 0], [40, 40], [0, 40]], [[60, 0], [100, 0], [100, 40], [60, 40]]], cell_size=10)
+    assert grid.path_distances([5, 5], [([95, 5], None)]) == [None]
+
+def test_cache_and_fix_moves():
+    cache = NavGridCache(cell_size=16)
+    frame = copy.deepcopy(TEMPLATE)
+    frame["entities"][1]["has_physics_layer"] = True  # 净水点为禁止进入区域
+    grid = cache.get(frame)
+    assert cache.get(copy.deepcopy(frame)) is grid, "同一地图应复用栅格"
+    assert cache.builds == 1 and cache.hits == 1
+    assert obstacle_rects(frame["entities"]) == [(496.0, 112.0, 96.0, 48.0)]
+
+    decision = {"actions": [
+        {"type": "move", "pos": [376, 160]},     # 有效
+        {"type": "move", "pos": [544, 136]},     # 障碍内
+        {"type": "move", "pos": [5000, -300]},   # 越界
+        {"type": "interact"},
+    ]}
+    results = cache.fix_moves(decision, grid)
+    print(f" [Test] move 校验: {results} -> {decision['actions']}")
+    assert results == ["valid", "snapped", "snapped"]
+    assert decision["actions"][0]["pos"] == [376, 160]
+    assert all(grid.is_walkable(a["pos"]) for a in decision["actions"][:3])
+
+    # 流式模式下动作已逐个计数：最终决策只吸附，不重复计数
+    counts = (cache.valid, cache.snapped, cache.unreachable)
+    final = {"actions": [{"type": "move", "pos": [544, 136]}]}
+    assert cache.fix_moves(final, grid, count=False) == ["snapped"]
+    assert grid.is_walkable(final["actions"][0]["pos"])
+    assert (cache.valid, cache.snapped, cache.unreachable) == counts == (1, 2, 0), counts
+
+    # 障碍变化后重建
+    frame["entities"][0]["has_physics_layer"] = True
+    assert cache.get(frame) is not grid and cache.builds == 2
+
+def test_report_path_distance():
+    frame = copy.deepcopy(TEMPLATE)
+    frame["entities"][1]["has_physics_layer"] = True
+    grid = NavGridCache(cell_size=16).get(frame)
+    report = SceneRenderer().render(frame, nav=grid)
+    plain = SceneRenderer().render(frame)
+    assert report != plain and "| purifiedWaterLayer |" in report
+
+def test_large_map_speed():
+    # 4000×4000 的地图、500 个障碍，每帧的吸附与 30 个目标的路径距离
+    polygon = [[0, 0], [4000, 0], [4000, 4000], [0, 4000]]
+    obstacles = [((i * 137) % 3900, (i * 251) % 3900, 48, 48) for i in range(500)]
+    start = time.perf_counter()
+    grid = NavGrid([polygon], obstacles, cell_size=16)
+    build = time.perf_counter() - start
+    targets = [([(2000 + (i * 53) % 400), (2000 + (i * 97) % 400)], None) for i in range(30)]
+    start = time.perf_counter()
+    for tick in range(20):
+        grid.snap([2000 + tick * 5, 2000])
+        grid.path_distances([2000 + tick * 5, 2000], targets)
+    per_tick = (time.perf_counter() - start) / 20
+    print(f" [Test] 大地图: 构建 {build * 1000:.1f}ms ({grid.cols}x{grid.rows}), 每帧 {per_tick * 1000:.2f}ms")
+    assert per_tick < 0.1
+
+def main():
+    test_walkable_and_snap()
+    test_unreachable()
+    test_cache_and_fix_moves()
+    test_report_path_distance()
+    test_large_map_speed()
+    print(" [Test] SUCCESS: 占据栅格验证通过!")
+
+if __name__ == "__main__":
+    try:
+        main()
+    except AssertionError as e:
+        print(f" [Test] FAILED: {e}")
+        sys.exit(1)
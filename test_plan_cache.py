@@ -0,0 +1,129 @@
+import copy
+import json
+import sys
+from PlanCache import WAIT_ACTION, PlanCache, Trigger
+
+TEMPLATE = json.load(open("map_dump.json", encoding="utf-8"))
+
+PLAN = {
+    "thought": "先去净水点打水，再喝一瓶",
+    "text": "去打水",
+    "experience": "净水点可以交互获得纯净水",
+    "actions": [{"type": "move", "pos": [544, 180]}, {"type": "interact"}, {"type": "use", "item_name": "纯净水"}],
+}
+
+def make_frame(pos=(609.0, 305.0), water=3, **status):
+    frame = copy.deepcopy(TEMPLATE)
+    frame["player_status"].update(dict(current_pos=list(pos), hp=100, satiety=80, hydration=60), **status)
+    for item in frame["player_status"]["inventory"]:
+        if item and item["name"] == "纯净水":
+            item["amount"] = water
+    return frame
+
+def test_step_through_plan():
+    plans = PlanCache()
+    decision, meta = plans.start("npc_1", PLAN, make_frame(), now=0)
+    assert decision["actions"] == [PLAN["actions"][0]] and decision["text"] == "去打水"
+    assert meta == {"plan_id": 1, "step": 0, "steps": 3}
+
+    # 还在路上：重复下发 move
+    decision, meta = plans.step("npc_1", make_frame(pos=(580, 240)), now=2)
+    assert decision["actions"] == [PLAN["actions"][0]] and decision["text"] == "" and meta["step"] == 0
+    # 到达 (误差在 arrive_radius 内)：下发 interact
+    decision, meta = plans.step("npc_1", make_frame(pos=(546, 178)), now=4)
+    assert decision["actions"] == [{"type": "interact"}] and meta["step"] == 1
+    # interact 下发后的下一帧视为完成：下发 use
+    decision, meta = plans.step("npc_1", make_frame(pos=(546, 178), water=4), now=5)
+    assert decision["actions"] == [PLAN["actions"][2]] and meta["step"] == 2
+    # 物品尚未减少：不重复使用，下发等待动作 (actions 不为空)
+    decision, _ = plans.step("npc_1", make_frame(pos=(546, 178), water=4), now=6)
+    assert decision["actions"] == [WAIT_ACTION]
+    # 物品减少：计划完成，交还给 LLM
+    assert plans.step("npc_1", make_frame(pos=(546, 178), water=3), now=7) is None
+    snapshot = plans.snapshot()
+    print(f" [Test] 计划执行: {snapshot}")
+    assert snapshot["plans_completed"] == 1 and snapshot["active_plans"] == 0 and snapshot["waits"] == 1
+
+def expect_invalidation(reason: str, frame: dict, now: float = 1, plans: PlanCache = None, start_frame=None):
+    plans = plans or PlanCache()
+    plans.start("npc_1", PLAN, start_frame or make_frame(), now=0)
+    assert plans.step("npc_1", frame, now=now) is None, f"{reason} 应使计划失效"
+    assert plans.invalidations == {reason: 1}, plans.invalidations
+
+def test_triggers():
+    expect_invalidation("hp_drop", make_frame(hp=85))
+    expect_invalidation("hydration_low", make_frame(hydration=25))
+    # 已经低于阈值时开始的计划不会因同一阈值反复失效
+    plans = PlanCache()
+    plans.start("npc_1", PLAN, make_frame(hydration=25), now=0)
+    assert plans.step("npc_1", make_frame(hydration=20), now=1) is not None
+    expect_invalidation("sleep_changed", make_frame(is_sleeping=True))
+
+    # 新实体出现在附近；原有实体因 NPC 移动进入范围不算
+    frame = make_frame()
+    frame["entities"].append({"id": "wolf_1", "name": "wolf", "center": [620.0, 300.0], "rect": [600, 280, 40, 40]})
+    expect_invalidation("new_entity", frame)
+    plans = PlanCache()
+    plans.start("npc_1", PLAN, make_frame(), now=0)
+    assert plans.step("npc_1", make_frame(pos=(560, 200)), now=1) is not None
+
+    frame = make_frame()
+    frame["orther_players_status"] = [{"npc_name": "小红", "position": {"x": 650, "y": 300}}]
+    expect_invalidation("player_approach", frame)
+
+    # 第一步就要使用没有的物品：计划立即失败，不会下发空动作等到 step_timeout
+    plans = PlanCache()
+    use_first = dict(PLAN, actions=[{"type": "use", "item_name": "纯净水"}, {"type": "move", "pos": [544, 180]}])
+    decision, meta = plans.start("npc_1", use_first, make_frame(water=0), now=0)
+    assert decision == use_first and meta is None and len(plans) == 0
+    assert plans.invalidations == {"step_failed": 1} and plans.step("npc_1", make_frame(water=0), now=1) is None
+    expect_invalidation("timeout", make_frame(pos=(580, 240)), now=61)
+    expect_invalidation("step_failed", make_frame(pos=(580, 240)), now=16)
+    expect_invalidation("step_failed", dict(make_frame(pos=(580, 240)), action_failed=True))
+
+def test_custom_triggers():
+    plans = PlanCache(triggers=[{"name": "rich", "when": {"has_item": "金币"}}])
+    frame = make_frame(hp=50)
+    assert plans.start("npc_1", PLAN, frame, now=0)[1] is not None
+    assert plans.step("npc_1", frame, now=1) is not None, "默认触发器已被替换"
+    for spec in ({"name": "bad_op", "when": {"hp": {"fall": 1}}},
+                 {"name": "mixed", "when": {"hp": {"drop": 1, "<": 50}}}):
+        try:
+            Trigger.from_dict(spec)
+        except ValueError as e:
+            print(f" [Test] 拒绝非法触发器: {e}")
+        else:
+            raise AssertionError(f"触发器 {spec['name']} 应被拒绝")
+    # 没有动作的决策不作为计划
+    assert plans.start("npc_1", dict(PLAN, actions=[]), frame) == (dict(PLAN, actions=[]), None)
+
+def test_llm_calls_per_npc_minute():
+    # 每秒一帧、持续 2 分钟：每次计划失效或完成才调用 LLM
+    plans = PlanCache()
+    x = 609.0
+    for tick in range(121):
+        x = max(544.0, x - 10)
+        frame = make_frame(pos=(x, 180 if x == 544.0 else 305))
+        if plans.step("npc_1", frame, now=tick) is None:
+            plans.record_llm_call("npc_1", now=tick)
+            plans.start("npc_1", dict(PLAN, actions=PLAN["actions"][:2]), frame, now=tick)
+    snapshot = plans.snapshot()
+    print(f" [Test] 每 NPC 分钟 LLM 调用: {snapshot['llm_calls_per_npc_minute']} "
+          f"(无计划缓存 {snapshot['llm_calls_per_npc_minute_without_plans']})")
+    assert snapshot["npc_minutes"] == 2.0
+    assert snapshot["llm_calls_per_npc_minute_without_plans"] == 60.5
+    assert snapshot["llm_calls_per_npc_minute"] < 30
+
+def main():
+    test_step_through_plan()
+    test_triggers()
+    test_custom_triggers()
+    test_llm_calls_per_npc_minute()
+    print(" [Test] SUCCESS: 计划缓存验证通过!")
+
+if __name__ == "__main__":
+    try:
+        main()
+    except AssertionError as e:
+        print(f" [Test] FAILED: {e}")
+        sys.exit(1)
@@ -0,0 +1,56 @@
+import json
+import re
+import sys
+from MapAnalyzer import SceneRenderer, LAYOUTS
+from PromptTemplate import NPC_SYSTEM_PROMPTS, STATIC_PROMPT_PREFIX, build_prompt
+from TokenBudget import estimate_tokens
+from bench_map_analyzer import build_world
+from prefix_reuse import analyze, common_prefix_len, simulate_requests
+
+TEMPLATE = json.load(open("map_dump.json", encoding="utf-8"))
+
+def test_prompt_sections_match_layout():
+    # 角色设定中引用的【章节】必须出现在对应布局的报告里
+    world = build_world(TEMPLATE, 50)
+    for layout in LAYOUTS:
+        report = SceneRenderer().render(world, layout=layout)
+        sections = re.findall(r"【(.+?)】", NPC_SYSTEM_PROMPTS[layout])
+        assert sections and all(section in report for section in sections), f"layout={layout} sections={sections}"
+
+def test_common_prefix_len():
+    assert common_prefix_len("", "abc") == 0
+    assert common_prefix_len("abc", "abd") == 2
+    long = "x" * 600
+    assert common_prefix_len(long + "a", long + "b") == 600
+    assert common_prefix_len(long, long) == 600
+
+def test_stable_layout_shares_longer_prefix():
+    # stable 布局把每帧变化的状态放在最后，相邻两次 prompt 的公共前缀应长于 legacy 布局
+    requests = simulate_requests(TEMPLATE, npc_count=3, tick_count=6)
+    results = {layout: analyze(requests, layout, estimate_tokens, block_size=16, token_budget=1200)["summary"]
+               for layout in LAYOUTS}
+    for layout, summary in results.items():
+        assert summary["requests"] == 18 and summary["pairs"] == 15, (layout, summary)
+        assert summary["reusable_tokens"] % 16 == 0 and summary["reusable_tokens"] <= summary["shared_tokens"]
+        # 规则部分所有 NPC 共享，至少能复用
+        assert summary["shared_chars"] >= summary["pairs"] * len(STATIC_PROMPT_PREFIX), (layout, summary)
+    assert results["stable"]["shared_tokens"] > results["legacy"]["shared_tokens"], results
+
+def test_prompt_starts_with_static_prefix():
+    for layout in LAYOUTS:
+        prompt = build_prompt({"system_prompt": NPC_SYSTEM_PROMPTS[layout], "scene_report": "报告"})
+        assert prompt.startswith(STATIC_PROMPT_PREFIX + "### 角色设定\n" + NPC_SYSTEM_PROMPTS[layout])
+
+def main():
+    test_prompt_sections_match_layout()
+    test_common_prefix_len()
+    test_stable_layout_shares_longer_prefix()
+    test_prompt_starts_with_static_prefix()
+    print(" [Test] SUCCESS: 报告布局与前缀复用验证通过!")
+
+if __name__ == "__main__":
+    try:
+        main()
+    except AssertionError as e:
+        print(f" [Test] FAILED: {e}")
+        sys.exit(1)
@@ -0,0 +1,87 @@
+import copy
+import json
+import sys
+from ReflexRules import ReflexEngine, Rule, DEFAULT_RULES, validate_decision
+
+TEMPLATE = json.load(open("map_dump.json", encoding="utf-8"))
+
+def make_frame(**status):
+    frame = copy.deepcopy(TEMPLATE)
+    frame["player_status"].update(status)
+    return frame
+
+def test_default_rules():
+    engine = ReflexEngine()
+    assert engine.match(make_frame(hp=0, is_sleep=True))[0] == "dead", "生命值为 0 优先于其他规则"
+    assert engine.match(make_frame(is_sleep=True))[0] == "sleeping"
+    name, decision = engine.match(make_frame(hydration=5, satiety=80))
+    assert name == "drink_water"
+    assert decision["actions"] == [{"type": "use", "item_name": "纯净水"}]
+    assert engine.match(make_frame(satiety=10, hydration=80))[0] == "eat_carrot"
+    # 正常状态交给 LLM
+    assert engine.match(make_frame(satiety=80, hydration=80)) is None
+
+    # 没有纯净水时，站在净水点旁边才交互
+    frame = make_frame(hydration=5, satiety=80, current_pos=[544.0, 150.0])
+    frame["player_status"]["inventory"] = [i for i in frame["player_status"]["inventory"]
+                                           if i is None or i["name"] != "纯净水"]
+    assert engine.match(frame)[0] == "fetch_water"
+    frame["player_status"]["current_pos"] = [100.0, 400.0]
+    assert engine.match(frame) is None
+
+    # 返回的是副本，修改不影响规则本身
+    decision["actions"].clear()
+    assert engine.match(make_frame(hydration=5))[1]["actions"]
+
+    snapshot = engine.snapshot()
+    print(f" [Test] 反射层: {snapshot}")
+    assert snapshot["evaluated"] == 8 and snapshot["bypassed"] == 6
+    assert all(validate_decision(rule["decision"], reflex=True) == [] for rule in DEFAULT_RULES)
+    # Prompt 要求 LLM 的 actions 不能为空，只有反射层决策允许空数组
+    assert validate_decision(DEFAULT_RULES[0]["decision"]) == ["actions 不能为空"]
+    assert validate_decision(DEFAULT_RULES[2]["decision"]) == []
+
+def test_shadow_mode():
+    engine = ReflexEngine(mode="shadow")
+    name, decision = engine.match(make_frame(hydration=5))
+    assert engine.snapshot()["bypassed"] == 0, "影子模式不绕过 LLM"
+    assert engine.record_shadow(name, decision, {"thought": "", "text": "", "experience": "",
+                                                 "actions": [{"type": "use", "item_name": "纯净水"},
+                                                             {"type": "move", "pos": [1, 2]}]})
+    assert not engine.record_shadow(name, decision, {"actions": [{"type": "move", "pos": [1, 2]}]})
+    assert not engine.record_shadow(name, decision, "AI 无法决策")
+    snapshot = engine.snapshot()
+    assert snapshot["shadow_compared"] == 3 and snapshot["shadow_agree"]["drink_water"] == 1
+
+def test_invalid_rules():
+    for spec in (
+        {"name": "bad_op", "when": {"hp": {"~": 1}}, "decision": DEFAULT_RULES[0]["decision"]},
+        {"name": "bad_action", "when": {}, "decision": {"thought": "", "text": "", "experience": "",
+                                                        "actions": [{"type": "fly"}]}},
+        {"name": "extra_field", "when": {}, "decision": dict(DEFAULT_RULES[0]["decision"], mood="ok")},
+    ):
+        try:
+            Rule.from_dict(spec)
+        except ValueError as e:
+            print(f" [Test] 拒绝非法规则: {e}")
+        else:
+            raise AssertionError(f"规则 {spec['name']} 应被拒绝")
+    try:
+        ReflexEngine(mode="maybe")
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("未知 mode 应被拒绝")
+
+def main():
+    test_default_rules()
+    test_shadow_mode()
+    test_invalid_rules()
+    print(" [Test] SUCCESS: 反射层验证通过!")
+
+if __name__ == "__main__":
+    try:
+        main()
+    except AssertionError as e:
+        print(f" [Test] FAILED: {e}")
+        sys.exit(1)
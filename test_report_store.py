@@ -0,0 +1,114 @@
+import asyncio
+import json
+import os
+import sys
+import tempfile
+from MapAnalyzer import SceneRenderer
+from MongoWriter import InMemoryCollection, WriteBehindBuffer
+from ReportStore import ReportStore, CHUNK_FIELD
+from migrate_scene_reports import migrate_collection
+
+TEMPLATE = json.load(open("map_dump.json", encoding="utf-8"))
+
+def make_reports(count: int) -> list:
+    """同一张地图上 NPC 逐帧移动：大部分行相同，只有距离列与坐标变化"""
+    renderer = SceneRenderer()
+    reports = []
+    for i in range(count):
+        player = dict(TEMPLATE["player_status"], current_pos=[100.0 + i * 7, 200.0 + i * 3])
+        reports.append(renderer.render(dict(TEMPLATE, player_status=player)))
+    return reports
+
+async def test_round_trip():
+    chunks, history = InMemoryCollection(), InMemoryCollection()
+    store = ReportStore(chunks)
+    reports = make_reports(5)
+    writer = WriteBehindBuffer(history, batch_size=2, flush_interval=0.01, before_flush=store.flush_pending)
+    for i, report in enumerate(reports):
+        await writer.put({"_id": i, "npc_id": "npc_1", CHUNK_FIELD: store.encode(report)})
+    await writer.close()
+    assert store.snapshot()["pending_chunks"] == 0 and len(history.documents) == 5
+    assert "scene_report" not in history.documents[0]
+
+    # 新的 ReportStore 本地没有块原文，只能从块集合取回
+    reader = ReportStore(chunks)
+    documents = await reader.expand([dict(doc) for doc in history.documents])
+    assert [doc["scene_report"] for doc in documents] == reports, "还原的报告与原文不一致"
+    assert all(CHUNK_FIELD not in doc for doc in documents)
+    assert await reader.load(history.documents[0][CHUNK_FIELD]) == reports[0]
+
+async def test_dedup():
+    chunks = InMemoryCollection()
+    store = ReportStore(chunks)
+    reports = make_reports(5)
+    refs = [store.encode(report) for report in reports]
+    await store.flush_pending()
+    chunk_ids = {ref for report_refs in refs for ref in report_refs if isinstance(ref, str)}
+    # 每个不同的块只存一份；重复块不再写入
+    assert len(chunks.documents) == len(chunk_ids) == store.chunks_new
+    assert store.chunks_seen > store.chunks_new
+    calls = chunks.insert_calls
+    assert store.encode(reports[0]) == refs[0]
+    await store.flush_pending()
+    assert chunks.insert_calls == calls and len(chunks.documents) == len(chunk_ids)
+    snapshot = store.snapshot()
+    print(f" [Test] 报告去重: {snapshot}")
+    assert snapshot["dedup_ratio"] > 1 and snapshot["bytes_saved"] > 0
+
+def test_inline_spill():
+    store = ReportStore(InMemoryCollection())
+    report = make_reports(1)[0]
+    document = {"npc_id": "npc_1", CHUNK_FIELD: store.encode(report)}
+    # 溢写到本地文件时块可能尚未落库：用内存中的原文还原
+    inlined = store.inline(document)
+    assert inlined["scene_report"] == report and CHUNK_FIELD not in inlined
+    assert CHUNK_FIELD in document, "inline 不修改原文档"
+    # 本地没有块原文时保持引用不变
+    assert ReportStore(InMemoryCollection()).inline(document) is document
+
+async def test_spill_writes_full_report():
+    spill_path = os.path.join(tempfile.mkdtemp(), "spill.jsonl")
+    store = ReportStore(InMemoryCollection())
+    report = make_reports(1)[0]
+    writer = WriteBehindBuffer(InMemoryCollection(fail_times=1), overflow_policy="spill", spill_path=spill_path,
+                               before_flush=store.flush_pending, spill_transform=store.inline)
+    await writer.put({"npc_id": "npc_1", CHUNK_FIELD: store.encode(report)})
+    await writer.close()
+    with open(spill_path, encoding="utf-8") as f:
+        spilled = [json.loads(line) for line in f]
+    assert writer.spilled == 1 and spilled[0]["scene_report"] == report
+
+async def test_migration_idempotent():
+    chunks, history = InMemoryCollection(), InMemoryCollection()
+    reports = make_reports(7)
+    await history.insert_many([{"_id": i, "npc_id": "npc_1", "scene_report": r} for i, r in enumerate(reports)])
+
+    # dry-run 只统计，不修改历史文档，也不写块
+    assert await migrate_collection(history, ReportStore(chunks), batch_size=3, dry_run=True) == 7
+    assert not chunks.documents and all("scene_report" in doc for doc in history.documents)
+
+    assert await migrate_collection(history, ReportStore(chunks), batch_size=3) == 7
+    assert all(CHUNK_FIELD in doc and "scene_report" not in doc for doc in history.documents)
+    migrated = [dict(doc) for doc in history.documents]
+    chunk_count = len(chunks.documents)
+    # 再次运行：已迁移的文档不再处理，块集合不变
+    assert await migrate_collection(history, ReportStore(chunks), batch_size=3) == 0
+    assert history.documents == migrated and len(chunks.documents) == chunk_count
+
+    documents = await ReportStore(chunks).expand([dict(doc) for doc in history.documents])
+    assert [doc["scene_report"] for doc in documents] == reports
+
+async def main():
+    await test_round_trip()
+    await test_dedup()
+    test_inline_spill()
+    await test_spill_writes_full_report()
+    await test_migration_idempotent()
+    print(" [Test] SUCCESS: 报告块存储验证通过!")
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except AssertionError as e:
+        print(f" [Test] FAILED: {e}")
+        sys.exit(1)
@@ -0,0 +1,105 @@
+import asyncio
+import sys
+from RequestPipeline import RequestPipeline
+
+class Recorder:
+    """收集 on_result 的回调结果与事件顺序"""
+    def __init__(self):
+        self.results = []
+        self.events = []
+
+    async def on_result(self, result):
+        self.results.append(result)
+
+async def test_latest_wins():
+    recorder = Recorder()
+    pipeline = RequestPipeline(recorder.on_result)
+    release = asyncio.Event()
+
+    async def old():
+        recorder.events.append("old_start")
+        try:
+            await release.wait()
+            return "old"
+        except asyncio.CancelledError:
+            # 被取代后仍需收尾：新请求必须等它彻底退出才能开始
+            await asyncio.sleep(0.02)
+            recorder.events.append("old_exit")
+            raise
+
+    async def new():
+        recorder.events.append("new_start")
+        return "new"
+
+    first = pipeline.submit("npc_1", old)
+    await asyncio.sleep(0.01)
+    second = pipeline.submit("npc_1", new)
+    release.set()
+    await asyncio.gather(first, second, return_exceptions=True)
+    assert first.cancelled()
+    assert recorder.results == ["new"], f"被取代的请求不应回传结果: {recorder.results}"
+    assert recorder.events == ["old_start", "old_exit", "new_start"], recorder.events
+    assert pipeline.superseded == 1 and pipeline.completed == 1 and pipeline.in_flight == 0
+
+async def test_per_npc_order():
+    # 同一 NPC 连续提交且互不取代 (前一个已完成) 时按提交顺序回传；不同 NPC 互不影响
+    recorder = Recorder()
+    pipeline = RequestPipeline(recorder.on_result)
+
+    async def work(name, delay):
+        await asyncio.sleep(delay)
+        return name
+
+    for i in range(3):
+        await pipeline.submit("npc_1", lambda i=i: work(f"npc_1-{i}", 0.005))
+    slow = pipeline.submit("npc_2", lambda: work("npc_2", 0.03))
+    fast = pipeline.submit("npc_3", lambda: work("npc_3", 0.0))
+    await asyncio.gather(slow, fast)
+    assert recorder.results == ["npc_1-0", "npc_1-1", "npc_1-2", "npc_3", "npc_2"], recorder.results
+
+async def test_concurrency_cap():
+    recorder = Recorder()
+    pipeline = RequestPipeline(recorder.on_result, max_in_flight=3)
+    active, peak = 0, 0
+
+    async def work(i):
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.01)
+        active -= 1
+        return i
+
+    tasks = [pipeline.submit(f"npc_{i}", lambda i=i: work(i)) for i in range(10)]
+    await asyncio.gather(*tasks)
+    assert peak == 3, f"在途数量应受 max_in_flight 限制: {peak}"
+    assert sorted(recorder.results) == list(range(10)) and pipeline.completed == 10
+
+async def test_failure_and_close():
+    recorder = Recorder()
+    pipeline = RequestPipeline(recorder.on_result)
+
+    async def broken():
+        raise RuntimeError("后端异常")
+
+    await pipeline.submit("npc_1", broken)
+    assert pipeline.failed == 1 and recorder.results == []
+
+    hang = pipeline.submit("npc_2", lambda: asyncio.sleep(10))
+    await asyncio.sleep(0)
+    await pipeline.close()
+    assert hang.cancelled() and pipeline.in_flight == 0 and recorder.results == []
+
+async def main():
+    await test_latest_wins()
+    await test_per_npc_order()
+    await test_concurrency_cap()
+    await test_failure_and_close()
+    print(" [Test] SUCCESS: 请求管线验证通过!")
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except AssertionError as e:
+        print(f" [Test] FAILED: {e}")
+        sys.exit(1)
@@ -0,0 +1,89 @@
+import json
+import sys
+from ResponseParser import extract_json, StreamingDecisionParser
+
+DECISION = {
+    "thought": "口渴了，先去 \"净水点\" {取水}",
+    "text": "路径 C:\\water\\",
+    "experience": "",
+    "actions": [
+        {"type": "move", "pos": [544, 136]},
+        {"type": "interact"},
+        {"type": "use", "item_name": "纯净水"},
+    ],
+}
+OUTPUT = "<think>缺水，{先} 去取水</think>\n```json\n" + json.dumps(DECISION, ensure_ascii=False) + "\n```"
+
+def feed_chunks(parser: StreamingDecisionParser, text: str, size: int) -> list:
+    events = []
+    for i in range(0, len(text), size):
+        events.extend(parser.feed(text[i:i + size]))
+    return events
+
+def test_every_split():
+    # 任意分块大小 (包括把 <think> 标签、转义引号切开) 结果都与整段解析一致
+    for size in (1, 2, 3, 5, 7, 16, len(OUTPUT)):
+        parser = StreamingDecisionParser()
+        events = feed_chunks(parser, OUTPUT, size)
+        assert parser.done and parser.decision == DECISION, f"size={size}"
+        assert parser.thinking == "缺水，{先} 去取水", f"size={size}: {parser.thinking!r}"
+        assert events == [("action", a) for a in DECISION["actions"]] + [("decision", DECISION)], f"size={size}"
+
+def test_think_tag_split():
+    parser = StreamingDecisionParser()
+    assert parser.feed("<thi") == [] and parser.feed("nk>{\"x\": 1}</th") == []
+    assert not parser.done, "思维链中的花括号不能被当作决策"
+    events = parser.feed("ink>{\"actions\": []}")
+    assert events == [("decision", {"actions": []})] and parser.thinking == '{"x": 1}'
+
+def test_actions_one_at_a_time():
+    parser = StreamingDecisionParser()
+    text = json.dumps(DECISION, ensure_ascii=False)
+    first_end = text.index("136]}") + 5  # 第一个动作闭合处
+    assert parser.feed(text[:first_end - 1]) == []
+    assert parser.feed(text[first_end - 1:first_end]) == [("action", DECISION["actions"][0])]
+    assert parser.actions == DECISION["actions"][:1] and not parser.done
+
+def test_escaped_strings():
+    # 字符串中的引号、花括号与方括号不影响深度
+    decision = {"thought": "他说 \"}]\" 然后 {走了}", "text": "\\", "actions": [{"type": "use", "item_name": "a\"}b"}]}
+    parser = StreamingDecisionParser()
+    events = feed_chunks(parser, json.dumps(decision, ensure_ascii=False), 1)
+    assert events == [("action", decision["actions"][0]), ("decision", decision)], events
+
+def test_early_stop():
+    parser = StreamingDecisionParser()
+    events = parser.feed(json.dumps({"actions": [{"type": "interact"}]}) + "\n多余的解释 {\"actions\": []}")
+    assert parser.done and events[-1] == ("decision", {"actions": [{"type": "interact"}]})
+    assert parser.feed("更多输出") == [], "完成后不再产出事件"
+
+def test_trailing_comma():
+    parser = StreamingDecisionParser()
+    events = parser.feed('{"actions": [{"type": "attack", "sum": 2,},],}')
+    assert events == [("action", {"type": "attack", "sum": 2}), ("decision", {"actions": [{"type": "attack", "sum": 2}]})]
+
+def test_extract_json():
+    assert extract_json(OUTPUT) == DECISION
+    assert extract_json('前缀 {"actions": [{"type": "interact"},],} 后缀') == {"actions": [{"type": "interact"}]}
+    # 格式错误或没有 JSON 时返回 None
+    assert extract_json("") is None
+    assert extract_json("<think>{\"a\": 1}</think>没有决策") is None
+    assert extract_json('{"actions": [') is None
+    assert extract_json('{"actions": [{"type": }]}') is None
+
+def main():
+    test_every_split()
+    test_think_tag_split()
+    test_actions_one_at_a_time()
+    test_escaped_strings()
+    test_early_stop()
+    test_trailing_comma()
+    test_extract_json()
+    print(" [Test] SUCCESS: 响应解析验证通过!")
+
+if __name__ == "__main__":
+    try:
+        main()
+    except AssertionError as e:
+        print(f" [Test] FAILED: {e}")
+        sys.exit(1)
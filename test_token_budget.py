@@ -0,0 +1,90 @@
+import ast
+import json
+import sys
+from MapAnalyzer import SceneRenderer, LAYOUTS
+from TokenBudget import estimate_tokens
+from bench_map_analyzer import build_world
+
+TEMPLATE = json.load(open("map_dump.json", encoding="utf-8"))
+RECENT_HISTORY = 5
+
+def make_frame(entity_count: int = 40) -> dict:
+    world = build_world(TEMPLATE, entity_count)
+    world["player_status"] = dict(
+        world["player_status"], hp=80, satiety=30, hydration=20,
+        chat_history=[f"第{i}轮：我去看看水井和胡萝卜地" for i in range(30)],
+        experiences=[f"经验{i}：口渴时先喝水" for i in range(10)],
+    )
+    return world
+
+def entity_rows(report: str) -> list:
+    """legacy 布局中目标清单的数据行 (去掉表头两行)"""
+    return [line for line in report.splitlines() if line.startswith("| ")][2:]
+
+def kept_items(report: str, label: str) -> list:
+    line = next(line for line in report.splitlines() if line.startswith(f"- **{label}**: "))
+    return ast.literal_eval(line.split(": ", 1)[1].split(" (另有")[0])
+
+def test_estimate_tokens():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("abcd") == 1 and estimate_tokens("abcde") == 2
+    assert estimate_tokens("生命值") == 3 and estimate_tokens("HP 生命值") == 4
+
+def test_fits_budget():
+    frame = make_frame()
+    renderer = SceneRenderer()
+    full = renderer.render(frame)
+    # 预算充足时不做任何截断
+    assert renderer.render_budgeted(frame, 10000) == (full, estimate_tokens(full))
+    for layout in LAYOUTS:
+        for budget in (2000, 1500, 1000, 600):
+            report, tokens = renderer.render_budgeted(frame, budget, layout=layout)
+            assert tokens == estimate_tokens(report) and tokens <= budget, (layout, budget, tokens)
+            # 核心状态始终保留
+            assert "**生命值 (HP)**: 80" in report, (layout, budget)
+
+def test_priority_order():
+    frame = make_frame()
+    renderer = SceneRenderer()
+    full_rows = entity_rows(renderer.render(frame))
+    chat = frame["player_status"]["chat_history"]
+    previous_rows = len(full_rows)
+    for budget in (2500, 2000, 1500, 1000, 600):
+        report, _ = renderer.render_budgeted(frame, budget, recent_history=RECENT_HISTORY)
+        rows = entity_rows(report)
+        # 实体由近到远保留，预算越小保留越少
+        assert rows == full_rows[:len(rows)] and len(rows) <= previous_rows, budget
+        previous_rows = len(rows)
+        # 历史从最新开始保留，保留的是连续的最新记录
+        kept = kept_items(report, "记录")
+        assert kept == chat[len(chat) - len(kept):], (budget, kept)
+        if len(rows) < len(full_rows):
+            # 实体优先于历史：有实体被省略时，较早历史 (recent_history 之外) 不会被保留
+            assert f"另有 {len(full_rows) - len(rows)} 个较远目标未列出" in report
+            assert len(kept) <= RECENT_HISTORY and len(kept_items(report, "经验")) <= RECENT_HISTORY, budget
+            assert f"另有 {len(chat) - len(kept)} 条更早的记录已省略" in report
+    assert previous_rows < len(full_rows), "最小预算下应有实体被省略"
+
+def test_memories_by_relevance():
+    # 相关记忆代替经验时按相关度降序保留，丢弃的是相关度低的
+    frame = make_frame(10)
+    frame["player_status"]["chat_history"] = []
+    memories = [f"相关记忆{i}：水井在东边，口渴时优先去那里打水" for i in range(20)]
+    report, tokens = SceneRenderer().render_budgeted(frame, 800, memories=memories)
+    kept = kept_items(report, "相关记忆")
+    assert 0 < len(kept) < len(memories) and kept == memories[:len(kept)], kept
+    assert tokens <= 800 and "**经验**" not in report
+
+def main():
+    test_estimate_tokens()
+    test_fits_budget()
+    test_priority_order()
+    test_memories_by_relevance()
+    print(" [Test] SUCCESS: token 预算验证通过!")
+
+if __name__ == "__main__":
+    try:
+        main()
+    except AssertionError as e:
+        print(f" [Test] FAILED: {e}")
+        sys.exit(1)
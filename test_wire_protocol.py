@@ -0,0 +1,96 @@
+import copy
+import json
+import sys
+import WireProtocol
+from WireProtocol import DeltaDecoder, DeltaEncoder, ResyncRequired, ack_for, pack, unpack
+
+TEMPLATE = json.load(open("map_dump.json", encoding="utf-8"))
+
+def roundtrip(encoder: DeltaEncoder, decoder: DeltaDecoder, world: dict, ack: bool = True) -> tuple:
+    data = encoder.encode(world)
+    message = unpack(data)
+    decoded = decoder.decode(message)
+    if ack:
+        encoder.on_ack(ack_for(message)["seq"])
+    return message, decoded, len(data)
+
+def test_delta_roundtrip():
+    encoder, decoder = DeltaEncoder("npc_1"), DeltaDecoder()
+    world = copy.deepcopy(TEMPLATE)
+    world["player_status"]["chat_history"] = ["你好"]
+    message, decoded, full_size = roundtrip(encoder, decoder, world)
+    assert message["t"] == "full" and decoded == world
+
+    # 移动、聊天追加、一个实体变化、一个实体删除、一个新实体
+    world = copy.deepcopy(world)
+    world["player_status"]["current_pos"] = [610.0, 300.0]
+    world["player_status"]["chat_history"].append("我去打水")
+    world["timestamp"] += 1
+    world["entities"][0]["describe"] = "种子已种下"
+    removed = world["entities"].pop(1)
+    world["entities"].append({"id": "new_1", "name": "chest", "center": [10.0, 10.0], "rect": [0, 0, 20, 20]})
+    message, decoded, delta_size = roundtrip(encoder, decoder, world)
+    print(f" [Test] 差量: {full_size} -> {delta_size} 字节, 字段 {sorted(message)}")
+    assert message["t"] == "delta" and message["base"] == 1
+    assert message["chat_append"] == ["我去打水"] and "chat_history" not in message["player"]
+    assert set(message["upsert"]) == {world["entities"][0]["id"], "new_1"}
+    assert message["remove"] == [removed["id"]]
+    assert decoded == world, "物化结果应与客户端的世界一致"
+
+    # 没有变化时只有必需字段
+    message, decoded, _ = roundtrip(encoder, decoder, copy.deepcopy(world))
+    assert set(message) == {"t", "npc", "seq", "base"} and decoded == world
+
+def test_copy_on_write():
+    encoder, decoder = DeltaEncoder("npc_1"), DeltaDecoder()
+    world = copy.deepcopy(TEMPLATE)
+    _, first, _ = roundtrip(encoder, decoder, world)
+    snapshot = copy.deepcopy(first)
+    world = copy.deepcopy(world)
+    world["entities"][0]["center"] = [0.0, 0.0]
+    world["player_status"]["hp"] = 1
+    roundtrip(encoder, decoder, world)
+    assert first == snapshot, "后续帧不应修改已交给决策流程的世界"
+
+def test_unacked_and_resync():
+    encoder, decoder = DeltaEncoder("npc_1"), DeltaDecoder(history=2)
+    world = copy.deepcopy(TEMPLATE)
+    roundtrip(encoder, decoder, world)
+    # 确认滞后：连续两帧都相对 seq 1 编码
+    for hp in (90, 80):
+        world = dict(world, player_status=dict(world["player_status"], hp=hp))
+        message, decoded, _ = roundtrip(encoder, decoder, world, ack=False)
+        assert message["base"] == 1 and decoded["player_status"]["hp"] == hp
+    # seq 1 已被挤出 gateway 的历史 -> 重新同步
+    world = dict(world, player_status=dict(world["player_status"], hp=70))
+    message = unpack(encoder.encode(world))
+    try:
+        decoder.decode(message)
+    except ResyncRequired as e:
+        assert e.npc == "npc_1" and e.seq == 4
+        encoder.on_resync()
+    else:
+        raise AssertionError("缺少 base 时应要求重新同步")
+    message, decoded, _ = roundtrip(encoder, decoder, world)
+    assert message["t"] == "full" and decoded["player_status"]["hp"] == 70
+    assert decoder.snapshot() == {"streams": 1, "full_frames": 2, "delta_frames": 2, "resyncs": 1}
+
+    # 非世界帧原样透传，不需要确认
+    message = unpack(pack({"type": "invalidate_cache", "npc_id": "npc_1"}))
+    assert decoder.decode(message) == message and ack_for(message) is None
+
+def main():
+    if not WireProtocol.available():
+        print(" [Test] SKIPPED: 未安装 msgpack")
+        return
+    test_delta_roundtrip()
+    test_copy_on_write()
+    test_unacked_and_resync()
+    print(" [Test] SUCCESS: 二进制差量协议验证通过!")
+
+if __name__ == "__main__":
+    try:
+        main()
+    except AssertionError as e:
+        print(f" [Test] FAILED: {e}")
+        sys.exit(1)
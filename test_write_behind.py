@@ -0,0 +1,64 @@
+import asyncio
+import os
+import sys
+import tempfile
+from datetime import datetime
+from MongoWriter import WriteBehindBuffer, InMemoryCollection
+
+def make_doc(i):
+    return {"npc_id": f"npc_{i % 5:03d}", "timestamp": datetime.now(), "scene_report": "...", "ai_content": {"i": i}}
+
+async def test_batched_flush():
+    collection = InMemoryCollection(insert_latency=0.01)
+    writer = WriteBehindBuffer(collection, batch_size=50, flush_interval=0.05)
+    for i in range(500):
+        await writer.put(make_doc(i))
+    await writer.close()
+    print(f" [Test] 批量写入: {writer.snapshot()}, insert_many 调用 {collection.insert_calls} 次")
+    assert len(collection.documents) == 500, "关闭时未写完全部文档"
+    assert collection.insert_calls < 500
+
+async def test_overflow_policies():
+    # drop_oldest：写库很慢，队列满后丢弃最旧文档
+    collection = InMemoryCollection(insert_latency=0.2)
+    writer = WriteBehindBuffer(collection, max_queue=10, batch_size=5, overflow_policy="drop_oldest")
+    for i in range(100):
+        await writer.put(make_doc(i))
+    await writer.close()
+    print(f" [Test] drop_oldest: {writer.snapshot()}")
+    assert writer.dropped > 0
+    assert writer.written + writer.dropped == 100
+
+    # spill：溢出与写入失败的文档落到本地文件
+    spill_path = os.path.join(tempfile.mkdtemp(), "spill.jsonl")
+    collection = InMemoryCollection(insert_latency=0.2, fail_times=1)
+    writer = WriteBehindBuffer(collection, max_queue=10, batch_size=5, overflow_policy="spill", spill_path=spill_path)
+    for i in range(100):
+        await writer.put(make_doc(i))
+    await writer.close()
+    with open(spill_path, encoding="utf-8") as f:
+        spilled_lines = sum(1 for _ in f)
+    print(f" [Test] spill: {writer.snapshot()}, 本地文件 {spilled_lines} 行")
+    assert spilled_lines == writer.spilled
+    assert writer.written + writer.spilled == 100
+
+    # block：队列满时调用方等待，不丢任何文档
+    collection = InMemoryCollection(insert_latency=0.01)
+    writer = WriteBehindBuffer(collection, max_queue=10, batch_size=5, overflow_policy="block")
+    for i in range(100):
+        await writer.put(make_doc(i))
+    await writer.close()
+    print(f" [Test] block: {writer.snapshot()}")
+    assert len(collection.documents) == 100
+
+async def main():
+    await test_batched_flush()
+    await test_overflow_policies()
+    print(" [Test] SUCCESS: 写后缓冲验证通过!")
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except AssertionError as e:
+        print(f" [Test] FAILED: {e}")
+        sys.exit(1)